@@ -2,21 +2,22 @@
 AI-Powered Sales Predictor for BuildSmartOS
 Uses machine learning to forecast sales and optimize inventory
 """
-import sqlite3
+from db import get_connection, transaction, days_ago_key, date_key
+from product_catalog import get_product_catalog
+from forecast_engine import ForecastEngine, DemandMatrix, HISTORY_DAYS, to_date
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
-import pickle
+from datetime import date, timedelta
 import os
 
+FORECAST_HORIZON = 28  # Days ahead kept in the forecasts table
+
 class AIPredictor:
-    def __init__(self, db_name="buildsmart_hardware.db"):
+    def __init__(self, db_name="buildsmart_hardware.db", group_by='category'):
         self.db_name = db_name
-        self.model = None
-        self.scaler = StandardScaler()
-        self.model_path = "models/sales_predictor.pkl"
+        self.group_by = group_by
+        self.model = None  # ForecastEngine once trained or loaded
+        self.model_path = "models/sales_predictor.npz"
         
         # Create models directory
         os.makedirs("models", exist_ok=True)
@@ -27,25 +28,24 @@ class AIPredictor:
     def get_sales_data(self, days=90):
         """Get historical sales data"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             
             query = """
                 SELECT 
-                    DATE(t.date_time) as date,
+                    c.date as date,
                     p.id as product_id,
                     p.name as product_name,
                     p.category,
-                    SUM(si.quantity_sold) as quantity,
-                    SUM(si.sub_total) as revenue
-                FROM transactions t
-                JOIN sales_items si ON t.id = si.transaction_id
-                JOIN products p ON si.product_id = p.id
-                WHERE DATE(t.date_time) >= DATE('now', '-' || ? || ' days')
-                GROUP BY DATE(t.date_time), p.id
-                ORDER BY date DESC
+                    s.quantity as quantity,
+                    s.revenue as revenue
+                FROM sales_daily_product s
+                JOIN calendar c ON c.date_key = s.date_key
+                JOIN products p ON s.product_id = p.id
+                WHERE s.date_key >= ?
+                ORDER BY s.date_key DESC
             """
             
-            df = pd.read_sql_query(query, conn, params=(days,))
+            df = pd.read_sql_query(query, conn, params=(days_ago_key(days),))
             conn.close()
             
             return df
@@ -54,136 +54,181 @@ class AIPredictor:
             print(f"Error fetching sales data: {e}")
             return pd.DataFrame()
     
-    def prepare_features(self, df):
-        """Prepare features for ML model"""
-        if df.empty:
-            return None, None
-        
-        # Convert date to datetime
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Extract features
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['day_of_month'] = df['date'].dt.day
-        df['month'] = df['date'].dt.month
-        df['week_of_year'] = df['date'].dt.isocalendar().week
-        
-        # Features and target
-        feature_cols = ['day_of_week', 'day_of_month', 'month', 'week_of_year', 'product_id']
-        X = df[feature_cols].values
-        y = df['quantity'].values
-        
-        return X, y
+    def load_demand(self, start, end, product_ids=None):
+        """Dense product x day demand matrix for start..end (see forecast_engine)"""
+        conn = get_connection(self.db_name)
+        try:
+            return DemandMatrix.load(conn.cursor(), start, end, product_ids)
+        finally:
+            conn.close()
     
-    def train_model(self, days=90):
-        """Train the sales prediction model"""
+    def latest_transaction_id(self):
+        """Highest transaction id so far (the training high-water mark)"""
+        conn = get_connection(self.db_name)
         try:
-            df = self.get_sales_data(days)
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+    
+    def train_model(self, days=90, workers=None):
+        """Train per-category demand models on the last `days` complete days"""
+        try:
+            # Read the mark first: anything committed later is picked up by update_model
+            high_water = self.latest_transaction_id()
+            end = date.today() - timedelta(days=1)  # Today is still trading
+            matrix = self.load_demand(end - timedelta(days=days - 1), end)
             
-            if df.empty or len(df) < 10:
+            if days <= HISTORY_DAYS or np.count_nonzero(matrix.quantities) < 10:
                 return False, "Insufficient data for training (need at least 10 sales records)"
             
-            X, y = self.prepare_features(df)
+            engine = ForecastEngine(self.group_by)
+            if self.model is not None:
+                engine.version = self.model.version  # Versions keep increasing across retrains
+            examples = engine.fit(matrix, high_water, workers=workers)
+            self.model = engine
+            
+            # Save model
+            self.save_model()
+            
+            return True, f"Model trained successfully ({examples:,} examples, {len(engine.weights)} {self.group_by} models)"
             
-            if X is None:
-                return False, "Feature preparation failed"
+        except Exception as e:
+            return False, f"Training failed: {e}"
+    
+    def update_model(self):
+        """
+        Fold sales since the last training into the model (e.g. nightly).
+        
+        Only complete days after the model's last training day are read, so
+        the cost is independent of how much history the model has seen.
+        Transactions back-dated into already-trained days (found via the
+        transaction-id high-water mark) trigger a full retrain instead.
+        """
+        try:
+            if self.model is None or self.model.trained_through is None:
+                return self.train_model()
             
-            # Scale features
-            X_scaled = self.scaler.fit_transform(X)
+            engine = self.model
+            end = date.today() - timedelta(days=1)
             
-            # Train model
-            self.model = LinearRegression()
-            self.model.fit(X_scaled, y)
+            conn = get_connection(self.db_name)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT MAX(id), MIN(date_key) FROM transactions WHERE id > ?",
+                    (engine.high_water,)
+                )
+                latest_id, earliest_key = cursor.fetchone()
+                
+                backdated = earliest_key is not None and to_date(earliest_key) <= engine.trained_through
+                matrix = None
+                if not backdated and engine.trained_through < end:
+                    start = engine.trained_through + timedelta(days=1 - HISTORY_DAYS)
+                    matrix = DemandMatrix.load(cursor, start, end)
+            finally:
+                conn.close()
             
-            # Calculate accuracy
-            score = self.model.score(X_scaled, y)
+            if backdated:
+                return self.train_model()
+            if matrix is None:
+                return True, "Model is up to date"
             
-            # Save model
+            examples = engine.update(matrix, latest_id or engine.high_water)
             self.save_model()
             
-            return True, f"Model trained successfully (R² score: {score:.2f})"
+            return True, f"Model updated with {matrix.days - HISTORY_DAYS} new day(s) ({examples:,} examples)"
             
         except Exception as e:
-            return False, f"Training failed: {e}"
+            return False, f"Update failed: {e}"
     
-    def predict_sales(self, product_id, days_ahead=7):
-        """Predict future sales for a product"""
+    def ensure_model(self):
+        """Train the model if none is loaded; returns (success, message)"""
+        if self.model is not None:
+            return True, "Model loaded"
+        return self.train_model()
+    
+    def predict_batch(self, product_ids, days_ahead=7):
+        """
+        Predict daily sales for many products in one vectorized forecast.
+        
+        Returns:
+            (True, DataFrame indexed by product_id with one column per date of
+            predicted quantity, clipped at 0) or (False, error message)
+        """
         try:
-            if self.model is None:
-                # Try to train model
-                success, msg = self.train_model()
-                if not success:
-                    return False, msg
+            success, msg = self.ensure_model()
+            if not success:
+                return False, msg
             
-            predictions = []
-            today = datetime.now()
+            product_ids = [int(p) for p in product_ids]
+            today = date.today()
+            dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(1, days_ahead + 1)]
             
-            for i in range(1, days_ahead + 1):
-                future_date = today + timedelta(days=i)
-                
-                features = np.array([[
-                    future_date.weekday(),
-                    future_date.day,
-                    future_date.month,
-                    future_date.isocalendar()[1],
-                    product_id
-                ]])
-                
-                features_scaled = self.scaler.transform(features)
-                predicted_qty = self.model.predict(features_scaled)[0]
-                
-                predictions.append({
-                    'date': future_date.strftime('%Y-%m-%d'),
-                    'predicted_quantity': max(0, round(predicted_qty, 2))
-                })
+            # Recent complete days feed the lags; today and the following days are forecast
+            history = self.load_demand(today - timedelta(days=HISTORY_DAYS), today - timedelta(days=1),
+                                       product_ids)
+            predicted = np.empty((0, days_ahead))
+            if len(history.product_ids):
+                predicted = self.model.forecast(history, days_ahead + 1)[:, 1:]
             
-            return True, predictions
+            forecast = pd.DataFrame(np.round(predicted, 2), index=pd.Index(history.product_ids, name='product_id'),
+                                    columns=dates)
+            forecast = forecast.reindex(pd.Index(product_ids, name='product_id'), fill_value=0.0)
+            return True, forecast
             
         except Exception as e:
             return False, f"Prediction failed: {e}"
     
+    def predict_sales(self, product_id, days_ahead=7):
+        """Predict future sales for a product"""
+        success, forecast = self.predict_batch([product_id], days_ahead)
+        if not success:
+            return False, forecast
+        
+        return True, [
+            {'date': date, 'predicted_quantity': float(quantity)}
+            for date, quantity in forecast.iloc[0].items()
+        ]
+    
     def recommend_reorder(self, reorder_days=14):
         """Recommend products that need reordering"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            # All products with current stock
+            stock = pd.DataFrame(
+                [
+                    (r.id, r.name, r.stock_quantity, r.reorder_level or 0)
+                    for r in get_product_catalog().all_products() if r.stock_quantity > 0
+                ],
+                columns=['product_id', 'product_name', 'current_stock', 'reorder_level']
+            )
+            if stock.empty:
+                return True, []
             
-            # Get all products with current stock
-            cursor.execute("""
-                SELECT id, name, stock_quantity, reorder_level
-                FROM products
-                WHERE stock_quantity > 0
-            """)
+            # One forecast for the whole catalog, summed over the reorder window
+            success, forecast = self.predict_batch(stock['product_id'], reorder_days)
+            if not success:
+                return False, forecast
+            stock['predicted_demand'] = forecast.to_numpy().sum(axis=1).round(2)
             
-            products = cursor.fetchall()
-            conn.close()
+            # Stock will run out within the window, or is already at the reorder level
+            needed = stock[
+                (stock['current_stock'] < stock['predicted_demand'])
+                | (stock['current_stock'] <= stock['reorder_level'])
+            ].copy()
+            needed['recommended_order'] = np.maximum(
+                needed['reorder_level'],
+                (needed['predicted_demand'] - needed['current_stock'] + needed['reorder_level']).round(2)
+            )
+            needed['urgency'] = np.where(needed['current_stock'] < needed['reorder_level'], 'HIGH', 'MEDIUM')
             
-            recommendations = []
+            # HIGH first, then by recommended quantity
+            needed = needed.sort_values(['urgency', 'recommended_order'], ascending=[True, True], kind='stable')
             
-            for product in products:
-                p_id, name, current_stock, reorder_level = product
-                
-                # Predict sales for next reorder_days
-                success, predictions = self.predict_sales(p_id, reorder_days)
-                
-                if success:
-                    total_predicted = sum(p['predicted_quantity'] for p in predictions)
-                    
-                    # Check if stock will run low
-                    if current_stock < total_predicted or current_stock <= reorder_level:
-                        recommendations.append({
-                            'product_id': p_id,
-                            'product_name': name,
-                            'current_stock': current_stock,
-                            'predicted_demand': round(total_predicted, 2),
-                            'recommended_order': max(reorder_level, round(total_predicted - current_stock + reorder_level, 2)),
-                            'urgency': 'HIGH' if current_stock < reorder_level else 'MEDIUM'
-                        })
-            
-            # Sort by urgency
-            recommendations.sort(key=lambda x: (x['urgency'] == 'HIGH', -x['recommended_order']), reverse=True)
-            
-            return True, recommendations
+            columns = ['product_id', 'product_name', 'current_stock', 'predicted_demand',
+                       'recommended_order', 'urgency']
+            return True, needed[columns].to_dict('records')
             
         except Exception as e:
             return False, f"Recommendation failed: {e}"
@@ -234,15 +279,63 @@ class AIPredictor:
         except Exception as e:
             return False, f"Trend analysis failed: {e}"
     
+    def forecasts_stale(self):
+        """True if the forecasts table is empty or doesn't start at tomorrow"""
+        conn = get_connection(self.db_name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(date_key) FROM forecasts")
+            first_key = cursor.fetchone()[0]
+        finally:
+            conn.close()
+        return first_key is None or first_key != date_key(date.today() + timedelta(days=1))
+    
+    def refresh_forecasts(self, days_ahead=FORECAST_HORIZON):
+        """
+        Bring the model up to date and replace the stored forecasts.
+        
+        Every product gets one row per day for the next days_ahead days,
+        stamped with the model version.
+        """
+        try:
+            success, msg = self.update_model()
+            if not success:
+                return False, msg
+            
+            today = date.today()
+            history = self.load_demand(today - timedelta(days=HISTORY_DAYS), today - timedelta(days=1))
+            # Today is forecast too (its sales are incomplete) but not stored
+            predicted = np.round(self.model.forecast(history, days_ahead + 1)[:, 1:], 2)
+            
+            keys = [date_key(today + timedelta(days=i)) for i in range(1, days_ahead + 1)]
+            version = self.model.version
+            rows = [
+                (product_id, key, quantity, version)
+                for product_id, quantities in zip(history.product_ids.tolist(), predicted.tolist())
+                for key, quantity in zip(keys, quantities)
+            ]
+            
+            with transaction(self.db_name) as conn:
+                conn.execute("DELETE FROM forecasts")
+                conn.executemany("""
+                    INSERT INTO forecasts (product_id, date_key, predicted_qty, model_version)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+            
+            return True, f"Stored {len(rows):,} forecasts for {len(history.product_ids):,} products (model v{version})"
+            
+        except Exception as e:
+            return False, f"Forecast refresh failed: {e}"
+    
+    @property
+    def model_version(self):
+        """Version of the current model (0 if none)"""
+        return self.model.version if self.model is not None else 0
+    
     def save_model(self):
         """Save trained model to disk"""
         try:
-            data = {
-                'model': self.model,
-                'scaler': self.scaler
-            }
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(data, f)
+            self.model.save(self.model_path)
         except Exception as e:
             print(f"Model save failed: {e}")
     
@@ -250,10 +343,7 @@ class AIPredictor:
         """Load trained model from disk"""
         try:
             if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.model = data['model']
-                    self.scaler = data['scaler']
+                self.model = ForecastEngine.load(self.model_path)
                 return True
         except Exception as e:
             print(f"Model load failed: {e}")
@@ -268,3 +358,31 @@ def get_ai_predictor():
     if _ai_predictor is None:
         _ai_predictor = AIPredictor()
     return _ai_predictor
+
+
+def run_forecast_job(force=False):
+    """
+    Nightly forecast job: update the model and refresh stored forecasts.
+    
+    Does nothing (cheaply) when today's forecasts are already stored, so it
+    can be run at every startup or from a scheduler.
+    """
+    predictor = get_ai_predictor()
+    if not force and not predictor.forecasts_stale():
+        return True, "Forecasts are current"
+    return predictor.refresh_forecasts()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Refresh BuildSmartOS demand forecasts")
+    parser.add_argument("--retrain", action="store_true", help="Full retrain instead of an incremental update")
+    parser.add_argument("--force", action="store_true", help="Refresh even if today's forecasts exist")
+    args = parser.parse_args()
+    
+    if args.retrain:
+        print(get_ai_predictor().train_model()[1])
+    success, message = run_forecast_job(force=args.force or args.retrain)
+    print(("✅ " if success else "❌ ") + message)
+    raise SystemExit(0 if success else 1)
@@ -2,7 +2,7 @@
 Sales Analytics Dashboard for BuildSmartOS
 Comprehensive business intelligence and reporting
 """
-import sqlite3
+from db import get_connection, today_key, days_ago_key, month_key_range
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')  # Use non-GUI backend
@@ -19,44 +19,47 @@ class AnalyticsDashboard:
     def get_sales_summary(self, days=30):
         """Get sales summary for specified period"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             
-            # Today's sales
+            # Date filters use the indexed integer date_key (range scans)
+            period_start = days_ago_key(days)
+            month_start, month_end = month_key_range()
+            
+            # Today's sales (rollup tables are kept current by triggers)
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0)
-                FROM transactions
-                WHERE DATE(date_time) = DATE('now')
-            """)
+                SELECT COALESCE(SUM(gross_sales), 0)
+                FROM sales_daily
+                WHERE date_key = ?
+            """, (today_key(),))
             today_sales = cursor.fetchone()[0]
             
             # This month's sales
             cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0)
-                FROM transactions
-                WHERE strftime('%Y-%m', date_time) = strftime('%Y-%m', 'now')
-            """)
+                SELECT COALESCE(SUM(gross_sales), 0)
+                FROM sales_daily
+                WHERE date_key BETWEEN ? AND ?
+            """, (month_start, month_end))
             month_sales = cursor.fetchone()[0]
             
             # Period sales
             cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0), COUNT(*)
-                FROM transactions
-                WHERE DATE(date_time) >= DATE('now', '-' || ? || ' days')
-            """, (days,))
+                SELECT COALESCE(SUM(gross_sales), 0), COALESCE(SUM(transaction_count), 0)
+                FROM sales_daily
+                WHERE date_key >= ?
+            """, (period_start,))
             period_sales, transaction_count = cursor.fetchone()
             
             # Top selling products
             cursor.execute("""
-                SELECT p.name, SUM(si.quantity_sold) as total_qty, SUM(si.sub_total) as revenue
-                FROM sales_items si
-                JOIN products p ON si.product_id = p.id
-                JOIN transactions t ON si.transaction_id = t.id
-                WHERE DATE(t.date_time) >= DATE('now', '-' || ? || ' days')
-                GROUP BY p.id
+                SELECT p.name, SUM(s.quantity) as total_qty, SUM(s.revenue) as revenue
+                FROM sales_daily_product s
+                JOIN products p ON s.product_id = p.id
+                WHERE s.date_key >= ?
+                GROUP BY s.product_id
                 ORDER BY total_qty DESC
                 LIMIT 10
-            """, (days,))
+            """, (period_start,))
             top_products = cursor.fetchall()
             
             # Low stock items
@@ -87,17 +90,18 @@ class AnalyticsDashboard:
     def generate_sales_chart(self, days=30):
         """Generate sales chart"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             
             query = """
-                SELECT DATE(date_time) as date, SUM(total_amount) as daily_sales
-                FROM transactions
-                WHERE DATE(date_time) >= DATE('now', '-' || ? || ' days')
-                GROUP BY DATE(date_time)
-                ORDER BY date
+                SELECT c.date as date, s.gross_sales as daily_sales
+                FROM sales_daily s
+                JOIN calendar c ON c.date_key = s.date_key
+                WHERE s.date_key >= ?
+                  AND s.transaction_count > 0
+                ORDER BY s.date_key
             """
             
-            df = pd.read_sql_query(query, conn, params=(days,))
+            df = pd.read_sql_query(query, conn, params=(days_ago_key(days),))
             conn.close()
             
             if df.empty:
@@ -127,20 +131,18 @@ class AnalyticsDashboard:
     def generate_category_chart(self, days=30):
         """Generate sales by category pie chart"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             
             query = """
-                SELECT p.category, SUM(si.sub_total) as category_sales
-                FROM sales_items si
-                JOIN products p ON si.product_id = p.id
-                JOIN transactions t ON si.transaction_id = t.id
-                WHERE DATE(t.date_time) >= DATE('now', '-' || ? || ' days')
-                  AND p.category IS NOT NULL
-                GROUP BY p.category
+                SELECT category, SUM(revenue) as category_sales
+                FROM sales_daily_category
+                WHERE date_key >= ?
+                  AND category != ''
+                GROUP BY category
                 ORDER BY category_sales DESC
             """
             
-            df = pd.read_sql_query(query, conn, params=(days,))
+            df = pd.read_sql_query(query, conn, params=(days_ago_key(days),))
             conn.close()
             
             if df.empty:
@@ -167,7 +169,7 @@ class AnalyticsDashboard:
     def get_profit_analysis(self, days=30):
         """Calculate profit margins"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             cursor = conn.cursor()
             
             # Get products with profit margins
@@ -182,16 +184,18 @@ class AnalyticsDashboard:
                             ((p.price_per_unit - p.cost_price) / p.cost_price * 100)
                         ELSE 0
                     END as profit_margin_percent,
-                    COALESCE(SUM(si.quantity_sold), 0) as units_sold,
-                    COALESCE(SUM(si.sub_total), 0) as revenue
+                    COALESCE(s.units_sold, 0) as units_sold,
+                    COALESCE(s.revenue, 0) as revenue
                 FROM products p
-                LEFT JOIN sales_items si ON p.id = si.product_id
-                LEFT JOIN transactions t ON si.transaction_id = t.id 
-                    AND DATE(t.date_time) >= DATE('now', '-' || ? || ' days')
+                LEFT JOIN (
+                    SELECT product_id, SUM(quantity) as units_sold, SUM(revenue) as revenue
+                    FROM sales_daily_product
+                    WHERE date_key >= ?
+                    GROUP BY product_id
+                ) s ON s.product_id = p.id
                 WHERE p.cost_price IS NOT NULL AND p.cost_price > 0
-                GROUP BY p.id
                 ORDER BY profit_margin_percent DESC
-            """, (days,))
+            """, (days_ago_key(days),))
             
             products = cursor.fetchall()
             conn.close()
@@ -223,20 +227,20 @@ class AnalyticsDashboard:
     def get_hourly_sales_pattern(self):
         """Analyze sales patterns by hour"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             
             query = """
                 SELECT 
-                    CAST(strftime('%H', date_time) AS INTEGER) as hour,
-                    COUNT(*) as transaction_count,
-                    SUM(total_amount) as total_sales
-                FROM transactions
-                WHERE DATE(date_time) >= DATE('now', '-30 days')
+                    hour,
+                    SUM(transaction_count) as transaction_count,
+                    SUM(amount) as total_sales
+                FROM sales_hourly
+                WHERE date_key >= ?
                 GROUP BY hour
                 ORDER BY hour
             """
             
-            df = pd.read_sql_query(query, conn)
+            df = pd.read_sql_query(query, conn, params=(days_ago_key(30),))
             conn.close()
             
             return df.to_dict('records')
@@ -0,0 +1,214 @@
+"""
+Background Task Executor for BuildSmartOS
+Bounded worker pools whose results are delivered back on the Tk thread
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+MAX_WORKERS = 3          # PDF rendering, loyalty, notifications, reports
+BATCH_WORKERS = 1        # Scheduled jobs (forecasts, basket mining), one at a time
+MAX_PROCESSES = max(1, min(4, (os.cpu_count() or 2) - 1))  # CPU-bound work (model training)
+POLL_INTERVAL_MS = 50    # How often the Tk thread drains completions
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task whose CancellationToken was cancelled"""
+
+
+class TaskTimeout(Exception):
+    """Passed to on_error when a task misses its deadline"""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag shared between the UI and a task.
+
+    The UI calls cancel(); long loops in the task call raise_if_cancelled()
+    (or check .cancelled) between steps. Callbacks of a cancelled task are
+    never invoked.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+
+class _Task:
+    """Bookkeeping for one submitted task"""
+
+    __slots__ = ('future', 'on_success', 'on_error', 'token', 'deadline', 'settled')
+
+    def __init__(self, future, on_success, on_error, token, deadline):
+        self.future = future
+        self.on_success = on_success
+        self.on_error = on_error
+        self.token = token
+        self.deadline = deadline
+        self.settled = False  # Callbacks already run (or skipped)
+
+
+def _run_unless_cancelled(token, func, args, kwargs):
+    """Thread-pool wrapper: don't start work that was cancelled while queued"""
+    token.raise_if_cancelled()
+    return func(*args, **kwargs)
+
+
+class BackgroundExecutor:
+    """
+    Runs slow work (SQL reports, PDF bills, loyalty accrual, WhatsApp) off the UI thread.
+
+    Tkinter widgets must only be touched from the thread running mainloop,
+    so workers never call back directly: finished futures are queued and the
+    Tk thread drains the queue with after(), invoking on_success/on_error there.
+    Long scheduled jobs go to a separate batch thread so they never hold the
+    interactive workers; CPU-bound work that holds the GIL can be sent to a
+    process pool instead.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_processes=MAX_PROCESSES):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="buildsmart-worker")
+        self._batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="buildsmart-batch")
+        self._max_processes = max_processes
+        self._process_pool = None  # Started on first use (spawning is slow)
+        self._completions = queue.SimpleQueue()
+        self._root = None
+        self._tasks = set()  # Unsettled tasks, checked for deadlines
+        self._lock = threading.Lock()
+
+    def attach(self, root):
+        """Start delivering results on root's Tk event loop"""
+        if self._root is None:
+            self._root = root
+            self._root.after(POLL_INTERVAL_MS, self._drain)
+
+    def _processes(self):
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self._max_processes)
+            return self._process_pool
+
+    def submit(self, func, *args, on_success=None, on_error=None, token=None,
+               timeout=None, process=False, batch=False, **kwargs):
+        """
+        Run func(*args, **kwargs) on a worker thread (or process).
+
+        Args:
+            on_success: Called on the Tk thread with the return value
+            on_error: Called on the Tk thread with the raised exception
+                (TaskTimeout if the deadline passes first)
+            token: CancellationToken; once cancelled, queued work is skipped
+                and neither callback runs
+            timeout: Seconds until on_error(TaskTimeout) is delivered; the
+                token (if any) is cancelled so the task can stop early
+            process: Run in the process pool (func and arguments must be
+                picklable, i.e. module-level functions and plain data)
+            batch: Run on the batch thread, queued behind other batch jobs
+
+        Returns:
+            concurrent.futures.Future
+        """
+        if process:
+            future = self._processes().submit(func, *args, **kwargs)
+        else:
+            pool = self._batch_pool if batch else self._pool
+            future = pool.submit(_run_unless_cancelled, token or CancellationToken(), func, args, kwargs)
+
+        deadline = time.monotonic() + timeout if timeout else None
+        task = _Task(future, on_success, on_error, token, deadline)
+        with self._lock:
+            self._tasks.add(task)
+        future.add_done_callback(lambda f: self._completions.put(task))
+        return future
+
+    def _settle(self, task):
+        """Mark a task finished; returns False if it already was"""
+        with self._lock:
+            if task.settled:
+                return False
+            task.settled = True
+            self._tasks.discard(task)
+            return True
+
+    def _deliver(self, callback, value, fallback=None):
+        try:
+            if callback:
+                callback(value)
+            elif fallback:
+                print(fallback)
+        except Exception as e:
+            print(f"Background callback error: {e}")
+
+    def _drain(self):
+        """Invoke callbacks for finished and overdue tasks (runs on the Tk thread)"""
+        while True:
+            try:
+                task = self._completions.get_nowait()
+            except queue.Empty:
+                break
+
+            if not self._settle(task):
+                continue  # Timed out earlier; the late result is dropped
+            future = task.future
+            if future.cancelled() or (task.token is not None and task.token.cancelled):
+                continue
+
+            error = future.exception()
+            if isinstance(error, TaskCancelled):
+                continue
+            if error is not None:
+                self._deliver(task.on_error, error, f"Background task failed: {error}")
+            else:
+                self._deliver(task.on_success, future.result())
+
+        now = time.monotonic()
+        with self._lock:
+            overdue = [t for t in self._tasks if t.deadline is not None and now >= t.deadline]
+        for task in overdue:
+            if not self._settle(task):
+                continue
+            if task.token is not None:
+                task.token.cancel()
+            task.future.cancel()  # Only succeeds if it never started
+            self._deliver(task.on_error, TaskTimeout("Operation timed out"), "Background task timed out")
+
+        try:
+            self._root.after(POLL_INTERVAL_MS, self._drain)
+        except Exception:
+            pass  # Window destroyed
+
+    @property
+    def pending(self):
+        """Number of submitted tasks whose callbacks have not run yet"""
+        with self._lock:
+            return len(self._tasks)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; by default let queued tasks (e.g. bills) finish"""
+        self._pool.shutdown(wait=wait)
+        self._batch_pool.shutdown(wait=wait, cancel_futures=True)  # Next session reruns due jobs
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# Global instance
+_background_executor = None
+
+def get_background_executor():
+    """Get or create the shared background executor"""
+    global _background_executor
+    if _background_executor is None:
+        _background_executor = BackgroundExecutor()
+    return _background_executor
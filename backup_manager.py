@@ -3,12 +3,12 @@ Automatic Backup Manager for BuildSmartOS
 Handles scheduled database backups and cleanup of old backups
 """
 import os
-import shutil
 import sqlite3
 from datetime import datetime, timedelta
 import threading
 import time
 from config_manager import get_config
+from db import get_connection
 
 # Try to import schedule for automated backups
 try:
@@ -37,7 +37,7 @@ class BackupManager:
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
             # Create backup using SQLite backup API for safety
-            source = sqlite3.connect(self.db_path)
+            source = get_connection(self.db_path)
             dest = sqlite3.connect(backup_path)
             
             source.backup(dest)
@@ -91,10 +91,19 @@ class BackupManager:
             # Create a backup of current database before restoring
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             current_backup = f"buildsmart_before_restore_{timestamp}.db"
-            shutil.copy2(self.db_path, os.path.join(self.backup_dir, current_backup))
-            
-            # Restore from backup
-            shutil.copy2(backup_path, self.db_path)
+            live = get_connection(self.db_path)
+            try:
+                snapshot = sqlite3.connect(os.path.join(self.backup_dir, current_backup))
+                live.backup(snapshot)
+                snapshot.close()
+                
+                # Restore through the backup API; copying the file over a
+                # WAL-mode database would leave a stale -wal file behind
+                source = sqlite3.connect(backup_path)
+                source.backup(live)
+                source.close()
+            finally:
+                live.close()
             
             print(f"✅ Database restored from: {backup_path}")
             print(f"📦 Previous database saved as: {current_backup}")
@@ -0,0 +1,215 @@
+"""
+Basket Miner for BuildSmartOS
+Nightly market-basket analysis: which products are bought together, stored for cart suggestions
+"""
+import time
+
+import numpy as np
+
+from db import DB_NAME, connection, transaction, today_key, days_ago_key
+
+MINING_DAYS = 365          # Baskets older than this are ignored
+CHUNK_TRANSACTIONS = 50_000  # Transaction ids read and paired per batch (bounds memory)
+MAX_BASKET_ITEMS = 100     # Bigger orders (whole-project stock purchases) carry little signal
+MIN_PAIR_COUNT = 3         # Pairs seen in fewer baskets are noise
+MIN_LIFT = 1.0             # Only keep pairs bought together more often than by chance
+TOP_N = 10                 # Associations stored per product
+
+
+def dedupe_lines(baskets, items):
+    """Sort lines by (basket, product) and drop repeated products within a basket"""
+    order = np.lexsort((items, baskets))
+    baskets, items = baskets[order], items[order]
+    keep = np.ones(len(items), dtype=bool)
+    keep[1:] = (baskets[1:] != baskets[:-1]) | (items[1:] != items[:-1])
+    return baskets[keep], items[keep]
+
+
+def basket_pairs(baskets, items):
+    """
+    Every (a, b) product pair with a < b bought in the same basket.
+
+    Lines must be sorted and deduplicated (see dedupe_lines). Line i is
+    paired with line i + offset for growing offsets while both are in the
+    same basket, so the work is proportional to the number of pairs rather
+    than to baskets x largest basket.
+    """
+    firsts, seconds = [], []
+    left = np.arange(len(items))
+    offset = 1
+    while len(left):
+        left = left[left + offset < len(items)]
+        left = left[baskets[left + offset] == baskets[left]]
+        firsts.append(items[left])
+        seconds.append(items[left + offset])
+        offset += 1
+    if not firsts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def merge_counts(keys, counts, new_keys, new_counts):
+    """Add (new_keys, new_counts) into sorted unique (keys, counts)"""
+    merged, inverse = np.unique(np.concatenate([keys, new_keys]), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([counts, new_counts])).astype(np.int64)
+
+
+def rank_within(groups, limit):
+    """Mask keeping the first `limit` entries of each run of equal values in sorted `groups`"""
+    positions = np.arange(len(groups))
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = groups[1:] != groups[:-1]
+    ranks = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    return ranks, ranks < limit
+
+
+class BasketMiner:
+    """
+    Mines sales_items into product_associations.
+
+    Baskets (transactions, excluding refunded ones) are read in chunks of
+    transaction ids; each chunk's product pairs are counted with numpy and
+    merged into running totals, so memory depends on the number of distinct
+    pairs, not on the number of line items. For every product the TOP_N
+    partners by confidence (share of its baskets that also contain the
+    partner) with lift above MIN_LIFT are stored.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+
+    def count_pairs(self, days=MINING_DAYS):
+        """
+        Returns:
+            (baskets, item_counts by product id, pair_keys, pair_counts, width)
+            where pair key = a * width + b for a < b
+        """
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(id), MAX(id) FROM transactions WHERE date_key >= ?",
+                           (days_ago_key(days),))
+            first_id, last_id = cursor.fetchone()
+            cursor.execute("SELECT MAX(product_id) FROM sales_items")
+            width = (cursor.fetchone()[0] or 0) + 1
+
+            item_counts = np.zeros(width, dtype=np.int64)
+            pair_keys = np.empty(0, dtype=np.int64)
+            pair_counts = np.empty(0, dtype=np.int64)
+            basket_count = 0
+            if first_id is None:
+                return basket_count, item_counts, pair_keys, pair_counts, width
+
+            for chunk_start in range(first_id, last_id + 1, CHUNK_TRANSACTIONS):
+                cursor.execute("""
+                    SELECT si.transaction_id, si.product_id
+                    FROM sales_items si
+                    WHERE si.transaction_id BETWEEN ? AND ?
+                      AND si.product_id IS NOT NULL
+                      AND si.transaction_id NOT IN (SELECT transaction_id FROM refunds)
+                """, (chunk_start, min(chunk_start + CHUNK_TRANSACTIONS - 1, last_id)))
+                lines = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+                if not len(lines):
+                    continue
+
+                baskets, items = dedupe_lines(lines[:, 0], lines[:, 1])
+                basket_ids, sizes = np.unique(baskets, return_counts=True)
+                too_big = basket_ids[sizes > MAX_BASKET_ITEMS]
+                if len(too_big):
+                    keep = ~np.isin(baskets, too_big)
+                    baskets, items = baskets[keep], items[keep]
+
+                basket_count += len(basket_ids) - len(too_big)
+                item_counts += np.bincount(items, minlength=width)
+
+                firsts, seconds = basket_pairs(baskets, items)
+                if len(firsts):
+                    keys, counts = np.unique(firsts * width + seconds, return_counts=True)
+                    pair_keys, pair_counts = merge_counts(pair_keys, pair_counts, keys, counts)
+
+        return basket_count, item_counts, pair_keys, pair_counts, width
+
+    def associations(self, days=MINING_DAYS, top_n=TOP_N):
+        """
+        Rows for product_associations:
+        (product_id, rank, associated_id, pair_count, confidence, lift)
+        """
+        baskets, item_counts, pair_keys, pair_counts, width = self.count_pairs(days)
+        frequent = pair_counts >= MIN_PAIR_COUNT
+        a, b = np.divmod(pair_keys[frequent], width)
+        together = pair_counts[frequent]
+
+        # Each pair gives a rule in both directions
+        source = np.concatenate([a, b])
+        target = np.concatenate([b, a])
+        together = np.concatenate([together, together])
+        confidence = together / item_counts[source]
+        lift = confidence * baskets / item_counts[target]
+
+        keep = lift > MIN_LIFT
+        source, target, together = source[keep], target[keep], together[keep]
+        confidence, lift = confidence[keep], lift[keep]
+
+        order = np.lexsort((-lift, -confidence, source))
+        ranks, keep = rank_within(source[order], top_n)
+        order, ranks = order[keep], ranks[keep]
+        return list(zip(
+            source[order].tolist(), ranks.tolist(), target[order].tolist(),
+            together[order].tolist(), confidence[order].tolist(), lift[order].tolist()
+        ))
+
+    def associations_stale(self):
+        """True unless associations were mined today"""
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(mined_key) FROM product_associations")
+            mined_key = cursor.fetchone()[0]
+        return mined_key is None or mined_key < today_key()
+
+    def refresh(self, days=MINING_DAYS):
+        """
+        Re-mine the last `days` of baskets and replace product_associations
+        in one transaction (readers see the old or the new table, never a mix).
+
+        Returns:
+            (success, message)
+        """
+        try:
+            started = time.perf_counter()
+            rows = self.associations(days)
+            mined_key = today_key()
+            with transaction(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM product_associations")
+                cursor.executemany("""
+                    INSERT INTO product_associations
+                        (product_id, rank, associated_id, pair_count, confidence, lift, mined_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [row + (mined_key,) for row in rows])
+            products = len({row[0] for row in rows})
+            return True, (f"Stored {len(rows)} associations for {products} products "
+                          f"in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            return False, f"Basket mining failed: {e}"
+
+
+def run_association_job(force=False, db_name=DB_NAME):
+    """
+    Nightly basket mining job; a cheap no-op when today's associations
+    are already stored, so it can run at every startup or from a scheduler.
+    """
+    miner = BasketMiner(db_name)
+    if not force and not miner.associations_stale():
+        return True, "Product associations are current"
+    return miner.refresh()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mine frequently co-purchased products")
+    parser.add_argument("--force", action="store_true", help="Mine even if today's associations exist")
+    args = parser.parse_args()
+
+    success, message = run_association_job(force=args.force)
+    print(("✅ " if success else "❌ ") + message)
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,380 @@
+"""
+Performance Benchmarks for BuildSmartOS
+Run against a throwaway copy of the database, never the live file
+
+Usage:
+    python benchmark.py checkout --lines 200 --orders 50
+    python benchmark.py startup --runs 5
+    python benchmark.py import --rows 100000
+    python benchmark.py messaging --messages 200 --latency-ms 50
+    python benchmark.py invoice --lines 1000 --runs 5
+"""
+import argparse
+import csv
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from db import DB_NAME, get_connection, connection, transaction, close_all_pools
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def copy_database(source, workdir, name="benchmark.db"):
+    """Snapshot the database (WAL-safe) into workdir and migrate the copy"""
+    target = os.path.join(workdir, name)
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+    from database_setup import run_migrations
+    run_migrations(target)
+    return target
+
+
+def seed_products(db_name, count, stock=1_000_000):
+    """Ensure at least `count` products exist with ample stock; return their ids"""
+    conn = get_connection(db_name)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM products")
+        existing = cursor.fetchone()[0]
+        if existing < count:
+            cursor.executemany("""
+                INSERT INTO products (name, category, price_per_unit, cost_price,
+                                      stock_quantity, unit_type, barcode)
+                VALUES (?, 'Benchmark', ?, ?, ?, 'pcs', ?)
+            """, [
+                (f"Benchmark Item {i}", 100 + i % 50, 80 + i % 40, stock, f"BENCH{i:07d}")
+                for i in range(count - existing)
+            ])
+        cursor.execute("UPDATE products SET stock_quantity = ?", (stock,))
+        conn.commit()
+        cursor.execute("SELECT id, price_per_unit FROM products ORDER BY id LIMIT ?", (count,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def build_cart(products):
+    """One cart line per product, contractor-style quantities"""
+    return [
+        {'id': pid, 'name': f"#{pid}", 'price': price, 'qty': 1 + i % 5,
+         'subtotal': price * (1 + i % 5)}
+        for i, (pid, price) in enumerate(products)
+    ]
+
+
+def legacy_checkout(db_name, cart, phone):
+    """The previous per-line checkout loop, kept for comparison"""
+    conn = get_connection(db_name)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM customers WHERE phone_number = ?", (phone,))
+        row = cursor.fetchone()
+        if row:
+            customer_id = row[0]
+        else:
+            cursor.execute("INSERT INTO customers (phone_number, name) VALUES (?, ?)", (phone, ""))
+            customer_id = cursor.lastrowid
+
+        total_amount = sum(item['subtotal'] for item in cart)
+        cursor.execute(
+            """INSERT INTO transactions (date_time, customer_id, customer_phone, total_amount, payment_method)
+               VALUES (?, ?, ?, ?, ?)""",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), customer_id, phone, total_amount, 'Cash')
+        )
+        transaction_id = cursor.lastrowid
+        for item in cart:
+            cursor.execute(
+                """INSERT INTO sales_items (transaction_id, product_id, quantity_sold, unit_price, sub_total)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (transaction_id, item['id'], item['qty'], item['price'], item['subtotal'])
+            )
+            cursor.execute(
+                "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?",
+                (item['qty'], item['id'])
+            )
+        conn.commit()
+
+        # Loyalty was then written on a second connection
+        from loyalty_manager import LoyaltyManager
+        LoyaltyManager(db_name).add_points(phone, total_amount, transaction_id)
+    finally:
+        conn.close()
+
+
+def service_checkout(db_name, cart, phone):
+    """Single-transaction checkout via checkout_service"""
+    from checkout_service import process_sale
+    success, result = process_sale(cart, customer_phone=phone, points_per_100=1, db_name=db_name)
+    if not success:
+        raise RuntimeError(result)
+
+
+def time_runs(label, func, runs):
+    """Time func() `runs` times and print a summary line (milliseconds)"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {label:<22} mean {statistics.mean(samples):8.2f} ms   "
+          f"p50 {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+    return samples
+
+
+def bench_checkout(args):
+    """Compare per-line and set-based checkout for large orders"""
+    workdir = tempfile.mkdtemp(prefix="buildsmart_bench_")
+    try:
+        db_name = copy_database(args.db, workdir)
+        cart = build_cart(seed_products(db_name, args.lines))
+
+        print(f"🛒 Checkout: {args.orders} orders x {len(cart)} lines")
+        time_runs("per-line (legacy)", lambda: legacy_checkout(db_name, cart, "0770000001"), args.orders)
+        time_runs("checkout_service", lambda: service_checkout(db_name, cart, "0770000002"), args.orders)
+    finally:
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(label, samples, unit="s"):
+    """Print min/median/max for a list of measurements"""
+    if not samples:
+        print(f"  {label:<22} no samples")
+        return
+    print(f"  {label:<22} min {min(samples):6.2f} {unit}   "
+          f"median {statistics.median(samples):6.2f} {unit}   max {max(samples):6.2f} {unit}")
+
+
+def bench_startup(args):
+    """Time importing main.py and reaching the first interactive window"""
+    workdir = tempfile.mkdtemp(prefix="buildsmart_bench_")
+    try:
+        # The app opens buildsmart_hardware.db / config.json from its working directory
+        copy_database(args.db, workdir, name=DB_NAME)
+        close_all_pools()
+        if os.path.exists(os.path.join(APP_DIR, "config.json")):
+            shutil.copy(os.path.join(APP_DIR, "config.json"), workdir)
+
+        env = dict(os.environ, PYTHONPATH=APP_DIR)
+        import_probe = (
+            "import time; t = time.perf_counter(); import main; "
+            "print(f'IMPORT_SECONDS={time.perf_counter() - t}')"
+        )
+
+        import_times, ready_times = [], []
+        for _ in range(args.runs):
+            result = subprocess.run([sys.executable, "-c", import_probe], cwd=workdir, env=env,
+                                    capture_output=True, text=True, timeout=120)
+            match = re.search(r"IMPORT_SECONDS=([\d.]+)", result.stdout)
+            if match:
+                import_times.append(float(match.group(1)))
+            else:
+                print(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+
+            result = subprocess.run([sys.executable, os.path.join(APP_DIR, "main.py"), "--measure-startup"],
+                                    cwd=workdir, env=env, capture_output=True, text=True, timeout=120)
+            match = re.search(r"Ready in ([\d.]+)s", result.stdout)
+            if match:
+                ready_times.append(float(match.group(1)))
+            else:
+                print(result.stderr.strip().splitlines()[-1] if result.stderr else "launch failed")
+
+        print(f"🚀 Startup: {args.runs} runs")
+        summarize("import main", import_times)
+        summarize("time to interactive", ready_times)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def write_import_csv(path, rows):
+    """Supplier-style price list with some blank barcodes and invalid rows"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'category', 'price_per_unit', 'cost_price',
+                         'stock_quantity', 'unit_type', 'barcode', 'reorder_level'])
+        for i in range(rows):
+            if i % 1000 == 999:
+                writer.writerow([f"Import Item {i}", "Import", "n/a", "", "", "pcs", f"IMP{i:07d}", ""])
+                continue
+            writer.writerow([
+                f"Import Item {i}", f"Import {i % 25}", 100 + i % 50, 80 + i % 40,
+                i % 500, "pcs", f"IMP{i:07d}" if i % 20 else "", 10
+            ])
+
+
+def bench_import(args):
+    """Bulk CSV import: a first pass inserts, a second pass upserts the same file"""
+    from product_import import ProductImporter
+
+    workdir = tempfile.mkdtemp(prefix="buildsmart_bench_")
+    try:
+        db_name = copy_database(args.db, workdir)
+        csv_path = os.path.join(workdir, "products.csv")
+        write_import_csv(csv_path, args.rows)
+
+        print(f"📥 Import: {args.rows} rows, batch size {args.batch}")
+        importer = ProductImporter(db_name, batch_size=args.batch)
+        for label in ("first import", "re-import (upsert)"):
+            summary = importer.run(csv_path)
+            rate = summary['rows'] / summary['seconds'] if summary['seconds'] else 0
+            print(f"  {label:<22} {summary['seconds']:6.2f} s   {rate:9,.0f} rows/s   "
+                  f"inserted {summary['inserted']}  updated {summary['updated']}  "
+                  f"rejected {summary['rejected']}")
+    finally:
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_messaging(args):
+    """Outbox throughput over the HTTP transport against a local stub API"""
+    from message_outbox import MessageOutbox
+    from message_transports import HttpTransport
+    from tests.stub_whatsapp import start_stub_server
+
+    workdir = tempfile.mkdtemp(prefix="buildsmart_bench_")
+    server = start_stub_server(args.latency_ms / 1000)
+    try:
+        db_name = copy_database(args.db, workdir)
+        pdf_path = os.path.join(workdir, "bill.pdf")
+        with open(pdf_path, 'wb') as f:
+            f.write(b"%PDF-1.4\n" + os.urandom(30_000))
+
+        print(f"📨 Messaging: {args.messages} messages to {args.recipients} recipients, "
+              f"half with a PDF, {args.latency_ms} ms API latency")
+        runs = [("sequential, no keep-alive", 1, False)]
+        runs += [(f"{c} parallel, pooled", c, True) for c in args.concurrency]
+        for label, concurrency, keep_alive in runs:
+            with transaction(db_name) as conn:
+                conn.execute("DELETE FROM message_outbox")
+            outbox = MessageOutbox(db_name)
+            for i in range(args.messages):
+                outbox.enqueue(f"+9477{i % args.recipients:07d}", f"Invoice #{i}", "invoice",
+                               pdf_path if i % 2 else None)
+
+            transport = HttpTransport(f"http://127.0.0.1:{server.server_port}/v19.0", "123456",
+                                      "benchmark-key", concurrency=concurrency)
+            if not keep_alive:
+                transport.session.headers['Connection'] = 'close'
+            connections = server.connections
+
+            started = time.perf_counter()
+            outbox.start(transport, rate_per_minute=1_000_000, burst=1000)
+            while True:
+                metrics = outbox.metrics()
+                if not metrics['pending'] and not metrics['sending']:
+                    break
+                time.sleep(0.02)
+            elapsed = time.perf_counter() - started
+            outbox.stop()
+            transport.close()
+
+            print(f"  {label:<26} {args.messages / elapsed:8.1f} msg/s   {elapsed:6.2f} s   "
+                  f"connections {server.connections - connections:4d}   "
+                  f"send p95 {metrics['send_p95'] * 1000:7.1f} ms   dead {metrics['dead']}")
+    finally:
+        server.shutdown()
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_invoice(args):
+    """Render a large contractor invoice from the cart and streamed from the database"""
+    from checkout_service import process_sale
+    from pdf_generator import get_bill_renderer, transaction_lines
+
+    workdir = tempfile.mkdtemp(prefix="buildsmart_bench_")
+    try:
+        db_name = copy_database(args.db, workdir)
+        cart = build_cart(seed_products(db_name, args.lines))
+        success, receipt = process_sale(cart, customer_phone="0770000003", db_name=db_name)
+        if not success:
+            raise RuntimeError(receipt)
+        transaction_id = receipt['transaction_id']
+        total = sum(item['subtotal'] for item in cart)
+        pdf_path = os.path.join(workdir, "invoice.pdf")
+        renderer = get_bill_renderer()
+
+        def from_cart():
+            renderer.render(pdf_path, transaction_id, cart, total, receipt['date_time'])
+
+        def from_db():
+            with connection(db_name) as conn:
+                renderer.render(pdf_path, transaction_id, transaction_lines(conn.cursor(), transaction_id),
+                                total, receipt['date_time'])
+
+        from_db()
+        with open(pdf_path, 'rb') as f:
+            pages = f.read().count(b"/Type /Page\n")
+        print(f"🧾 Invoice: {len(cart)} lines, {pages} pages, {os.path.getsize(pdf_path) / 1024:.0f} KB")
+        time_runs("from cart", from_cart, args.runs)
+        time_runs("streamed from DB", from_db, args.runs)
+
+        tracemalloc.start()
+        try:
+            from_db()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        print(f"  {'peak memory (DB)':<22} {peak / 1_048_576:8.2f} MB   "
+              "(rows are streamed; reportlab keeps finished pages until save)")
+    finally:
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BuildSmartOS performance benchmarks")
+    parser.add_argument("--db", default=DB_NAME, help="Source database (copied, never modified)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    checkout = subparsers.add_parser("checkout", help="Large-order checkout throughput")
+    checkout.add_argument("--lines", type=int, default=200, help="Cart lines per order")
+    checkout.add_argument("--orders", type=int, default=50, help="Orders to time per strategy")
+    checkout.set_defaults(func=bench_checkout)
+
+    startup = subparsers.add_parser("startup", help="Import time and time to interactive window")
+    startup.add_argument("--runs", type=int, default=5, help="Launches to time")
+    startup.set_defaults(func=bench_startup)
+
+    bulk_import = subparsers.add_parser("import", help="Bulk CSV product import throughput")
+    bulk_import.add_argument("--rows", type=int, default=100_000, help="Rows in the generated CSV")
+    bulk_import.add_argument("--batch", type=int, default=2000, help="Rows per transaction")
+    bulk_import.set_defaults(func=bench_import)
+
+    messaging = subparsers.add_parser("messaging", help="Outbox throughput over the HTTP transport")
+    messaging.add_argument("--messages", type=int, default=200, help="Messages to send per run")
+    messaging.add_argument("--recipients", type=int, default=50, help="Distinct recipients")
+    messaging.add_argument("--latency-ms", type=float, default=50, help="Stub API response delay")
+    messaging.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8],
+                           help="Parallel sends to compare")
+    messaging.set_defaults(func=bench_messaging)
+
+    invoice = subparsers.add_parser("invoice", help="Multi-page invoice rendering")
+    invoice.add_argument("--lines", type=int, default=1000, help="Lines on the invoice")
+    invoice.add_argument("--runs", type=int, default=5, help="Renders to time per source")
+    invoice.set_defaults(func=bench_invoice)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
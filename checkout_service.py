@@ -0,0 +1,162 @@
+"""
+Checkout Service for BuildSmartOS
+Records a complete sale (customer, transaction, line items, stock, loyalty) in one transaction
+"""
+from datetime import datetime
+from db import DB_NAME, transaction
+
+
+class InsufficientStockError(Exception):
+    """Raised (and the sale rolled back) when a line exceeds available stock"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [(product_id, name, requested, available)]
+        lines = [
+            f"{name or f'Product #{pid}'}: requested {requested:g}, available {available or 0:g}"
+            for pid, name, requested, available in shortages
+        ]
+        super().__init__("Insufficient stock:\n" + "\n".join(lines))
+
+
+def _aggregate_lines(cart):
+    """Total requested quantity per product (a product may appear on several lines)"""
+    quantities = {}
+    for item in cart:
+        quantities[item['id']] = quantities.get(item['id'], 0) + item['qty']
+    return list(quantities.items())
+
+
+def record_sale(cursor, cart, customer_phone=None, customer_name=None, payment_method='Cash',
+                date_time=None, points_per_100=0):
+    """
+    Write a sale using an open cursor inside the caller's transaction.
+
+    Args:
+        cursor: Cursor on a connection with an open write transaction
+        cart: List of dicts with id, qty, price, subtotal
+        customer_phone: Optional customer phone (customer is created if new)
+        customer_name: Name for a new customer (existing names are kept if empty)
+        payment_method: Payment method label
+        date_time: 'YYYY-MM-DD HH:MM:SS' (defaults to now)
+        points_per_100: Loyalty points per LKR 100 (0 disables accrual)
+
+    Returns:
+        dict with transaction_id, customer_id, customer_name (as stored, None
+        if blank), total_amount, points_earned, total_points
+
+    Raises:
+        InsufficientStockError: if any product lacks stock (nothing is written)
+    """
+    date_time = date_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    total_amount = sum(item['subtotal'] for item in cart)
+
+    # Requested quantities in a temp table so the stock check and the
+    # decrement are each one set-based statement
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS checkout_lines (
+            product_id INTEGER PRIMARY KEY,
+            quantity REAL NOT NULL
+        )
+    """)
+    cursor.execute("DELETE FROM checkout_lines")
+    cursor.executemany(
+        "INSERT INTO checkout_lines (product_id, quantity) VALUES (?, ?)",
+        _aggregate_lines(cart)
+    )
+
+    cursor.execute("""
+        SELECT l.product_id, p.name, l.quantity, p.stock_quantity
+        FROM checkout_lines l
+        LEFT JOIN products p ON p.id = l.product_id
+        WHERE p.id IS NULL OR p.stock_quantity < l.quantity
+    """)
+    shortages = cursor.fetchall()
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    # Customer upsert
+    customer_id = None
+    loyalty_points = 0
+    stored_name = None
+    if customer_phone:
+        cursor.execute("""
+            INSERT INTO customers (phone_number, name) VALUES (?, ?)
+            ON CONFLICT(phone_number) DO UPDATE SET
+                name = COALESCE(NULLIF(excluded.name, ''), customers.name)
+            RETURNING id, loyalty_points, name
+        """, (customer_phone, customer_name or ""))
+        customer_id, loyalty_points, stored_name = cursor.fetchone()
+
+    # Transaction header (customers.total_purchases is maintained by trigger)
+    cursor.execute("""
+        INSERT INTO transactions (date_time, customer_id, customer_phone, total_amount, payment_method)
+        VALUES (?, ?, ?, ?, ?)
+        RETURNING id
+    """, (date_time, customer_id, customer_phone, total_amount, payment_method))
+    transaction_id = cursor.fetchone()[0]
+
+    # Line items
+    cursor.executemany("""
+        INSERT INTO sales_items (transaction_id, product_id, quantity_sold, unit_price, sub_total)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (transaction_id, item['id'], item['qty'], item['price'], item['subtotal'])
+        for item in cart
+    ])
+
+    # Stock decrement
+    cursor.execute("""
+        UPDATE products
+        SET stock_quantity = stock_quantity - (
+            SELECT quantity FROM checkout_lines WHERE product_id = products.id
+        )
+        WHERE id IN (SELECT product_id FROM checkout_lines)
+    """)
+
+    # Loyalty ledger
+    points_earned = int((total_amount / 100) * points_per_100) if customer_id else 0
+    if points_earned:
+        cursor.execute(
+            "UPDATE customers SET loyalty_points = loyalty_points + ? WHERE id = ?",
+            (points_earned, customer_id)
+        )
+        cursor.execute("""
+            INSERT INTO loyalty_transactions (customer_id, points_change, transaction_id, description)
+            VALUES (?, ?, ?, ?)
+        """, (customer_id, points_earned, transaction_id, f"Purchase LKR {total_amount:.2f}"))
+
+    cursor.execute("DELETE FROM checkout_lines")
+
+    return {
+        'transaction_id': transaction_id,
+        'customer_id': customer_id,
+        'customer_name': (stored_name or "").strip() or None,
+        'total_amount': total_amount,
+        'date_time': date_time,
+        'points_earned': points_earned,
+        'total_points': loyalty_points + points_earned
+    }
+
+
+def process_sale(cart, customer_phone=None, customer_name=None, payment_method='Cash',
+                 date_time=None, points_per_100=0, db_name=DB_NAME):
+    """
+    Record a sale atomically: either everything is written or nothing is.
+
+    Returns:
+        (True, receipt dict) or (False, error message)
+    """
+    if not cart:
+        return False, "Cart is empty"
+
+    try:
+        with transaction(db_name) as conn:
+            receipt = record_sale(
+                conn.cursor(), cart, customer_phone, customer_name,
+                payment_method, date_time, points_per_100
+            )
+        return True, receipt
+    except InsufficientStockError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Transaction failed: {e}"
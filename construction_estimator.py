@@ -2,7 +2,7 @@
 Construction Project Estimator for Sri Lankan Market
 Calculate material costs for common construction projects
 """
-import sqlite3
+from product_catalog import get_product_catalog
 import json
 
 class ConstructionEstimator:
@@ -57,21 +57,9 @@ class ConstructionEstimator:
     def get_product_price(self, search_term):
         """Get product price from database"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT name, price_per_unit, unit_type
-                FROM products
-                WHERE LOWER(name) LIKE LOWER(?)
-                LIMIT 1
-            """, (f"%{search_term}%",))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return result
+            product = get_product_catalog().find_by_name(search_term)
+            if product:
+                return product.name, product.price_per_unit, product.unit_type
             return None
             
         except Exception as e:
@@ -6,6 +6,9 @@ View and manage customer information, purchase history, and loyalty points
 import customtkinter as ctk
 from tkinter import messagebox, filedialog
 import sqlite3
+from db import get_connection
+from data_access import customer_page, customer_totals, transaction_page
+from ui_components import VirtualTable, TableColumn, PagedRowProvider, SearchController, LoadingSpinner
 import csv
 from datetime import datetime, timedelta
 
@@ -54,17 +57,17 @@ class CustomerManager(ctk.CTkToplevel):
         controls_frame = ctk.CTkFrame(self)
         controls_frame.pack(fill="x", padx=20, pady=(0, 10))
         
-        # Search box
-        self.search_var = ctk.StringVar()
-        self.search_var.trace("w", lambda *args: self.load_customers())
-        
-        search_entry = ctk.CTkEntry(
+        # Search box (debounced; the query runs on a worker thread)
+        self.search_bar = SearchController(
             controls_frame,
-            placeholder_text="🔍 Search customers (name/phone)...",
-            textvariable=self.search_var,
-            width=400
+            query=self.query_customers,
+            on_results=self.show_customers,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load customers: {e}"),
+            placeholder="Search customers (name/phone)...",
+            fg_color="transparent"
         )
-        search_entry.pack(side="left", padx=10, pady=10)
+        self.search_bar.entry.configure(width=400)
+        self.search_bar.pack(side="left", padx=10, pady=10)
         
         # Action buttons
         add_btn = ctk.CTkButton(
@@ -86,8 +89,25 @@ class CustomerManager(ctk.CTkToplevel):
         export_btn.pack(side="right", padx=5)
         
         # Customers list frame
-        self.customers_frame = ctk.CTkScrollableFrame(self, height=450)
-        self.customers_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        self.customers_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Name", 180, 2, fmt=lambda v: (v or "N/A")[:25], sort_key='name', anchor="w"),
+                TableColumn("Phone", 120, 1, sort_key='phone_number'),
+                TableColumn("Email", 180, 3, fmt=lambda v: (v or "N/A")[:22], sort_key='email'),
+                TableColumn("Purchases", 110, 4, fmt=lambda v: f"LKR {v or 0:,.0f}", sort_key='total_purchases'),
+                TableColumn("Points", 80, 5, fmt=lambda v: f"{v or 0:,.0f}", sort_key='loyalty_points',
+                            text_color="#FFA726"),
+                TableColumn("Trans.", 70, 7),
+            ],
+            actions=[
+                ("👁️ View", 60, self.view_customer_details, "#17a2b8", "#117a8b"),
+                ("✏️ Edit", 60, self.edit_customer, "#007bff", "#0056b3"),
+                ("🗑️", 40, lambda c: self.delete_customer(c[0], c[2] or c[1]), "#dc3545", "#c82333"),
+            ],
+            empty_text="No customers found"
+        )
+        self.customers_table.pack(fill="both", expand=True, padx=20, pady=10)
         
         # Stats footer
         self.stats_label = ctk.CTkLabel(
@@ -98,162 +118,49 @@ class CustomerManager(ctk.CTkToplevel):
         self.stats_label.pack(pady=10)
         
     def load_customers(self):
-        """Load and display customers"""
-        # Clear current display
-        for widget in self.customers_frame.winfo_children():
-            widget.destroy()
-        
-        # Get search value
-        search_term = self.search_var.get().lower()
-        
+        """Reload the customer list for the current search"""
+        self.search_bar.search_now()
+    
+    def query_customers(self, search_term):
+        """
+        Footer stats and the first page for a search (runs on a worker thread).
+        
+        Returns:
+            (order, totals, first page)
+        """
+        search_term = search_term.lower()
+        order = self.customers_table.order
+        conn = get_connection(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            
-            # Build query
-            query = """
-                SELECT c.id, c.phone_number, c.name, c.email, c.total_purchases, 
-                       c.loyalty_points, c.created_date,
-                       COUNT(DISTINCT t.id) as transaction_count
-                FROM customers c
-                LEFT JOIN transactions t ON c.id = t.customer_id
-                WHERE 1=1
-            """
-            params = []
-            
-            if search_term:
-                query += " AND (LOWER(c.name) LIKE ? OR c.phone_number LIKE ?)"
-                params.extend([f"%{search_term}%", f"%{search_term}%"])
-            
-            query += " GROUP BY c.id ORDER BY c.total_purchases DESC"
-            
-            cursor.execute(query, params)
-            customers = cursor.fetchall()
-            
-            # Create header
-            self.create_customer_header()
-            
-            # Display customers
-            for customer in customers:
-                self.create_customer_row(customer)
-            
-            # Update stats
-            total_customers = len(customers)
-            total_value = sum(c[4] for c in customers)
-            total_points = sum(c[5] for c in customers)
-            active_customers = sum(1 for c in customers if c[7] > 0)
-            
-            self.stats_label.configure(
-                text=f"👥 Total Customers: {total_customers} | 💰 Total Purchases: LKR {total_value:,.2f} | ⭐ Points: {total_points:,.0f} | ✅ Active: {active_customers}"
-            )
-            
+            # Footer stats come from one aggregate query, not the listed rows
+            totals = customer_totals(cursor, search_term)
+            page = customer_page(cursor, search_term, order=order)
+        finally:
             conn.close()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load customers: {e}")
+        return order, totals, page
     
-    def create_customer_header(self):
-        """Create table header"""
-        header_frame = ctk.CTkFrame(self.customers_frame, fg_color="#2b2b2b")
-        header_frame.pack(fill="x", pady=(0, 5))
-        
-        headers = [
-            ("Name", 180),
-            ("Phone", 120),
-            ("Email", 180),
-            ("Purchases", 110),
-            ("Points", 80),
-            ("Trans.", 70),
-            ("Actions", 200)
-        ]
-        
-        for text, width in headers:
-            label = ctk.CTkLabel(
-                header_frame,
-                text=text,
-                font=("Roboto", 12, "bold"),
-                width=width
-            )
-            label.pack(side="left", padx=5, pady=5)
-    
-    def create_customer_row(self, customer):
-        """Create a row for a customer"""
-        c_id, phone, name, email, total_purchases, loyalty_points, created_date, trans_count = customer
-        
-        row_frame = ctk.CTkFrame(self.customers_frame)
-        row_frame.pack(fill="x", pady=2)
-        
-        # Name
-        name_label = ctk.CTkLabel(
-            row_frame, 
-            text=(name or "N/A")[:25], 
-            width=180, 
-            anchor="w"
-        )
-        name_label.pack(side="left", padx=5, pady=5)
-        
-        # Phone
-        phone_label = ctk.CTkLabel(row_frame, text=phone, width=120)
-        phone_label.pack(side="left", padx=5)
-        
-        # Email
-        email_label = ctk.CTkLabel(row_frame, text=(email or "N/A")[:22], width=180)
-        email_label.pack(side="left", padx=5)
-        
-        # Total Purchases
-        purchases_label = ctk.CTkLabel(
-            row_frame, 
-            text=f"LKR {total_purchases:,.0f}", 
-            width=110
-        )
-        purchases_label.pack(side="left", padx=5)
-        
-        # Loyalty Points
-        points_label = ctk.CTkLabel(
-            row_frame, 
-            text=f"{loyalty_points:,.0f}", 
-            width=80,
-            text_color="#FFA726"
+    def show_customers(self, search_term, result):
+        """Display the latest search results (Tk thread)"""
+        order, totals, page = result
+        self.stats_label.configure(
+            text=f"👥 Total Customers: {totals['count']} | 💰 Total Purchases: LKR {totals['total_purchases']:,.2f} | ⭐ Points: {totals['loyalty_points']:,.0f} | ✅ Active: {totals['active']}"
         )
-        points_label.pack(side="left", padx=5)
         
-        # Transaction Count
-        trans_label = ctk.CTkLabel(row_frame, text=str(trans_count), width=70)
-        trans_label.pack(side="left", padx=5)
-        
-        # Action buttons
-        actions_frame = ctk.CTkFrame(row_frame, fg_color="transparent")
-        actions_frame.pack(side="left", padx=5)
-        
-        view_btn = ctk.CTkButton(
-            actions_frame,
-            text="👁️ View",
-            width=60,
-            command=lambda: self.view_customer_details(customer),
-            fg_color="#17a2b8",
-            hover_color="#117a8b"
-        )
-        view_btn.pack(side="left", padx=2)
-        
-        edit_btn = ctk.CTkButton(
-            actions_frame,
-            text="✏️ Edit",
-            width=60,
-            command=lambda: self.edit_customer(customer),
-            fg_color="#007bff",
-            hover_color="#0056b3"
-        )
-        edit_btn.pack(side="left", padx=2)
-        
-        delete_btn = ctk.CTkButton(
-            actions_frame,
-            text="🗑️",
-            width=40,
-            command=lambda: self.delete_customer(c_id, name or phone),
-            fg_color="#dc3545",
-            hover_color="#c82333"
+        # Reuse the prefetched page unless the sort changed while searching
+        search_term = search_term.lower()
+        self.customers_table.set_provider(
+            PagedRowProvider(lambda after, order: self.fetch_customers(search_term, after, order)),
+            first_page=page if order == self.customers_table.order else None
         )
-        delete_btn.pack(side="left", padx=2)
+    
+    def fetch_customers(self, search_term, after, order):
+        """One page of customers for the table"""
+        conn = get_connection(self.db_path)
+        try:
+            return customer_page(conn.cursor(), search_term, after=after, order=order)
+        finally:
+            conn.close()
     
     def add_customer(self):
         """Open dialog to add new customer"""
@@ -276,7 +183,7 @@ class CustomerManager(ctk.CTkToplevel):
         
         if result:
             try:
-                conn = sqlite3.connect(self.db_path)
+                conn = get_connection(self.db_path)
                 cursor = conn.cursor()
                 
                 # Check  if customer has transactions
@@ -314,30 +221,36 @@ class CustomerManager(ctk.CTkToplevel):
         if not file_path:
             return
         
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT phone_number, name, email, total_purchases, loyalty_points, created_date
-                FROM customers
-                ORDER BY name
-            """)
-            
-            customers = cursor.fetchall()
-            conn.close()
-            
-            with open(file_path, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    'phone_number', 'name', 'email', 'total_purchases', 
-                    'loyalty_points', 'created_date'
-                ])
-                writer.writerows(customers)
-            
-            messagebox.showinfo("Success", f"Exported {len(customers)} customers to CSV!")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export CSV: {e}")
+        def write():
+            conn = get_connection(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT phone_number, name, email, total_purchases, loyalty_points, created_date
+                    FROM customers
+                    ORDER BY name
+                """)
+                
+                # Stream rows straight to the file rather than holding them all
+                exported = 0
+                with open(file_path, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow([
+                        'phone_number', 'name', 'email', 'total_purchases', 
+                        'loyalty_points', 'created_date'
+                    ])
+                    for customer in cursor:
+                        writer.writerow(customer)
+                        exported += 1
+                return exported
+            finally:
+                conn.close()
+        
+        LoadingSpinner(self, "Exporting customers...").run(
+            write,
+            on_success=lambda count: messagebox.showinfo("Success", f"Exported {count} customers to CSV!"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to export CSV: {e}")
+        )
 
 
 class CustomerDialog(ctk.CTkToplevel):
@@ -437,7 +350,7 @@ class CustomerDialog(ctk.CTkToplevel):
         
         # Load address from database
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             cursor.execute("SELECT address FROM customers WHERE id = ?", (c_id,))
             result = cursor.fetchone()
@@ -463,7 +376,7 @@ class CustomerDialog(ctk.CTkToplevel):
         address = self.address_entry.get("1.0", "end").strip()
         
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             if self.customer:  # Update existing
@@ -568,11 +481,20 @@ class CustomerDetailsWindow(ctk.CTkToplevel):
         )
         history_label.pack(pady=(20, 10))
         
-        # History frame
-        history_frame = ctk.CTkScrollableFrame(self, height=300)
-        history_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        # History table
+        history_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Date/Time", 180, 1, anchor="w"),
+                TableColumn("Items", 60, 4),
+                TableColumn("Amount", 120, 2, fmt=lambda v: f"LKR {v:,.2f}"),
+                TableColumn("Payment", 100, 3, fmt=lambda v: v or "Cash"),
+            ],
+            empty_text="No purchase history available"
+        )
+        history_table.pack(fill="both", expand=True, padx=20, pady=10)
         
-        self.load_purchase_history(history_frame, c_id)
+        self.load_purchase_history(history_table, c_id)
         
         # Close button
         close_btn = ctk.CTkButton(
@@ -584,61 +506,20 @@ class CustomerDetailsWindow(ctk.CTkToplevel):
         )
         close_btn.pack(pady=20)
     
-    def load_purchase_history(self, parent, customer_id):
-        """Load and display purchase history"""
+    def load_purchase_history(self, table, customer_id):
+        """Show purchase history, newest first, a page at a time"""
+        def fetch_page(after, order):
+            conn = get_connection(self.db_path)
+            try:
+                return transaction_page(conn.cursor(), customer_id=customer_id, after=after, limit=50)
+            finally:
+                conn.close()
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT t.id, t.date_time, t.total_amount, t.payment_method,
-                       COUNT(si.id) as item_count
-                FROM transactions t
-                LEFT JOIN sales_items si ON t.id = si.transaction_id
-                WHERE t.customer_id = ?
-                GROUP BY t.id
-                ORDER BY t.date_time DESC
-                LIMIT 50
-            """, (customer_id,))
-            
-            transactions = cursor.fetchall()
-            conn.close()
-            
-            if not transactions:
-                ctk.CTkLabel(
-                    parent,
-                    text="No purchase history available",
-                    font=("Roboto", 14)
-                ).pack(pady=20)
-                return
-            
-            # Header
-            header_frame = ctk.CTkFrame(parent, fg_color="#2b2b2b")
-            header_frame.pack(fill="x", pady=(0, 5))
-            
-            headers = [("Date/Time", 180), ("Items", 60), ("Amount", 120), ("Payment", 100)]
-            for text, width in headers:
-                ctk.CTkLabel(
-                    header_frame,
-                    text=text,
-                    font=("Roboto", 12, "bold"),
-                    width=width
-                ).pack(side="left", padx=10, pady=5)
-            
-            # Transactions
-            for trans in transactions:
-                trans_id, date_time, amount, payment, item_count = trans
-                
-                row = ctk.CTkFrame(parent)
-                row.pack(fill="x", pady=2)
-                
-                ctk.CTkLabel(row, text=date_time, width=180, anchor="w").pack(side="left", padx=10, pady=5)
-                ctk.CTkLabel(row, text=str(item_count), width=60).pack(side="left", padx=10)
-                ctk.CTkLabel(row, text=f"LKR {amount:,.2f}", width=120).pack(side="left", padx=10)
-                ctk.CTkLabel(row, text=payment or "Cash", width=100).pack(side="left", padx=10)
-                
+            table.set_provider(PagedRowProvider(fetch_page))
         except Exception as e:
             ctk.CTkLabel(
-                parent,
+                self,
                 text=f"Error loading history: {e}",
                 font=("Roboto", 12),
                 text_color="red"
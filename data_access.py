@@ -0,0 +1,350 @@
+"""
+Data Access for BuildSmartOS
+Keyset-paginated listings and cheap footer aggregates for the manager windows
+"""
+from datetime import date, timedelta
+
+from db import date_key
+from product_search import search_products_page, count_products
+
+PAGE_SIZE = 100  # Rows fetched per page as the user scrolls
+FORECAST_DAYS = 14  # Demand window stock screens compare against
+SUGGESTION_LIMIT = 3  # Complementary products offered under the cart
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'category', 'price_per_unit', 'cost_price',
+    'stock_quantity', 'unit_type', 'barcode', 'reorder_level'
+)
+
+# Columns a customer listing may be sorted by (NULLs folded so keyset comparisons work)
+CUSTOMER_SORT_EXPRESSIONS = {
+    'name': "COALESCE(c.name, '')",
+    'phone_number': "c.phone_number",
+    'email': "COALESCE(c.email, '')",
+    'total_purchases': "c.total_purchases",
+    'loyalty_points': "COALESCE(c.loyalty_points, 0)",
+}
+
+# Pages are ordered by a stable (sort_key, sort_id) key and continue "after"
+# the last key seen, so page N costs the same as page 1 (no OFFSET scans)
+# and rows inserted while scrolling don't shift later pages.
+
+
+def _keyset_page(cursor, query, params, after, limit, descending=False):
+    """
+    Run one page of `query`, which must select its columns followed by
+    sort_key and sort_id.
+
+    Returns:
+        (rows without the sort columns, next_key or None)
+    """
+    direction = "DESC" if descending else "ASC"
+    params = list(params)
+    condition = ""
+    if after is not None:
+        condition = f"WHERE (sort_key, sort_id) {'<' if descending else '>'} (?, ?)"
+        params.extend(after)
+    params.append(limit + 1)  # One extra row tells us whether another page exists
+
+    cursor.execute(f"""
+        SELECT * FROM ({query}) {condition}
+        ORDER BY sort_key {direction}, sort_id {direction} LIMIT ?
+    """, params)
+    rows = cursor.fetchall()
+    next_key = tuple(rows[limit - 1][-2:]) if len(rows) > limit else None
+    return [row[:-2] for row in rows[:limit]], next_key
+
+
+def _customer_filter(search_term, params):
+    """WHERE fragment for the customer search box (name or phone)"""
+    if not search_term:
+        return ""
+    pattern = f"%{search_term.lower()}%"
+    params.extend([pattern, pattern])
+    return " AND (LOWER(c.name) LIKE ? OR c.phone_number LIKE ?)"
+
+
+def product_page(cursor, search_term="", category=None, after=None, limit=PAGE_SIZE, order=None):
+    """
+    One page of products (PRODUCT_COLUMNS), best matches first when searching,
+    otherwise by name; order=(column, descending) overrides the order.
+
+    Returns:
+        (rows, next_key) - pass next_key as `after` for the following page;
+        it is None on the last page
+    """
+    return search_products_page(cursor, search_term, PRODUCT_COLUMNS, category=category,
+                                after=after, limit=limit, order=order)
+
+
+def product_totals(cursor, search_term="", category=None):
+    """Count, inventory value and low-stock count for the current product filter"""
+    return count_products(cursor, search_term, category)
+
+
+def customer_page(cursor, search_term="", after=None, limit=PAGE_SIZE, order=None):
+    """
+    One page of customers, biggest spenders first unless order=(column, descending)
+    names one of CUSTOMER_SORT_EXPRESSIONS.
+
+    Rows are (id, phone_number, name, email, total_purchases, loyalty_points,
+    created_date, transaction_count); transaction counts are looked up for
+    the page's customers only.
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    column, descending = order or ('total_purchases', True)
+    params = []
+    query = f"""
+        SELECT c.id, c.phone_number, c.name, c.email, c.total_purchases,
+               c.loyalty_points, c.created_date,
+               (SELECT COUNT(*) FROM transactions t WHERE t.customer_id = c.id) AS transaction_count,
+               {CUSTOMER_SORT_EXPRESSIONS[column]} AS sort_key, c.id AS sort_id
+        FROM customers c
+        WHERE 1=1
+    """
+    query += _customer_filter(search_term, params)
+    return _keyset_page(cursor, query, params, after, limit, descending)
+
+
+def customer_totals(cursor, search_term=""):
+    """
+    Footer statistics for the current customer filter.
+
+    Returns:
+        dict with count, total_purchases, loyalty_points, active
+    """
+    # total_purchases is maintained by trigger, so a customer with any
+    # purchase is active without probing the transactions table
+    params = []
+    query = """
+        SELECT COUNT(*),
+               COALESCE(SUM(c.total_purchases), 0),
+               COALESCE(SUM(c.loyalty_points), 0),
+               COALESCE(SUM(c.total_purchases > 0), 0)
+        FROM customers c
+        WHERE 1=1
+    """
+    query += _customer_filter(search_term, params)
+    cursor.execute(query, params)
+    count, total_purchases, loyalty_points, active = cursor.fetchone()
+    return {
+        'count': count,
+        'total_purchases': total_purchases,
+        'loyalty_points': loyalty_points,
+        'active': active
+    }
+
+
+def customer_report_page(cursor, after=None, limit=PAGE_SIZE, order=None):
+    """
+    One page of the customer report, biggest spenders first unless
+    order=(column, descending) names one of CUSTOMER_SORT_EXPRESSIONS.
+
+    Rows are (name, phone_number, total_purchases, loyalty_points,
+    transaction_count, last_purchase).
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    column, descending = order or ('total_purchases', True)
+    query = f"""
+        SELECT c.name, c.phone_number, c.total_purchases, c.loyalty_points,
+               (SELECT COUNT(*) FROM transactions t WHERE t.customer_id = c.id),
+               (SELECT MAX(t.date_time) FROM transactions t WHERE t.customer_id = c.id),
+               {CUSTOMER_SORT_EXPRESSIONS[column]} AS sort_key, c.id AS sort_id
+        FROM customers c
+    """
+    return _keyset_page(cursor, query, [], after, limit, descending)
+
+
+def transaction_page(cursor, customer_id=None, after=None, limit=PAGE_SIZE):
+    """
+    One page of transactions, newest first, optionally for one customer.
+
+    Rows are (id, date_time, total_amount, payment_method, item_count).
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    params = []
+    query = """
+        SELECT t.id, t.date_time, t.total_amount, t.payment_method,
+               (SELECT COUNT(*) FROM sales_items si WHERE si.transaction_id = t.id) AS item_count,
+               t.date_time AS sort_key, t.id AS sort_id
+        FROM transactions t
+        WHERE 1=1
+    """
+    if customer_id is not None:
+        query += " AND t.customer_id = ?"
+        params.append(customer_id)
+    return _keyset_page(cursor, query, params, after, limit, descending=True)
+
+
+def sale_item_page(cursor, transaction_id, after=None, limit=PAGE_SIZE):
+    """
+    One page of a transaction's lines, in the order they were rung up.
+
+    Rows are (name, quantity_sold, unit_price, sub_total).
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    query = """
+        SELECT COALESCE(p.name, 'Item #' || si.product_id), si.quantity_sold, si.unit_price, si.sub_total,
+               si.id AS sort_key, si.id AS sort_id
+        FROM sales_items si
+        LEFT JOIN products p ON p.id = si.product_id
+        WHERE si.transaction_id = ?
+    """
+    return _keyset_page(cursor, query, [transaction_id], after, limit)
+
+
+def refund_search_page(cursor, phone=None, transaction_id=None, date_from_key=None,
+                       date_to_key=None, after=None, limit=PAGE_SIZE):
+    """
+    One page of the refund manager's transaction search, newest first.
+
+    Rows are (id, date_time, customer_phone, total_amount, payment_method,
+    refunded, status).
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    params = []
+    query = """
+        SELECT t.id, t.date_time, t.customer_phone, t.total_amount, t.payment_method,
+               COALESCE(r.refund_amount, 0) AS refunded,
+               CASE WHEN r.id IS NOT NULL THEN 'REFUNDED' ELSE 'ACTIVE' END AS status,
+               t.date_time AS sort_key, t.id AS sort_id
+        FROM transactions t
+        LEFT JOIN refunds r ON t.id = r.transaction_id
+        WHERE 1=1
+    """
+    if phone:
+        query += " AND t.customer_phone LIKE ?"
+        params.append(f"%{phone}%")
+    if transaction_id:
+        query += " AND t.id = ?"
+        params.append(transaction_id)
+    if date_from_key:
+        query += " AND t.date_key >= ?"
+        params.append(date_from_key)
+    if date_to_key:
+        query += " AND t.date_key <= ?"
+        params.append(date_to_key)
+    return _keyset_page(cursor, query, params, after, limit, descending=True)
+
+
+def _forecast_window(days):
+    """Calendar keys of tomorrow and of `days` days ahead"""
+    today = date.today()
+    return date_key(today + timedelta(days=1)), date_key(today + timedelta(days=days))
+
+
+def forecast_demand(cursor, product_ids=None, days=FORECAST_DAYS):
+    """
+    Precomputed demand over the next `days` days, per product.
+
+    Reads the forecasts table (filled by the forecast job in ai_predictor);
+    the model is never run here.
+
+    Returns:
+        {product_id: quantity}; products without forecasts are missing
+    """
+    params = list(_forecast_window(days))
+    query = "SELECT product_id, SUM(predicted_qty) FROM forecasts WHERE date_key BETWEEN ? AND ?"
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+        query += f" AND product_id IN ({', '.join('?' * len(product_ids))})"
+        params.extend(product_ids)
+    cursor.execute(query + " GROUP BY product_id", params)
+    return dict(cursor.fetchall())
+
+
+def reorder_candidates(cursor, days=FORECAST_DAYS):
+    """
+    Products at or below their reorder level, or whose stock won't cover
+    the forecast demand for the next `days` days, largest shortfall first.
+
+    Rows are (id, name, category, stock_quantity, reorder_level, forecast_demand).
+    """
+    cursor.execute("""
+        SELECT p.id, p.name, p.category, p.stock_quantity, p.reorder_level,
+               COALESCE(f.demand, 0) AS forecast_demand
+        FROM products p
+        LEFT JOIN (
+            SELECT product_id, SUM(predicted_qty) AS demand
+            FROM forecasts
+            WHERE date_key BETWEEN ? AND ?
+            GROUP BY product_id
+        ) f ON f.product_id = p.id
+        WHERE p.stock_quantity <= p.reorder_level
+           OR p.stock_quantity < COALESCE(f.demand, 0)
+        ORDER BY MAX(COALESCE(p.reorder_level, 0), COALESCE(f.demand, 0)) - p.stock_quantity DESC
+    """, _forecast_window(days))
+    return cursor.fetchall()
+
+
+def open_stock_alerts(cursor):
+    """
+    Products currently in a low or out-of-stock alert, most urgent first.
+
+    Reads stock_alert_state (kept by trigger on every stock change), so
+    the cost depends on the number of alerted products, not the catalog.
+
+    Rows are (id, name, category, stock_quantity, reorder_level, level).
+    """
+    cursor.execute("""
+        SELECT p.id, p.name, p.category, p.stock_quantity, p.reorder_level, s.level
+        FROM stock_alert_state s
+        JOIN products p ON p.id = s.product_id
+        ORDER BY s.level = 'out' DESC, p.stock_quantity - COALESCE(p.reorder_level, 0), p.name
+    """)
+    return cursor.fetchall()
+
+
+def cart_suggestions(cursor, product_ids, limit=SUGGESTION_LIMIT):
+    """
+    In-stock products most often bought with the cart's products, best first.
+
+    Reads the product_associations table (mined nightly by basket_miner);
+    partners suggested by several cart items rank higher.
+
+    Rows are (id, name, price_per_unit, stock_quantity).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    placeholders = ', '.join('?' * len(product_ids))
+    cursor.execute(f"""
+        SELECT p.id, p.name, p.price_per_unit, p.stock_quantity
+        FROM product_associations a
+        JOIN products p ON p.id = a.associated_id
+        WHERE a.product_id IN ({placeholders})
+          AND a.associated_id NOT IN ({placeholders})
+          AND p.stock_quantity > 0
+        GROUP BY p.id
+        ORDER BY SUM(a.confidence) DESC, MAX(a.lift) DESC
+        LIMIT ?
+    """, product_ids + product_ids + [limit])
+    return cursor.fetchall()
+
+
+def iter_pages(fetch_page, cursor, *args, limit=PAGE_SIZE, **kwargs):
+    """
+    Stream every row of a paginated listing, one page in memory at a time.
+
+    Example:
+        for row in iter_pages(customer_report_page, cursor):
+            ...
+    """
+    after = None
+    while True:
+        rows, after = fetch_page(cursor, *args, after=after, limit=limit, **kwargs)
+        yield from rows
+        if after is None:
+            break
@@ -1,13 +1,29 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
-# Database Name
-DB_NAME = "buildsmart_hardware.db"
+from db import DB_NAME, get_connection, transaction, date_key
+
+# Fixed-date Sri Lankan public holidays (MM-DD). Poya and other lunar
+# holidays move every year; add them per date in config.json under
+# "holidays": {"YYYY-MM-DD": "Name"}.
+FIXED_HOLIDAYS = {
+    "02-04": "National Day",
+    "04-13": "Sinhala & Tamil New Year's Eve",
+    "04-14": "Sinhala & Tamil New Year",
+    "05-01": "May Day",
+    "12-25": "Christmas Day",
+}
+
+# How far ahead the calendar dimension is kept populated
+CALENDAR_DAYS_AHEAD = 3 * 366
+
+# Product change-log rows older than this are pruned at startup
+CHANGE_LOG_RETENTION = '-1 day'
 
 def create_connection():
     """Establish a connection to the SQLite database."""
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_connection(DB_NAME)
         return conn
     except sqlite3.Error as e:
         print(f"Error connecting to database: {e}")
@@ -206,9 +222,586 @@ def create_tables():
     print("✅ Database tables created successfully.")
     conn.close()
 
+    run_migrations()
+
+def load_extra_holidays():
+    """Load date-specific holidays from config.json"""
+    try:
+        import json
+        with open("config.json", 'r', encoding='utf-8') as f:
+            return json.load(f).get("holidays", {})
+    except Exception:
+        return {}
+
+def ensure_calendar(cursor, start, end):
+    """Populate the calendar dimension for every day from start to end (inclusive)."""
+    extra_holidays = load_extra_holidays()
+    rows = []
+    day = start
+    while day <= end:
+        iso_year, iso_week, iso_weekday = day.isocalendar()
+        holiday = extra_holidays.get(day.isoformat()) or FIXED_HOLIDAYS.get(day.strftime("%m-%d"))
+        rows.append((
+            date_key(day), day.isoformat(), day.year, (day.month - 1) // 3 + 1,
+            day.month, day.year * 100 + day.month, day.day,
+            iso_weekday - 1, day.strftime("%A"), int(day.strftime("%W")),
+            iso_year, iso_week, 1 if iso_weekday >= 6 else 0,
+            1 if holiday else 0, holiday
+        ))
+        day += timedelta(days=1)
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO calendar (
+            date_key, date, year, quarter, month, month_key, day,
+            day_of_week, day_name, week_of_year, iso_year, iso_week,
+            is_weekend, is_holiday, holiday_name
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+def migrate_calendar_keys(cursor):
+    """Add an indexed integer date_key to transactions and a calendar dimension."""
+    cursor.execute("PRAGMA table_info(transactions)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'date_key' not in columns:
+        cursor.execute('ALTER TABLE transactions ADD COLUMN date_key INTEGER')
+
+    # Backfill existing rows, then keep the key in sync from date_time
+    cursor.execute('''
+        UPDATE transactions
+        SET date_key = CAST(strftime('%Y%m%d', date_time) AS INTEGER)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date_key ON transactions(date_key)')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS set_transaction_date_key
+        AFTER INSERT ON transactions
+        FOR EACH ROW
+        BEGIN
+            UPDATE transactions
+            SET date_key = CAST(strftime('%Y%m%d', NEW.date_time) AS INTEGER)
+            WHERE id = NEW.id;
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS update_transaction_date_key
+        AFTER UPDATE OF date_time ON transactions
+        FOR EACH ROW
+        BEGIN
+            UPDATE transactions
+            SET date_key = CAST(strftime('%Y%m%d', NEW.date_time) AS INTEGER)
+            WHERE id = NEW.id;
+        END;
+    ''')
+
+    # Calendar dimension (one row per day)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calendar (
+            date_key INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            quarter INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            month_key INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            day_name TEXT NOT NULL,
+            week_of_year INTEGER NOT NULL,
+            iso_year INTEGER NOT NULL,
+            iso_week INTEGER NOT NULL,
+            is_weekend INTEGER NOT NULL DEFAULT 0,
+            is_holiday INTEGER NOT NULL DEFAULT 0,
+            holiday_name TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calendar_month ON calendar(month_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calendar_iso_week ON calendar(iso_year, iso_week)')
+
+    cursor.execute("SELECT MIN(date_key) FROM transactions")
+    first_key = cursor.fetchone()[0]
+    if first_key:
+        start = datetime.strptime(str(first_key), "%Y%m%d").date()
+    else:
+        start = date.today() - timedelta(days=365)
+    ensure_calendar(cursor, start, date.today() + timedelta(days=CALENDAR_DAYS_AHEAD))
+
+def rebuild_rollups(cursor):
+    """Recompute every sales rollup table from the raw transaction data."""
+    for table in ('sales_daily', 'sales_daily_payment', 'sales_hourly',
+                  'sales_daily_product', 'sales_daily_category'):
+        cursor.execute(f'DELETE FROM {table}')
+
+    cursor.execute('''
+        INSERT INTO sales_daily (date_key, transaction_count, gross_sales)
+        SELECT date_key, COUNT(*), SUM(total_amount)
+        FROM transactions
+        GROUP BY date_key
+    ''')
+    cursor.execute('''
+        INSERT INTO sales_daily (date_key, refund_count, refund_amount)
+        SELECT CAST(strftime('%Y%m%d', refund_date) AS INTEGER) AS refund_key,
+               COUNT(*), SUM(refund_amount)
+        FROM refunds
+        WHERE true
+        GROUP BY refund_key
+        ON CONFLICT(date_key) DO UPDATE SET
+            refund_count = excluded.refund_count,
+            refund_amount = excluded.refund_amount
+    ''')
+    cursor.execute('''
+        INSERT INTO sales_daily_payment (date_key, payment_method, transaction_count, amount)
+        SELECT date_key, COALESCE(payment_method, 'Cash'), COUNT(*), SUM(total_amount)
+        FROM transactions
+        GROUP BY date_key, COALESCE(payment_method, 'Cash')
+    ''')
+    cursor.execute('''
+        INSERT INTO sales_hourly (date_key, hour, transaction_count, amount)
+        SELECT date_key, CAST(strftime('%H', date_time) AS INTEGER), COUNT(*), SUM(total_amount)
+        FROM transactions
+        GROUP BY date_key, CAST(strftime('%H', date_time) AS INTEGER)
+    ''')
+    cursor.execute('''
+        INSERT INTO sales_daily_product (date_key, product_id, line_count, quantity, revenue)
+        SELECT t.date_key, si.product_id, COUNT(*), SUM(si.quantity_sold), SUM(si.sub_total)
+        FROM sales_items si
+        JOIN transactions t ON t.id = si.transaction_id
+        GROUP BY t.date_key, si.product_id
+    ''')
+    cursor.execute('''
+        INSERT INTO sales_daily_category (date_key, category, quantity, revenue)
+        SELECT t.date_key, COALESCE(p.category, ''), SUM(si.quantity_sold), SUM(si.sub_total)
+        FROM sales_items si
+        JOIN transactions t ON t.id = si.transaction_id
+        LEFT JOIN products p ON p.id = si.product_id
+        GROUP BY t.date_key, COALESCE(p.category, '')
+    ''')
+
+def migrate_sales_rollups(cursor):
+    """Create trigger-maintained daily/hourly sales rollup tables."""
+    # Refunds used to be created lazily by the refund manager
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refunds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id INTEGER NOT NULL,
+            refund_amount REAL NOT NULL,
+            refund_reason TEXT,
+            refund_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (transaction_id) REFERENCES transactions(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_refunds_transaction ON refunds(transaction_id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            date_key INTEGER PRIMARY KEY,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            gross_sales REAL NOT NULL DEFAULT 0,
+            refund_count INTEGER NOT NULL DEFAULT 0,
+            refund_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_payment (
+            date_key INTEGER NOT NULL,
+            payment_method TEXT NOT NULL,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (date_key, payment_method)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            date_key INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (date_key, hour)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_product (
+            date_key INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            line_count INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (date_key, product_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_daily_product_product ON sales_daily_product(product_id, date_key)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_category (
+            date_key INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (date_key, category)
+        ) WITHOUT ROWID
+    ''')
+
+    # Incremental maintenance
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rollup_transaction_insert
+        AFTER INSERT ON transactions
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO sales_daily (date_key, transaction_count, gross_sales)
+            VALUES (CAST(strftime('%Y%m%d', NEW.date_time) AS INTEGER), 1, NEW.total_amount)
+            ON CONFLICT(date_key) DO UPDATE SET
+                transaction_count = transaction_count + 1,
+                gross_sales = gross_sales + excluded.gross_sales;
+
+            INSERT INTO sales_daily_payment (date_key, payment_method, transaction_count, amount)
+            VALUES (CAST(strftime('%Y%m%d', NEW.date_time) AS INTEGER),
+                    COALESCE(NEW.payment_method, 'Cash'), 1, NEW.total_amount)
+            ON CONFLICT(date_key, payment_method) DO UPDATE SET
+                transaction_count = transaction_count + 1,
+                amount = amount + excluded.amount;
+
+            INSERT INTO sales_hourly (date_key, hour, transaction_count, amount)
+            VALUES (CAST(strftime('%Y%m%d', NEW.date_time) AS INTEGER),
+                    CAST(strftime('%H', NEW.date_time) AS INTEGER), 1, NEW.total_amount)
+            ON CONFLICT(date_key, hour) DO UPDATE SET
+                transaction_count = transaction_count + 1,
+                amount = amount + excluded.amount;
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rollup_sales_item_insert
+        AFTER INSERT ON sales_items
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO sales_daily_product (date_key, product_id, line_count, quantity, revenue)
+            SELECT CAST(strftime('%Y%m%d', t.date_time) AS INTEGER), NEW.product_id,
+                   1, NEW.quantity_sold, NEW.sub_total
+            FROM transactions t
+            WHERE t.id = NEW.transaction_id
+            ON CONFLICT(date_key, product_id) DO UPDATE SET
+                line_count = line_count + 1,
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue;
+
+            INSERT INTO sales_daily_category (date_key, category, quantity, revenue)
+            SELECT CAST(strftime('%Y%m%d', t.date_time) AS INTEGER),
+                   COALESCE((SELECT category FROM products WHERE id = NEW.product_id), ''),
+                   NEW.quantity_sold, NEW.sub_total
+            FROM transactions t
+            WHERE t.id = NEW.transaction_id
+            ON CONFLICT(date_key, category) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue;
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rollup_refund_insert
+        AFTER INSERT ON refunds
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO sales_daily (date_key, refund_count, refund_amount)
+            VALUES (CAST(strftime('%Y%m%d', COALESCE(NEW.refund_date, CURRENT_TIMESTAMP)) AS INTEGER),
+                    1, NEW.refund_amount)
+            ON CONFLICT(date_key) DO UPDATE SET
+                refund_count = refund_count + 1,
+                refund_amount = refund_amount + excluded.refund_amount;
+        END;
+    ''')
+
+    rebuild_rollups(cursor)
+
+def create_search_index(cursor):
+    """
+    Create the FTS5 product search index and its sync triggers.
+    Returns False if this SQLite build lacks FTS5 / the trigram tokenizer,
+    in which case product search falls back to LIKE scans.
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, category, barcode, description,
+                content='products',
+                content_rowid='id',
+                tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text search unavailable ({e}); using LIKE search.")
+        return False
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert
+        AFTER INSERT ON products
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO products_fts (rowid, name, category, barcode, description)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.barcode, NEW.description);
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete
+        AFTER DELETE ON products
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, barcode, description)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.barcode, OLD.description);
+        END;
+    ''')
+    # Only searchable columns, so stock updates at checkout don't touch the index
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF name, category, barcode, description ON products
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, barcode, description)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.barcode, OLD.description);
+            INSERT INTO products_fts (rowid, name, category, barcode, description)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.barcode, NEW.description);
+        END;
+    ''')
+    cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    return True
+
+def migrate_product_search(cursor):
+    """Add the full-text product search index."""
+    create_search_index(cursor)
+
+def migrate_product_changes(cursor):
+    """Log product inserts/updates/deletes so caches can reload just what changed."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS log_product_{event.lower()}
+            AFTER {event} ON products
+            FOR EACH ROW
+            BEGIN
+                INSERT INTO product_changes (product_id) VALUES ({row}.id);
+            END;
+        ''')
+
+def migrate_customer_totals(cursor):
+    """Recompute purchase totals that loyalty accrual used to add a second time."""
+    cursor.execute('''
+        UPDATE customers
+        SET total_purchases = (
+            SELECT SUM(total_amount) FROM transactions WHERE customer_id = customers.id
+        )
+        WHERE id IN (SELECT customer_id FROM transactions)
+    ''')
+
+def migrate_listing_indexes(cursor):
+    """Indexes behind the keyset-paginated customer and purchase history listings."""
+    # Keyset paging needs a non-NULL sort key
+    cursor.execute("UPDATE customers SET total_purchases = 0 WHERE total_purchases IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_purchases ON customers(total_purchases)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_customer_date ON transactions(customer_id, date_time)"
+    )
+
+def migrate_forecasts(cursor):
+    """Precomputed daily demand forecasts, refreshed by the forecast job in ai_predictor."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS forecasts (
+            product_id INTEGER NOT NULL,
+            date_key INTEGER NOT NULL,
+            predicted_qty REAL NOT NULL,
+            model_version INTEGER NOT NULL,
+            PRIMARY KEY (product_id, date_key)
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_product_associations(cursor):
+    """Top complementary products per product, refreshed nightly by basket_miner."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_associations (
+            product_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            associated_id INTEGER NOT NULL,
+            pair_count INTEGER NOT NULL,
+            confidence REAL NOT NULL,
+            lift REAL NOT NULL,
+            mined_key INTEGER NOT NULL,
+            PRIMARY KEY (product_id, rank)
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_message_outbox(cursor):
+    """Persistent queue of outgoing WhatsApp messages (see message_outbox)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            body TEXT NOT NULL,
+            attachment_path TEXT,
+            dedupe_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sending', 'sent', 'dead')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            claimed_at REAL,
+            sent_at REAL,
+            last_error TEXT
+        )
+    ''')
+    # Undelivered messages per recipient in order (head-of-line lookup)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_recipient_open ON message_outbox(recipient, id)
+        WHERE status IN ('pending', 'sending')
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON message_outbox(status, next_attempt_at)')
+
+# Hysteresis for stock alerts: a product alerts again only after stock has
+# recovered above max(reorder level x ratio, reorder level + units)
+STOCK_ALERT_REARM_RATIO = 1.2
+STOCK_ALERT_REARM_UNITS = 1
+
+def migrate_stock_alerts(cursor):
+    """Record low/out-of-stock crossings by trigger, for digest alerts (see stock_alerts)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            level TEXT NOT NULL CHECK(level IN ('low', 'out')),
+            stock_quantity REAL NOT NULL,
+            reorder_level REAL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+            digested_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stock_alerts_undigested ON stock_alerts(created_at)
+        WHERE digested_at IS NULL
+    ''')
+    # Current alert level per product (no row = stock is fine)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_alert_state (
+            product_id INTEGER PRIMARY KEY,
+            level TEXT NOT NULL CHECK(level IN ('low', 'out')),
+            changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )
+    ''')
+
+    level = """CASE WHEN NEW.stock_quantity <= 0 THEN 'out'
+                    WHEN NEW.stock_quantity <= COALESCE(NEW.reorder_level, 0) THEN 'low' END"""
+    current = "(SELECT level FROM stock_alert_state WHERE product_id = NEW.id)"
+    rearm_at = (f"MAX(COALESCE(NEW.reorder_level, 0) * {STOCK_ALERT_REARM_RATIO}, "
+                f"COALESCE(NEW.reorder_level, 0) + {STOCK_ALERT_REARM_UNITS})")
+    # Alert when the level gets worse (ok -> low -> out); clear the state only
+    # once stock is comfortably back above the reorder level
+    worsened = f"""
+            INSERT INTO stock_alerts (product_id, level, stock_quantity, reorder_level)
+            SELECT NEW.id, new_level, NEW.stock_quantity, NEW.reorder_level
+            FROM (SELECT {level} AS new_level)
+            WHERE new_level = 'out' AND COALESCE({current}, '') != 'out'
+               OR new_level = 'low' AND {current} IS NULL;
+
+            INSERT INTO stock_alert_state (product_id, level)
+            SELECT NEW.id, new_level
+            FROM (SELECT {level} AS new_level)
+            WHERE new_level = 'out' AND COALESCE({current}, '') != 'out'
+               OR new_level = 'low' AND {current} IS NULL
+            ON CONFLICT(product_id) DO UPDATE SET level = excluded.level, changed_at = excluded.changed_at;"""
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stock_alert_update
+        AFTER UPDATE OF stock_quantity, reorder_level ON products
+        FOR EACH ROW
+        BEGIN{worsened}
+
+            DELETE FROM stock_alert_state
+            WHERE product_id = NEW.id AND NEW.stock_quantity > {rearm_at};
+        END;
+    ''')
+    # Products added already at or below their level (Product Manager, CSV import)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stock_alert_insert
+        AFTER INSERT ON products
+        FOR EACH ROW
+        BEGIN{worsened}
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS stock_alert_delete
+        AFTER DELETE ON products
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM stock_alert_state WHERE product_id = OLD.id;
+        END;
+    ''')
+
+    # Products already low count as alerted (the startup popup lists them)
+    cursor.execute('''
+        INSERT OR IGNORE INTO stock_alert_state (product_id, level)
+        SELECT id, CASE WHEN stock_quantity <= 0 THEN 'out' ELSE 'low' END
+        FROM products
+        WHERE stock_quantity <= COALESCE(reorder_level, 0)
+    ''')
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    (1, "Calendar date keys", migrate_calendar_keys),
+    (2, "Sales rollup tables", migrate_sales_rollups),
+    (3, "Product search index", migrate_product_search),
+    (4, "Product change log", migrate_product_changes),
+    (5, "Recompute customer purchase totals", migrate_customer_totals),
+    (6, "Listing indexes", migrate_listing_indexes),
+    (7, "Forecast table", migrate_forecasts),
+    (8, "Product association table", migrate_product_associations),
+    (9, "Message outbox", migrate_message_outbox),
+    (10, "Stock alerts", migrate_stock_alerts),
+]
+
+def run_migrations(db_name=DB_NAME):
+    """Apply pending schema migrations. Safe to call on every startup."""
+    conn = get_connection(db_name)
+    try:
+        current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print(f"🔧 Applying migration {version}: {description}...")
+        with transaction(db_name) as conn:
+            migrate(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+        current_version = version
+
+    # Keep the calendar dimension populated ahead of today
+    with transaction(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(date_key) FROM calendar")
+        last_key = cursor.fetchone()[0]
+        if last_key is None or last_key < date_key(date.today() + timedelta(days=365)):
+            ensure_calendar(cursor, date.today(), date.today() + timedelta(days=CALENDAR_DAYS_AHEAD))
+
+    # Sales log a product change per line item; keep the log short. A catalog
+    # cache whose position gets pruned simply falls back to a full reload.
+    with transaction(db_name) as conn:
+        conn.execute("DELETE FROM product_changes WHERE changed_at < datetime('now', ?)",
+                     (CHANGE_LOG_RETENTION,))
+
+    return current_version
+
+def rebuild_rollup_tables(db_name=DB_NAME):
+    """Rebuild all sales rollups from scratch (e.g. after editing history)."""
+    with transaction(db_name) as conn:
+        rebuild_rollups(conn.cursor())
+    print("✅ Sales rollup tables rebuilt.")
+
+def rebuild_search_index(db_name=DB_NAME):
+    """(Re)create and repopulate the product search index."""
+    with transaction(db_name) as conn:
+        if create_search_index(conn.cursor()):
+            print("✅ Product search index rebuilt.")
+
 def backup_database(backup_name=None):
     """Create a backup of the database."""
-    import shutil
     from datetime import datetime
     
     if backup_name is None:
@@ -222,7 +815,15 @@ def backup_database(backup_name=None):
             os.makedirs('backups')
         
         backup_path = os.path.join('backups', backup_name)
-        shutil.copy2(DB_NAME, backup_path)
+        
+        # Use the SQLite backup API so pages still in the WAL file are included
+        source = get_connection(DB_NAME)
+        dest = sqlite3.connect(backup_path)
+        try:
+            source.backup(dest)
+        finally:
+            dest.close()
+            source.close()
         print(f"✅ Database backed up to: {backup_path}")
         return backup_path
     except Exception as e:
@@ -243,7 +844,8 @@ def validate_database():
         # Check required tables
         required_tables = [
             'products', 'customers', 'transactions', 'sales_items',
-            'suppliers', 'loyalty_transactions', 'credit_sales', 'expenses'
+            'suppliers', 'loyalty_transactions', 'credit_sales', 'expenses',
+            'calendar', 'refunds', 'sales_daily'
         ]
         
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -336,6 +938,16 @@ def add_dummy_data():
     conn.close()
 
 if __name__ == "__main__":
+    import sys
+    if "--rebuild-rollups" in sys.argv:
+        run_migrations()
+        rebuild_rollup_tables()
+        sys.exit(0)
+    if "--rebuild-search-index" in sys.argv:
+        run_migrations()
+        rebuild_search_index()
+        sys.exit(0)
+    
     print("=" * 60)
     print("🚀 BuildSmartOS Database Setup")
     print("=" * 60)
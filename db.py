@@ -0,0 +1,289 @@
+"""
+Database Access Layer for BuildSmartOS
+Shared, thread-aware SQLite connection pool with tuned pragmas and retry policy
+"""
+import gc
+import sqlite3
+import threading
+import time
+import random
+import weakref
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+# Database Name
+DB_NAME = "buildsmart_hardware.db"
+
+# Pool and connection tuning
+POOL_SIZE = 8                   # Max open connections per database file
+ACQUIRE_TIMEOUT = 10.0          # Seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000          # SQLite busy handler wait per statement
+STATEMENT_CACHE_SIZE = 256      # Prepared statements cached per connection
+MAX_RETRIES = 5                 # Attempts for "database is locked" errors
+RETRY_BASE_DELAY = 0.05         # Seconds, doubled on every retry
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",       # ~16 MB page cache
+    "PRAGMA mmap_size = 134217728",     # 128 MB memory-mapped I/O
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that returns itself to the pool on close()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._checked_out = False
+
+    def close(self):
+        """Release the connection back to its pool instead of closing it."""
+        if self._pool is None:
+            super().close()
+        elif self._checked_out:
+            self._checked_out = False
+            self._pool.release(self)
+
+    def _close_for_real(self):
+        self._pool = None
+        super().close()
+
+
+def _connect(db_name, factory=sqlite3.Connection, check_same_thread=True):
+    """Open a connection and apply the tuning pragmas."""
+    conn = sqlite3.connect(
+        db_name,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=check_same_thread,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=factory
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def open_connection(db_name=DB_NAME):
+    """
+    Open a tuned connection outside the pool.
+
+    For long-lived, single-purpose connections (e.g. change watchers);
+    close() really closes it.
+    """
+    # May be used from several threads; the owner serializes access (e.g. under a lock)
+    return _connect(db_name, check_same_thread=False)
+
+
+class ConnectionPool:
+    """Small LIFO pool of tuned SQLite connections for one database file."""
+
+    def __init__(self, db_name=DB_NAME, max_size=POOL_SIZE):
+        self.db_name = db_name
+        self.max_size = max_size
+        self._idle = []
+        # Weak references, so a connection leaked by an exception path frees
+        # its slot once it is garbage collected instead of starving the pool
+        self._busy = weakref.WeakSet()
+        self._opening = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _open(self):
+        """Open and configure a new connection."""
+        # Pool hands a connection to one thread at a time
+        conn = _connect(self.db_name, factory=PooledConnection, check_same_thread=False)
+        conn._pool = self
+        return conn
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """Check out a connection, opening one if the pool is not full."""
+        deadline = time.monotonic() + timeout
+        collected = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._busy) + self._opening < self.max_size:
+                    conn = None
+                    self._opening += 1
+                    break
+                if not collected:
+                    # Leaked connections sit in reference cycles; reclaim them first
+                    gc.collect()
+                    collected = True
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Timed out waiting for a database connection ({self.max_size} in use)"
+                    )
+                self._cond.wait(min(remaining, 0.5))
+
+            if conn is not None:
+                self._busy.add(conn)
+
+        if conn is None:
+            try:
+                conn = self._open()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._busy.add(conn)
+                    self._cond.notify()
+
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction."""
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            reusable = False
+
+        with self._cond:
+            self._busy.discard(conn)
+            if reusable and not self._closed:
+                self._idle.append(conn)
+            else:
+                conn._close_for_real()
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection and refuse new checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop()._close_for_real()
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return current pool usage."""
+        with self._cond:
+            return {'idle': len(self._idle), 'in_use': len(self._busy), 'max_size': self.max_size}
+
+
+def is_locked_error(error):
+    """True if the error is a transient lock/busy condition worth retrying."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def run_with_retry(func, retries=MAX_RETRIES, base_delay=RETRY_BASE_DELAY):
+    """Call func(), retrying with exponential backoff while the database is locked."""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            attempt += 1
+            if not is_locked_error(e) or attempt > retries:
+                raise
+            delay = base_delay * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay))
+
+
+# Global pools, one per database file
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name=DB_NAME):
+    """Get or create the connection pool for a database file"""
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_name)
+            if pool is None:
+                pool = ConnectionPool(db_name)
+                _pools[db_name] = pool
+    return pool
+
+
+def get_connection(db_name=DB_NAME):
+    """
+    Check out a pooled connection.
+
+    Use it like a normal sqlite3 connection; calling close() returns it
+    to the pool (rolling back anything left uncommitted).
+    """
+    return get_pool(db_name).acquire()
+
+
+@contextmanager
+def connection(db_name=DB_NAME):
+    """Context manager yielding a pooled connection for reads."""
+    conn = get_connection(db_name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(db_name=DB_NAME):
+    """
+    Context manager for a write transaction.
+
+    Takes the write lock up front (BEGIN IMMEDIATE, retried while another
+    writer holds it), commits on success and rolls back on any exception.
+    """
+    conn = get_connection(db_name)
+    try:
+        run_with_retry(lambda: conn.execute("BEGIN IMMEDIATE"))
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def date_key(value):
+    """
+    Convert a date, datetime or 'YYYY-MM-DD[ HH:MM:SS]' string to an
+    integer calendar key (YYYYMMDD), matching transactions.date_key.
+    """
+    if isinstance(value, str):
+        value = datetime.strptime(value.strip()[:10], "%Y-%m-%d")
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def today_key():
+    """Calendar key for today (local time)"""
+    return date_key(date.today())
+
+
+def days_ago_key(days):
+    """Calendar key for the date `days` days before today"""
+    return date_key(date.today() - timedelta(days=int(days)))
+
+
+def month_key_range(day=None):
+    """(first, last) calendar keys bounding the month containing `day`"""
+    day = day or date.today()
+    month_base = day.year * 10000 + day.month * 100
+    return month_base + 1, month_base + 31
+
+
+def close_all_pools():
+    """Close every pool (call on application exit)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
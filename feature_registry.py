@@ -0,0 +1,121 @@
+"""
+Feature Registry for BuildSmartOS
+Optional modules are checked cheaply at startup and imported on first use
+"""
+import importlib
+import importlib.util
+import threading
+
+
+def module_available(name):
+    """True if a top-level module can be found, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class Feature:
+    """An optional module plus the third-party packages it needs"""
+
+    def __init__(self, module, requires=(), hint=""):
+        self.module = module
+        self.requires = tuple(requires)
+        self.hint = hint
+        self._available = None
+        self._loaded = None
+        self._error = None
+
+    @property
+    def available(self):
+        """Module and requirements are installed (find_spec only; nothing is imported)"""
+        if self._available is None:
+            self._available = all(module_available(name) for name in (self.module,) + self.requires)
+        return self._available
+
+    @property
+    def loaded(self):
+        return self._loaded is not None
+
+    @property
+    def message(self):
+        """Explanation shown when the feature can't be used"""
+        if self._error:
+            return f"{self.module} failed to load: {self._error}"
+        return f"{self.module} not available" + (f" - {self.hint}" if self.hint else "")
+
+    def load(self):
+        """Import the module (first call only); returns it, or None if unavailable"""
+        if self._loaded is None and self.available:
+            try:
+                self._loaded = importlib.import_module(self.module)
+            except Exception as e:
+                # find_spec succeeded but the import didn't (broken install, missing DLL...)
+                self._available = False
+                self._error = e
+                print(f"⚠️ {self.message}")
+        return self._loaded
+
+
+class FeatureRegistry:
+    """Named optional features, imported lazily"""
+
+    def __init__(self):
+        self._features = {}
+        self._lock = threading.Lock()  # Features may be loaded from worker threads
+
+    def register(self, name, module, requires=(), hint=""):
+        self._features[name] = Feature(module, requires, hint)
+
+    def available(self, name):
+        """Cheap availability check (no import)"""
+        feature = self._features.get(name)
+        return feature is not None and feature.available
+
+    def load(self, name):
+        """Import and return the feature's module, or None"""
+        feature = self._features.get(name)
+        if feature is None:
+            return None
+        with self._lock:
+            return feature.load()
+
+    def message(self, name):
+        feature = self._features.get(name)
+        return feature.message if feature else f"Unknown feature: {name}"
+
+    def report(self):
+        """Print one line per feature (for startup logs)"""
+        for name, feature in self._features.items():
+            status = "✅" if feature.available else "⚠️"
+            detail = "" if feature.available else f" ({feature.message})"
+            print(f"   {status} {name}{detail}")
+
+
+# Global instance
+_feature_registry = None
+
+def get_feature_registry():
+    """Get or create the feature registry with BuildSmartOS's optional modules"""
+    global _feature_registry
+    if _feature_registry is None:
+        registry = FeatureRegistry()
+        registry.register("pdf", "pdf_generator", ("reportlab",), "install reportlab")
+        # The transport's own package (pywhatkit, requests) is checked when the dispatcher starts
+        registry.register("whatsapp", "whatsapp_service")
+        registry.register("analytics", "analytics_dashboard", ("pandas", "matplotlib"),
+                          "install matplotlib and pandas")
+        registry.register("ai", "ai_predictor", ("pandas", "numpy"),
+                          "install pandas and numpy")
+        registry.register("baskets", "basket_miner", ("numpy",), "install numpy")
+        registry.register("estimator", "construction_estimator")
+        registry.register("barcode", "barcode_scanner", ("cv2", "pyzbar"),
+                          "install opencv-python and pyzbar")
+        registry.register("voice", "voice_assistant", ("speech_recognition", "pyttsx3"),
+                          "install SpeechRecognition and pyttsx3")
+        registry.register("product_manager", "product_manager")
+        registry.register("customer_manager", "customer_manager")
+        registry.register("reports", "report_generator")
+        registry.register("refunds", "refund_manager")
+        _feature_registry = registry
+    return _feature_registry
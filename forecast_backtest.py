@@ -0,0 +1,286 @@
+"""
+Forecast Backtesting for BuildSmartOS
+Rolling-origin evaluation of demand models: accuracy per category, training and inference cost
+
+Usage:
+    python forecast_backtest.py --folds 8 --horizon 14
+    python forecast_backtest.py --models engine engine-product seasonal-naive --json results.json
+    python forecast_backtest.py --models engine mypackage.models:MyModel
+"""
+import argparse
+import importlib
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+
+from db import DB_NAME, get_connection, close_all_pools
+from forecast_engine import ForecastEngine, DemandMatrix, HISTORY_DAYS, to_date
+
+TRAIN_DAYS = 90   # Same window AIPredictor.train_model uses by default
+HORIZON = 14      # Matches the stock screens' FORECAST_DAYS
+FOLDS = 8
+STEP = 7          # Days between forecast origins
+ALL = "ALL"       # Row holding the totals over every category
+
+
+class SeasonalNaive:
+    """Baseline: each weekday repeats the same weekday of the last week"""
+
+    def fit(self, matrix):
+        return 0
+
+    def forecast(self, history, horizon):
+        last_week = history.quantities[:, -7:]
+        return np.tile(last_week, (1, horizon // 7 + 1))[:, :horizon]
+
+
+class MovingAverage:
+    """Baseline: a flat forecast at the mean of the last `window` days"""
+
+    def __init__(self, window=28):
+        self.window = window
+
+    def fit(self, matrix):
+        return 0
+
+    def forecast(self, history, horizon):
+        mean = history.quantities[:, -self.window:].mean(axis=1)
+        return np.repeat(mean[:, None], horizon, axis=1)
+
+
+# Anything with fit(train_matrix) and forecast(history_matrix, horizon) -> (products, horizon)
+MODELS = {
+    'engine': lambda: ForecastEngine('category'),  # What AIPredictor trains
+    'engine-product': lambda: ForecastEngine('product'),
+    'seasonal-naive': SeasonalNaive,
+    'mean-7': lambda: MovingAverage(7),
+    'mean-28': lambda: MovingAverage(28),
+}
+
+
+def model_factory(name):
+    """A built-in model name, or 'module:callable' for a model defined elsewhere"""
+    if name in MODELS:
+        return MODELS[name]
+    module_name, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown model {name!r}; choose from {', '.join(MODELS)} or use module:callable")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def rolling_origins(end, horizon, folds, step):
+    """First forecast day of each fold, oldest first; the last fold ends on `end`"""
+    last = end - timedelta(days=horizon - 1)
+    return [last - timedelta(days=step * k) for k in reversed(range(folds))]
+
+
+class CategoryErrors:
+    """Running error sums for one model, per category; WAPE and MAPE are derived at the end"""
+
+    def __init__(self):
+        self.sums = {}  # category -> [abs error, actual, forecast, APE sum, APE count]
+
+    def add(self, categories, actual, predicted):
+        error = np.abs(predicted - actual)
+        sold = actual > 0
+        ape = np.where(sold, error / np.where(sold, actual, 1.0), 0.0)
+
+        for category in set(categories) | {ALL}:
+            rows = slice(None) if category == ALL else np.array([c == category for c in categories])
+            sums = self.sums.setdefault(category, [0.0, 0.0, 0.0, 0.0, 0])
+            sums[0] += float(error[rows].sum())
+            sums[1] += float(actual[rows].sum())
+            sums[2] += float(predicted[rows].sum())
+            sums[3] += float(ape[rows].sum())
+            sums[4] += int(sold[rows].sum())
+
+    def summary(self):
+        """
+        {category: {wape, mape, bias, actual}}
+
+        WAPE is total absolute error over total demand; MAPE is averaged over
+        product-days with sales only (it is undefined where nothing sold);
+        bias is forecast over actual minus one. Ratios are None without demand.
+        """
+        result = {}
+        for category, (abs_error, actual, forecast, ape, sold_days) in self.sums.items():
+            result[category] = {
+                'wape': abs_error / actual if actual else None,
+                'mape': ape / sold_days if sold_days else None,
+                'bias': forecast / actual - 1 if actual else None,
+                'actual': actual,
+            }
+        return result
+
+
+def measure(func, *args):
+    """(result, seconds) for func(*args)"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def peak_memory(func, *args):
+    """Peak bytes allocated by func(*args) (numpy buffers included), via tracemalloc"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def backtest(matrix, model_names, origins, train_days=TRAIN_DAYS, horizon=HORIZON, track_memory=True):
+    """
+    Rolling-origin evaluation: for each origin, fit every model on the
+    `train_days` before it and forecast the `horizon` days from it.
+
+    Timings come from untraced runs; memory is measured in one extra traced
+    run on the last fold, since tracemalloc slows allocation-heavy code.
+
+    Returns:
+        {model: {'categories': {...}, 'fit_seconds': [...], 'forecast_seconds': [...],
+                 'fit_peak_bytes': int, 'forecast_peak_bytes': int}}
+    """
+    results = {}
+    for name in model_names:
+        factory = model_factory(name)
+        errors = CategoryErrors()
+        fit_seconds, forecast_seconds = [], []
+        train = history = None
+
+        for origin in origins:
+            train = matrix.window(origin - timedelta(days=train_days), origin - timedelta(days=1))
+            actual = matrix.window(origin, origin + timedelta(days=horizon - 1)).quantities
+
+            model = factory()
+            _, seconds = measure(model.fit, train)
+            fit_seconds.append(seconds)
+            # Like production, forecasting continues straight from the training days
+            history = train
+            predicted, seconds = measure(model.forecast, history, horizon)
+            forecast_seconds.append(seconds)
+            errors.add(matrix.categories, actual, np.asarray(predicted, dtype=np.float64))
+
+        result = {
+            'categories': errors.summary(),
+            'fit_seconds': fit_seconds,
+            'forecast_seconds': forecast_seconds,
+            'fit_peak_bytes': None,
+            'forecast_peak_bytes': None,
+        }
+        if track_memory and train is not None:
+            model = factory()
+            result['fit_peak_bytes'] = peak_memory(model.fit, train)
+            result['forecast_peak_bytes'] = peak_memory(model.forecast, history, horizon)
+        results[name] = result
+    return results
+
+
+def _percent(value):
+    return f"{value * 100:7.1f}%" if value is not None else "     n/a"
+
+
+def _megabytes(value):
+    return f"{value / 1_048_576:7.1f} MB" if value is not None else "    n/a"
+
+
+def print_report(results, top=10):
+    """Accuracy table per model (ALL first, then the busiest categories) and cost summary"""
+    for name, result in results.items():
+        categories = result['categories']
+        print(f"\n📈 {name}")
+        print(f"  {'Category':<24} {'WAPE':>8} {'MAPE':>8} {'Bias':>8} {'Units':>10}")
+        busiest = sorted((c for c in categories if c != ALL),
+                         key=lambda c: categories[c]['actual'], reverse=True)
+        for category in [ALL] + busiest[:top]:
+            row = categories[category]
+            print(f"  {(category or '(none)')[:24]:<24} {_percent(row['wape'])} {_percent(row['mape'])} "
+                  f"{_percent(row['bias'])} {row['actual']:10.0f}")
+        if len(busiest) > top:
+            print(f"  ... {len(busiest) - top} more categories (see --json)")
+
+    print("\n⏱️  Cost per fold")
+    print(f"  {'Model':<24} {'fit p50':>10} {'fit max':>10} {'predict p50':>12} {'fit peak':>11} {'predict peak':>12}")
+    for name, result in results.items():
+        fit, predict = result['fit_seconds'], result['forecast_seconds']
+        print(f"  {name[:24]:<24} {statistics.median(fit) * 1000:7.1f} ms {max(fit) * 1000:7.1f} ms "
+              f"{statistics.median(predict) * 1000:9.1f} ms {_megabytes(result['fit_peak_bytes'])} "
+              f"{_megabytes(result['forecast_peak_bytes']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of BuildSmartOS demand forecasts")
+    parser.add_argument("--db", default=DB_NAME, help="Source database (copied, never modified)")
+    parser.add_argument("--models", nargs="+", default=['engine', 'seasonal-naive', 'mean-28'],
+                        help=f"Models to compare: {', '.join(MODELS)} or module:callable")
+    parser.add_argument("--folds", type=int, default=FOLDS, help="Forecast origins to evaluate")
+    parser.add_argument("--step", type=int, default=STEP, help="Days between origins")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="Days forecast from each origin")
+    parser.add_argument("--train-days", type=int, default=TRAIN_DAYS, help="Training window before each origin")
+    parser.add_argument("--end", help="Last evaluated day, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--json", help="Also write the full results to this file")
+    args = parser.parse_args()
+
+    if args.train_days <= HISTORY_DAYS:
+        parser.error(f"--train-days must be more than {HISTORY_DAYS} (the feature history)")
+    if args.folds < 1 or args.horizon < 1 or args.step < 1:
+        parser.error("--folds, --horizon and --step must be positive")
+    for name in args.models:
+        try:
+            model_factory(name)
+        except (ValueError, ImportError, AttributeError) as e:
+            parser.error(str(e))
+
+    end = to_date(args.end) if args.end else date.today() - timedelta(days=1)
+    origins = rolling_origins(end, args.horizon, args.folds, args.step)
+    start = origins[0] - timedelta(days=args.train_days)
+
+    from benchmark import copy_database
+
+    workdir = tempfile.mkdtemp(prefix="buildsmart_backtest_")
+    try:
+        db_name = copy_database(args.db, workdir)
+        conn = get_connection(db_name)
+        try:
+            matrix = DemandMatrix.load(conn.cursor(), start, end)
+        finally:
+            conn.close()
+    finally:
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not matrix.quantities.any():
+        print(f"No sales between {start} and {end}; nothing to evaluate")
+        return 1
+
+    print(f"🔁 Backtest: {len(matrix.product_ids)} products, {args.folds} origins "
+          f"{origins[0]}..{origins[-1]}, {args.horizon}-day horizon, {args.train_days}-day training window")
+    results = backtest(matrix, args.models, origins, args.train_days, args.horizon,
+                       track_memory=not args.no_memory)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'database': args.db,
+                'origins': [str(o) for o in origins],
+                'horizon': args.horizon,
+                'train_days': args.train_days,
+                'models': results,
+            }, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Forecast Engine for BuildSmartOS
+Per-category demand models on lag and rolling-window features of a dense product x day matrix
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from db import date_key
+
+LAGS = (1, 2, 7, 14)      # Demand this many days before the target day
+WINDOWS = (7, 28)         # Rolling mean demand over the days before the target day
+HISTORY_DAYS = max(LAGS + WINDOWS)  # History needed to build one feature row
+N_FEATURES = len(LAGS) + len(WINDOWS) + 7  # + day-of-week one-hot (acts as the intercept)
+
+RIDGE = 1.0               # L2 penalty; keeps sparse categories stable
+MIN_GROUP_ROWS = 60       # Groups with fewer examples use the pooled model
+PARALLEL_MIN_ROWS = 200_000  # Below this, process start-up costs more than it saves
+ARTIFACT_FORMAT = 1       # Layout of the saved .npz; bump when it changes
+
+
+def to_date(value):
+    """date from a date, datetime, calendar key (YYYYMMDD) or 'YYYY-MM-DD' string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return datetime.strptime(str(value), "%Y%m%d").date()
+    return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").date()
+
+
+class DemandMatrix:
+    """
+    Daily quantity sold per product, dense and zero-filled.
+
+    quantities[i, j] is product_ids[i]'s demand on start + j days; products
+    and days without sales are 0, so lags and windows are plain slices.
+    """
+
+    def __init__(self, product_ids, categories, start, quantities):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.categories = list(categories)
+        self.start = start
+        self.quantities = quantities
+
+    @property
+    def days(self):
+        return self.quantities.shape[1]
+
+    @property
+    def end(self):
+        """Last day covered"""
+        return self.start + timedelta(days=self.days - 1)
+
+    def dates(self):
+        return [self.start + timedelta(days=j) for j in range(self.days)]
+
+    def window(self, first, last):
+        """The days first..last (inclusive dates) as a new matrix sharing this one's data"""
+        a, b = (first - self.start).days, (last - self.start).days + 1
+        if a < 0 or b > self.days or a >= b:
+            raise ValueError(f"{first}..{last} is outside {self.start}..{self.end}")
+        return DemandMatrix(self.product_ids, self.categories, first, self.quantities[:, a:b])
+
+    @classmethod
+    def load(cls, cursor, start, end, product_ids=None):
+        """
+        Build the matrix for start..end (inclusive) from the daily product rollup.
+
+        product_ids limits the rows (default: every product).
+        """
+        start, end = to_date(start), to_date(end)
+        days = (end - start).days + 1
+
+        if product_ids is None:
+            cursor.execute("SELECT id, COALESCE(category, '') FROM products ORDER BY id")
+        else:
+            ids = sorted({int(p) for p in product_ids})
+            cursor.execute(f"""
+                SELECT id, COALESCE(category, '') FROM products
+                WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id
+            """, ids)
+        products = cursor.fetchall()
+        product_index = np.array([p[0] for p in products], dtype=np.int64)
+
+        quantities = np.zeros((len(products), max(days, 0)), dtype=np.float64)
+        if products and days > 0:
+            cursor.execute("""
+                SELECT date_key, product_id, quantity
+                FROM sales_daily_product
+                WHERE date_key BETWEEN ? AND ?
+            """, (date_key(start), date_key(end)))
+            rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+            if len(rows):
+                # Map keys to columns once per distinct day, products by binary search
+                keys, key_inverse = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+                key_columns = np.array([(to_date(int(k)) - start).days for k in keys])
+                columns = key_columns[key_inverse]
+                product_ids_in_rows = rows[:, 1].astype(np.int64)
+                positions = np.searchsorted(product_index, product_ids_in_rows)
+                positions = np.minimum(positions, len(product_index) - 1)
+                known = product_index[positions] == product_ids_in_rows
+                np.add.at(quantities, (positions[known], columns[known]), rows[known, 2])
+
+        return cls(product_index, [p[1] for p in products], start, quantities)
+
+
+def build_features(quantities, targets, weekdays):
+    """
+    Feature tensor for predicting the demand on columns `targets` from the days before.
+
+    Args:
+        quantities: (products, days) demand; every target needs HISTORY_DAYS before it
+        targets: column indices of the target days
+        weekdays: weekday (0=Monday) of each target day
+
+    Returns:
+        (products, len(targets), N_FEATURES) array
+    """
+    targets = np.asarray(targets)
+    products = quantities.shape[0]
+
+    # Prefix sums turn every rolling mean into one subtraction
+    cumulative = np.zeros((products, quantities.shape[1] + 1))
+    np.cumsum(quantities, axis=1, out=cumulative[:, 1:])
+
+    parts = [quantities[:, targets - lag] for lag in LAGS]
+    parts += [(cumulative[:, targets] - cumulative[:, targets - window]) / window for window in WINDOWS]
+
+    day_of_week = np.zeros((len(targets), 7))
+    day_of_week[np.arange(len(targets)), np.asarray(weekdays)] = 1.0
+
+    return np.concatenate([
+        np.stack(parts, axis=-1),
+        np.broadcast_to(day_of_week, (products, len(targets), 7))
+    ], axis=-1)
+
+
+def training_examples(matrix, rows=None):
+    """(X, y) for every day of `matrix` that has a full history, for the given product rows"""
+    quantities = matrix.quantities if rows is None else matrix.quantities[rows]
+    targets = np.arange(HISTORY_DAYS, matrix.days)
+    if len(targets) == 0 or len(quantities) == 0:
+        return np.empty((0, N_FEATURES)), np.empty(0)
+    weekdays = [(matrix.start + timedelta(days=int(t))).weekday() for t in targets]
+    X = build_features(quantities, targets, weekdays)
+    return X.reshape(-1, N_FEATURES), quantities[:, targets].reshape(-1)
+
+
+def sufficient_statistics(X, y):
+    """X'X, X'y and row count - all a least-squares fit needs, and additive across batches"""
+    return X.T @ X, X.T @ y, len(y)
+
+
+def solve(xtx, xty, ridge=RIDGE):
+    """Ridge regression weights from sufficient statistics"""
+    return np.linalg.solve(xtx + ridge * np.eye(len(xtx)), xty)
+
+
+def _fit_group(X, y):
+    """Process-pool task: statistics for one group's examples"""
+    return sufficient_statistics(X, y)
+
+
+class ForecastEngine:
+    """
+    Demand forecaster with one ridge model per category (or per product).
+
+    Each model maps a product's recent demand (lags, rolling means) and the
+    weekday to the next day's demand, so one category model still follows
+    each product's own level. Models are fitted from additive sufficient
+    statistics; groups with too little data fall back to a model pooled over
+    all groups. Forecasts are recursive: each predicted day feeds the lags
+    of the next.
+    """
+
+    def __init__(self, group_by='category', ridge=RIDGE):
+        if group_by not in ('category', 'product'):
+            raise ValueError(f"group_by must be 'category' or 'product', not {group_by!r}")
+        self.group_by = group_by
+        self.ridge = ridge
+        self.stats = {}            # group -> (X'X, X'y, rows)
+        self.weights = {}          # group -> weights for groups with enough data
+        self.pooled_weights = np.zeros(N_FEATURES)
+        self.product_groups = {}   # product id -> group, as of training
+        self.trained_through = None  # Last day included in training
+        self.high_water = 0        # Highest transaction id reflected in the statistics
+        self.version = 0           # Bumped by every fit/update (stamped on stored forecasts)
+
+    def group_of(self, product_id, category):
+        return int(product_id) if self.group_by == 'product' else category
+
+    def group_statistics(self, matrix, workers=None):
+        """
+        Sufficient statistics per group for every full-history day of matrix.
+
+        Groups are computed in a process pool when the data is large enough
+        to benefit; workers=1 forces in-process work.
+
+        Returns:
+            ({group: (X'X, X'y, rows)}, total rows)
+        """
+        groups = {}
+        for row, (product_id, category) in enumerate(zip(matrix.product_ids, matrix.categories)):
+            group = self.group_of(product_id, category)
+            self.product_groups[int(product_id)] = group
+            groups.setdefault(group, []).append(row)
+
+        jobs = [(group, training_examples(matrix, rows)) for group, rows in groups.items()]
+        total_rows = sum(len(y) for _, (_, y) in jobs)
+
+        workers = workers or max(1, min(len(jobs), (os.cpu_count() or 2) - 1))
+        if workers > 1 and total_rows >= PARALLEL_MIN_ROWS:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(_fit_group, *zip(*(examples for _, examples in jobs)),
+                                   chunksize=max(1, len(jobs) // (workers * 4)))
+                stats = dict(zip((group for group, _ in jobs), results))
+        else:
+            stats = {group: _fit_group(X, y) for group, (X, y) in jobs}
+
+        return {group: s for group, s in stats.items() if s[2]}, total_rows
+
+    def fit(self, matrix, high_water=0, workers=None):
+        """
+        Fit every group's model on the matrix (replaces previous statistics).
+
+        Returns:
+            Number of training examples
+        """
+        self.product_groups = {}
+        self.stats, total_rows = self.group_statistics(matrix, workers)
+        self.trained_through = matrix.end
+        self.high_water = high_water
+        self.version += 1
+        self.solve()
+        return total_rows
+
+    def update(self, matrix, high_water, workers=None):
+        """
+        Add new days to the models without revisiting older ones.
+
+        matrix must start HISTORY_DAYS before the first new day (the day
+        after trained_through); only its later days become examples, so the
+        cost depends on the number of new days, not on the history length.
+
+        Returns:
+            Number of new training examples
+        """
+        expected_start = self.trained_through + timedelta(days=1 - HISTORY_DAYS)
+        if matrix.start != expected_start:
+            raise ValueError(f"Update matrix must start on {expected_start}, not {matrix.start}")
+
+        new_stats, total_rows = self.group_statistics(matrix, workers)
+        for group, (xtx, xty, rows) in new_stats.items():
+            if group in self.stats:
+                old_xtx, old_xty, old_rows = self.stats[group]
+                self.stats[group] = (old_xtx + xtx, old_xty + xty, old_rows + rows)
+            else:
+                self.stats[group] = (xtx, xty, rows)
+
+        self.trained_through = matrix.end
+        self.high_water = high_water
+        self.version += 1
+        self.solve()
+        return total_rows
+
+    def solve(self):
+        """Recompute model weights from the accumulated statistics"""
+        self.weights = {
+            group: solve(xtx, xty, self.ridge)
+            for group, (xtx, xty, rows) in self.stats.items() if rows >= MIN_GROUP_ROWS
+        }
+        if self.stats:
+            xtx = sum(s[0] for s in self.stats.values())
+            xty = sum(s[1] for s in self.stats.values())
+            self.pooled_weights = solve(xtx, xty, self.ridge)
+
+    def save(self, path):
+        """
+        Write the statistics (not the weights, which are cheap to re-solve)
+        to a compact .npz, atomically.
+        """
+        keys = sorted(set(self.stats) | set(self.product_groups.values()), key=str)
+        index = {key: i for i, key in enumerate(keys)}
+        zero = (np.zeros((N_FEATURES, N_FEATURES)), np.zeros(N_FEATURES), 0)
+        stats = [self.stats.get(key, zero) for key in keys]
+        product_ids = np.array(sorted(self.product_groups), dtype=np.int64)
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                format=ARTIFACT_FORMAT,
+                version=self.version,
+                group_by=self.group_by,
+                ridge=self.ridge,
+                lags=np.array(LAGS),
+                windows=np.array(WINDOWS),
+                trained_through=date_key(self.trained_through) if self.trained_through else 0,
+                high_water=self.high_water,
+                group_keys=np.array([str(key) for key in keys]),
+                xtx=np.array([s[0] for s in stats]).reshape(len(keys), N_FEATURES, N_FEATURES),
+                xty=np.array([s[1] for s in stats]).reshape(len(keys), N_FEATURES),
+                rows=np.array([s[2] for s in stats], dtype=np.int64),
+                product_ids=product_ids,
+                product_group=np.array([index[self.product_groups[int(p)]] for p in product_ids],
+                                       dtype=np.int64),
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an engine saved by save().
+
+        Raises:
+            ValueError if the artifact was written for a different format or
+            feature set (the caller should retrain)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['format']) != ARTIFACT_FORMAT \
+                    or tuple(data['lags']) != LAGS or tuple(data['windows']) != WINDOWS:
+                raise ValueError("Model artifact is from an incompatible version")
+
+            engine = cls(str(data['group_by']), float(data['ridge']))
+            keys = [int(k) if engine.group_by == 'product' else str(k) for k in data['group_keys']]
+            engine.stats = {
+                key: (xtx, xty, int(rows))
+                for key, xtx, xty, rows in zip(keys, data['xtx'], data['xty'], data['rows']) if rows
+            }
+            engine.product_groups = {
+                int(p): keys[g] for p, g in zip(data['product_ids'], data['product_group'])
+            }
+            trained_through = int(data['trained_through'])
+            engine.trained_through = to_date(trained_through) if trained_through else None
+            engine.high_water = int(data['high_water'])
+            engine.version = int(data['version'])
+
+        engine.solve()
+        return engine
+
+    @property
+    def trained(self):
+        return bool(self.stats)
+
+    def weight_matrix(self, product_ids, categories):
+        """(products, N_FEATURES) weights: each product's group model or the pooled one"""
+        return np.array([
+            self.weights.get(self.product_groups.get(int(p), self.group_of(p, c)), self.pooled_weights)
+            for p, c in zip(product_ids, categories)
+        ]).reshape(len(product_ids), N_FEATURES)
+
+    def forecast(self, history, horizon):
+        """
+        Predict the `horizon` days after history.end for every product in history.
+
+        history must cover at least HISTORY_DAYS (older days are ignored).
+
+        Returns:
+            (products, horizon) array of predicted quantities (never negative)
+        """
+        if history.days < HISTORY_DAYS:
+            raise ValueError(f"Forecasting needs {HISTORY_DAYS} days of history, got {history.days}")
+
+        weights = self.weight_matrix(history.product_ids, history.categories)
+        quantities = np.concatenate([
+            history.quantities[:, -HISTORY_DAYS:],
+            np.zeros((len(history.product_ids), horizon))
+        ], axis=1)
+
+        first_day = history.end + timedelta(days=1)
+        for step in range(horizon):
+            target = HISTORY_DAYS + step
+            weekday = (first_day + timedelta(days=step)).weekday()
+            X = build_features(quantities, [target], [weekday])[:, 0, :]
+            quantities[:, target] = np.maximum(0.0, np.einsum('ij,ij->i', X, weights))
+
+        return quantities[:, HISTORY_DAYS:]
@@ -3,7 +3,7 @@ System Health Monitor for BuildSmartOS
 Monitors system health, database integrity, and disk space
 """
 import os
-import sqlite3
+from db import get_connection
 from datetime import datetime
 from config_manager import get_config
 
@@ -31,7 +31,7 @@ class HealthMonitor:
                 return False, issues
             
             # Check if database is accessible
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             # Run integrity check
@@ -2,7 +2,7 @@
 Customer Loyalty Program Manager for BuildSmartOS
 Track customer points and rewards
 """
-import sqlite3
+from db import get_connection
 import json
 from datetime import datetime
 
@@ -29,7 +29,7 @@ class LoyaltyManager:
     def add_points(self, phone_number, amount, transaction_id=None):
         """Add loyalty points for a customer"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             cursor = conn.cursor()
             
             # Check if customer exists
@@ -43,17 +43,19 @@ class LoyaltyManager:
                 customer_id, current_points = result
                 new_points = current_points + points_earned
                 
+                # total_purchases is maintained by the update_customer_purchases
+                # trigger when the transaction is recorded; don't add it twice
                 cursor.execute("""
                     UPDATE customers 
-                    SET loyalty_points = ?, total_purchases = total_purchases + ?
+                    SET loyalty_points = ?
                     WHERE id = ?
-                """, (new_points, amount, customer_id))
+                """, (new_points, customer_id))
             else:
                 # Create new customer
                 cursor.execute("""
-                    INSERT INTO customers (phone_number, loyalty_points, total_purchases)
-                    VALUES (?, ?, ?)
-                """, (phone_number, points_earned, amount))
+                    INSERT INTO customers (phone_number, loyalty_points)
+                    VALUES (?, ?)
+                """, (phone_number, points_earned))
                 customer_id = cursor.lastrowid
                 new_points = points_earned
             
@@ -78,7 +80,7 @@ class LoyaltyManager:
     def redeem_points(self, phone_number, points_to_redeem=None):
         """Redeem loyalty points for discount"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             cursor = conn.cursor()
             
             cursor.execute("SELECT id, loyalty_points FROM customers WHERE phone_number = ?", (phone_number,))
@@ -124,7 +126,7 @@ class LoyaltyManager:
     def get_customer_points(self, phone_number):
         """Get customer's current loyalty points"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -153,7 +155,7 @@ class LoyaltyManager:
     def get_top_customers(self, limit=10):
         """Get top loyalty customers"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = get_connection(self.db_name)
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -1,22 +1,30 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import customtkinter as ctk
-import sqlite3
 from tkinter import messagebox, simpledialog
 from datetime import datetime
 import json
 import os
+import sys
+
+from db import get_connection, connection, close_all_pools
+from database_setup import run_migrations
+from product_search import search_products
+from product_catalog import get_product_catalog
+from ui_components import VirtualScrollFrame, ToastNotification, SearchController, LoadingSpinner
+from async_executor import get_background_executor
+from message_outbox import get_message_outbox
+from checkout_service import process_sale
+from data_access import open_stock_alerts, forecast_demand, cart_suggestions, FORECAST_DAYS
+from feature_registry import get_feature_registry
 
 # Core imports with feature flags
 LANG_AVAILABLE = False
 THEMES_AVAILABLE = False
-PDF_AVAILABLE = False
-WHATSAPP_AVAILABLE = False
 LOYALTY_AVAILABLE = False
-ANALYTICS_AVAILABLE = False
-ESTIMATOR_AVAILABLE = False
-BARCODE_AVAILABLE = False
-VOICE_AVAILABLE = False
 
-# Import core modules
+# Import core modules (lightweight, needed for the first window)
 try:
     from language_manager import get_language_manager
     LANG_AVAILABLE = True
@@ -29,75 +37,29 @@ try:
 except ImportError:
     print("Themes not available")
 
-try:
-    import pdf_generator
-    PDF_AVAILABLE = True
-except ImportError:
-    print("PDF generator not available - install reportlab")
-
-try:
-    from whatsapp_service import get_whatsapp_service
-    WHATSAPP_AVAILABLE = True
-except ImportError:
-    print("WhatsApp service not available - install pywhatkit")
-
 try:
     from loyalty_manager import get_loyalty_manager
     LOYALTY_AVAILABLE = True
 except ImportError:
     print("Loyalty manager not available")
 
-try:
-    from analytics_dashboard import get_analytics_dashboard
-    ANALYTICS_AVAILABLE = True
-except ImportError:
-    print("Analytics dashboard not available - install matplotlib and pandas")
-
-try:
-    from construction_estimator import get_construction_estimator
-    ESTIMATOR_AVAILABLE = True
-except ImportError:
-    print("Construction estimator not available")
-
-try:
-    from barcode_scanner import get_barcode_scanner
-    BARCODE_AVAILABLE = True
-except ImportError:
-    print("Barcode scanner not available - install opencv-python and pyzbar")
-
-try:
-    from voice_assistant import get_voice_assistant
-    VOICE_AVAILABLE = True
-except ImportError:
-    print("Voice assistant not available - install SpeechRecognition and pyttsx3")
-
-try:
-    from product_manager import ProductManager
-    PRODUCT_MANAGER_AVAILABLE = True
-except ImportError:
-    PRODUCT_MANAGER_AVAILABLE = False
-    print("Product manager not available")
-
-try:
-    from customer_manager import CustomerManager
-    CUSTOMER_MANAGER_AVAILABLE = True
-except ImportError:
-    CUSTOMER_MANAGER_AVAILABLE = False
-    print("Customer manager not available")
-
-try:
-    from report_generator import ReportGenerator
-    REPORT_GENERATOR_AVAILABLE = True
-except ImportError:
-    REPORT_GENERATOR_AVAILABLE = False
-    print("Report generator not available")
+# Optional modules pull in reportlab, pywhatkit, pandas/matplotlib, cv2 and
+# speech engines. Only locate them now; each is imported on first use.
+FEATURES = get_feature_registry()
+PDF_AVAILABLE = FEATURES.available("pdf")
+WHATSAPP_AVAILABLE = FEATURES.available("whatsapp")
+ANALYTICS_AVAILABLE = FEATURES.available("analytics")
+ESTIMATOR_AVAILABLE = FEATURES.available("estimator")
+BARCODE_AVAILABLE = FEATURES.available("barcode")
+VOICE_AVAILABLE = FEATURES.available("voice")
+PRODUCT_MANAGER_AVAILABLE = FEATURES.available("product_manager")
+CUSTOMER_MANAGER_AVAILABLE = FEATURES.available("customer_manager")
+REPORT_GENERATOR_AVAILABLE = FEATURES.available("reports")
+REFUND_MANAGER_AVAILABLE = FEATURES.available("refunds")
 
-try:
-    from refund_manager import show_refund_manager
-    REFUND_MANAGER_AVAILABLE = True
-except ImportError:
-    REFUND_MANAGER_AVAILABLE = False
-    print("Refund manager not available")
+FORECAST_CHECK_MS = 60 * 60 * 1000  # Re-check daily forecasts hourly (cheap when current)
+ASSOCIATION_CHECK_MS = 60 * 60 * 1000  # Re-check nightly basket mining hourly (same)
+STOCK_DIGEST_CHECK_MS = 60 * 1000  # Send a low-stock digest once its window has passed
 
 # Configuration
 ctk.set_appearance_mode("Dark")
@@ -140,8 +102,9 @@ class BuildSmartPOS(ctk.CTk):
         self.grid_columnconfigure(1, weight=1)  # Cart
         self.grid_rowconfigure(1, weight=1)     # Main content
         
-        # Database Connection
-        self.conn = sqlite3.connect("buildsmart_hardware.db")
+        # Database Connection (pooled, held for the lifetime of the window)
+        run_migrations()
+        self.conn = get_connection()
         self.cursor = self.conn.cursor()
         
         # State
@@ -156,12 +119,99 @@ class BuildSmartPOS(ctk.CTk):
         self.create_product_list_frame()
         self.create_cart_frame()
         
+        # Deliver background task results on the Tk thread
+        get_background_executor().attach(self)
+        
         # Load Initial Data
         self.load_products()
         self.check_low_stock()
         
         # Show license info in status bar
         self.show_license_status()
+        
+        # Runs once the first window has been drawn and can take input
+        self.after_idle(self.on_first_idle)
+    
+    def on_first_idle(self):
+        """Record time-to-interactive and warm up the bill renderer"""
+        self.startup_seconds = time.perf_counter() - STARTUP_STARTED
+        print(f"⏱️ Ready in {self.startup_seconds:.2f}s (time to interactive window)")
+        
+        # Import reportlab off the UI thread so the first checkout doesn't pay for it
+        if PDF_AVAILABLE:
+            get_background_executor().submit(FEATURES.load, "pdf")
+        
+        if "--measure-startup" in sys.argv:
+            self.destroy()
+            return
+        
+        self.refresh_forecasts()
+        self.refresh_associations()
+        self.start_message_dispatcher()
+        self.send_stock_digest()
+    
+    def refresh_forecasts(self):
+        """Keep stored demand forecasts current (runs on the batch thread, then hourly)"""
+        if FEATURES.available("ai"):
+            def job():
+                ai_predictor = FEATURES.load("ai")
+                return ai_predictor.run_forecast_job() if ai_predictor else (False, FEATURES.message("ai"))
+            
+            get_background_executor().submit(
+                job,
+                batch=True,
+                on_success=lambda result: print(f"🔮 {result[1]}"),
+                on_error=lambda e: print(f"Forecast refresh failed: {e}")
+            )
+        self.after(FORECAST_CHECK_MS, self.refresh_forecasts)
+    
+    def start_message_dispatcher(self):
+        """Deliver queued WhatsApp messages (including ones left from the last session)"""
+        if not (WHATSAPP_AVAILABLE and self.config.get("features", {}).get("whatsapp_enabled", True)):
+            return
+        
+        def start():
+            whatsapp_service = FEATURES.load("whatsapp")
+            if whatsapp_service is None:
+                raise RuntimeError(FEATURES.message("whatsapp"))
+            return whatsapp_service.get_whatsapp_service().start_dispatcher()
+        
+        get_background_executor().submit(
+            start,
+            on_success=lambda result: print(f"📱 {result[1]}"),
+            on_error=lambda e: print(f"WhatsApp dispatcher failed to start: {e}")
+        )
+    
+    def refresh_associations(self):
+        """Re-mine frequently co-purchased products once a day (on the batch thread)"""
+        if FEATURES.available("baskets"):
+            def job():
+                basket_miner = FEATURES.load("baskets")
+                return basket_miner.run_association_job() if basket_miner else (False, FEATURES.message("baskets"))
+            
+            get_background_executor().submit(
+                job,
+                batch=True,
+                on_success=lambda result: print(f"🧩 {result[1]}"),
+                on_error=lambda e: print(f"Basket mining failed: {e}")
+            )
+        self.after(ASSOCIATION_CHECK_MS, self.refresh_associations)
+    
+    def send_stock_digest(self):
+        """Queue one WhatsApp digest of recent low-stock alerts when it is due (on a worker)"""
+        if not (WHATSAPP_AVAILABLE and self.config.get("features", {}).get("whatsapp_enabled", True)):
+            return
+        
+        def job():
+            from stock_alerts import run_digest_job
+            return run_digest_job()
+        
+        get_background_executor().submit(
+            job,
+            on_success=lambda result: result[1] and print(f"⚠️ {result[1]}"),
+            on_error=lambda e: print(f"Stock digest failed: {e}")
+        )
+        self.after(STOCK_DIGEST_CHECK_MS, self.send_stock_digest)
     
     def load_config(self):
         """Load application configuration"""
@@ -276,19 +326,24 @@ class BuildSmartPOS(ctk.CTk):
         )
         self.lbl_title.pack(side="left", pady=10)
         
-        # Search box
-        self.search_var = ctk.StringVar()
-        self.search_var.trace("w", lambda *args: self.filter_products())
-        search_entry = ctk.CTkEntry(
+        # Search box (debounced; the query runs on a worker thread)
+        self.search_bar = SearchController(
             header_frame,
-            placeholder_text=translate("search_products"),
-            textvariable=self.search_var,
-            width=300
+            query=self.query_products,
+            on_results=self.show_products,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not load products: {e}"),
+            placeholder=translate("search_products"),
+            fg_color="transparent"
         )
-        search_entry.pack(side="right", padx=10)
+        self.search_bar.pack(side="right", padx=10)
         
-        # Scrollable Container for Products
-        self.scroll_products = ctk.CTkScrollableFrame(self.product_frame)
+        # Scrollable Container for Products (only visible rows are built)
+        self.scroll_products = VirtualScrollFrame(
+            self.product_frame,
+            row_heights={"header": 45, "product": 70},
+            create_row=self.create_product_row,
+            bind_row=self.bind_product_row
+        )
         self.scroll_products.pack(fill="both", expand=True, padx=10, pady=10)
     
     def create_cart_frame(self):
@@ -322,6 +377,10 @@ class BuildSmartPOS(ctk.CTk):
         self.cart_items_frame = ctk.CTkScrollableFrame(self.cart_frame, height=400)
         self.cart_items_frame.pack(fill="x", padx=10, pady=5)
         
+        # Frequently bought together (filled from product_associations)
+        self.suggestions_frame = ctk.CTkFrame(self.cart_frame, fg_color="transparent")
+        self.suggestions_frame.pack(fill="x", padx=10)
+        
         # Total Section
         self.lbl_total = ctk.CTkLabel(
             self.cart_frame,
@@ -363,87 +422,113 @@ class BuildSmartPOS(ctk.CTk):
     
     def load_products(self, search_term=""):
         """Fetch products from DB and display them"""
-        for widget in self.scroll_products.winfo_children():
-            widget.destroy()
-        
         try:
-            if search_term:
-                self.cursor.execute("""
-                    SELECT id, name, price_per_unit, unit_type, stock_quantity, category
-                    FROM products
-                    WHERE LOWER(name) LIKE LOWER(?) OR LOWER(category) LIKE LOWER(?)
-                    ORDER BY name
-                """, (f"%{search_term}%", f"%{search_term}%"))
-            else:
-                self.cursor.execute("""
-                    SELECT id, name, price_per_unit, unit_type, stock_quantity, category
-                    FROM products
-                    ORDER BY category, name
-                """)
-            
-            products = self.cursor.fetchall()
-            
-            current_category = None
-            for product in products:
-                p_id, name, price, unit, stock, category = product
-                
-                # Category header
-                if category and category != current_category:
-                    cat_label = ctk.CTkLabel(
-                        self.scroll_products,
-                        text=f"📦 {category}",
-                        font=("Arial", 14, "bold"),
-                        text_color="#2CC985",
-                        anchor="w"
-                    )
-                    cat_label.pack(fill="x", padx=5, pady=(10, 5))
-                    current_category = category
-                
-                self.create_product_card(p_id, name, price, unit, stock)
+            self.show_products(search_term, self.query_products(search_term))
         except Exception as e:
             messagebox.showerror("Database Error", f"Could not load products: {e}")
     
-    def filter_products(self):
-        """Filter products based on search"""
-        search_term = self.search_var.get()
-        self.load_products(search_term)
+    def query_products(self, search_term):
+        """Build the product list rows for a search (safe to run on a worker thread)"""
+        if search_term.strip():
+            # Own pooled connection: self.cursor belongs to the Tk thread
+            with connection() as conn:
+                products = search_products(
+                    conn.cursor(), search_term,
+                    ('id', 'name', 'price_per_unit', 'unit_type', 'stock_quantity', 'category')
+                )
+        else:
+            products = [
+                (r.id, r.name, r.price_per_unit, r.unit_type, r.stock_quantity, r.category)
+                for r in sorted(get_product_catalog().all_products(),
+                                key=lambda r: (r.category or "", r.name))
+            ]
+        
+        rows = []
+        current_category = None
+        for product in products:
+            category = product[5]
+            
+            # Category header
+            if category and category != current_category:
+                rows.append(("header", category))
+                current_category = category
+            
+            rows.append(("product", product[:5]))
+        return rows
+    
+    def show_products(self, search_term, rows):
+        """Display product list rows"""
+        self.scroll_products.set_rows(rows)
     
-    def create_product_card(self, p_id, name, price, unit, stock):
-        """Create a card widget for a single product"""
-        card = ctk.CTkFrame(self.scroll_products, fg_color="#3A3A3A", corner_radius=8)
-        card.pack(fill="x", pady=5, padx=5)
+    def create_product_row(self, row, kind):
+        """Build the widgets for a recycled product list row"""
+        if kind == "header":
+            row.lbl_category = ctk.CTkLabel(
+                row,
+                text="",
+                font=("Arial", 14, "bold"),
+                text_color="#2CC985",
+                anchor="w"
+            )
+            row.lbl_category.pack(fill="x", padx=5, pady=(10, 5))
+            return
+        
+        card = ctk.CTkFrame(row, fg_color="#3A3A3A", corner_radius=8)
+        card.pack(fill="both", expand=True, pady=5, padx=5)
         
         # Product Name
-        lbl_name = ctk.CTkLabel(card, text=name, font=("Arial", 16, "bold"), anchor="w")
-        lbl_name.pack(side="left", padx=10, pady=10, fill="x", expand=True)
+        row.lbl_name = ctk.CTkLabel(card, text="", font=("Arial", 16, "bold"), anchor="w")
+        row.lbl_name.pack(side="left", padx=10, pady=10, fill="x", expand=True)
         
         # Price & Stock
+        row.lbl_info = ctk.CTkLabel(card, text="", font=("Arial", 12), justify="right")
+        row.lbl_info.pack(side="right", padx=10)
+        
+        # Add to Cart Button (reads whichever product the row shows now)
+        row.btn_add = ctk.CTkButton(
+            card, text="+", width=40, height=40, font=("Arial", 18),
+            command=lambda: self.add_to_cart(*row.product[:3], row.product[4])
+        )
+        row.lbl_out = ctk.CTkLabel(card, text="", text_color="red", font=("Arial", 10, "bold"))
+    
+    def bind_product_row(self, row, kind, data):
+        """Show a category header or product in a recycled row"""
+        if kind == "header":
+            row.lbl_category.configure(text=f"📦 {data}")
+            return
+        
+        p_id, name, price, unit, stock = data
+        row.product = data
+        row.lbl_name.configure(text=name)
+        
         stock_color = "#2CC985" if stock > 10 else "#FFA726" if stock > 0 else "#CF6679"
-        lbl_info = ctk.CTkLabel(
-            card,
+        row.lbl_info.configure(
             text=f"LKR {price:.2f} / {unit}\n{translate('stock')}: {stock}",
-            font=("Arial", 12),
-            text_color=stock_color,
-            justify="right"
+            text_color=stock_color
         )
-        lbl_info.pack(side="right", padx=10)
         
-        # Add to Cart Button
+        row.btn_add.pack_forget()
+        row.lbl_out.pack_forget()
         if stock > 0:
-            btn_add = ctk.CTkButton(
-                card, text="+", width=40, height=40, font=("Arial", 18),
-                command=lambda: self.add_to_cart(p_id, name, price, stock)
-            )
-            btn_add.pack(side="right", padx=5)
+            row.btn_add.pack(side="right", padx=5)
         else:
-            lbl_out = ctk.CTkLabel(
-                card, text=translate("out_of_stock"),
-                text_color="red", font=("Arial", 10, "bold")
-            )
-            lbl_out.pack(side="right", padx=5)
+            row.lbl_out.configure(text=translate("out_of_stock"))
+            row.lbl_out.pack(side="right", padx=5)
     
     def add_to_cart(self, p_id, name, price, max_stock):
         """Add item to cart or increase quantity"""
+        # The card may have been rendered before later sales; use live stock
+        product = get_product_catalog().get(p_id)
+        if product is None:
+            messagebox.showwarning("Unavailable", f"{name} is no longer in the catalog")
+            self.load_products(self.search_bar.get())
+            return
+        max_stock = product.stock_quantity
+        
+        if max_stock <= 0:
+            messagebox.showwarning("Out of Stock", f"{name} is out of stock!")
+            return
+        
         for item in self.cart:
             if item['id'] == p_id:
                 if item['qty'] < max_stock:
@@ -501,6 +586,39 @@ class BuildSmartPOS(ctk.CTk):
             )
         else:
             self.lbl_loyalty.configure(text="")
+        
+        self.update_suggestions()
+    
+    def update_suggestions(self):
+        """Offer products often bought with the cart's contents"""
+        for widget in self.suggestions_frame.winfo_children():
+            widget.destroy()
+        
+        try:
+            suggestions = cart_suggestions(self.cursor, [item['id'] for item in self.cart])
+        except Exception as e:
+            print(f"Cart suggestions unavailable: {e}")
+            return
+        if not suggestions:
+            return
+        
+        ctk.CTkLabel(
+            self.suggestions_frame,
+            text=f"🧩 {translate('often_bought_together', 'Often bought together')}",
+            font=("Arial", 12, "bold"),
+            anchor="w"
+        ).pack(fill="x", pady=(5, 2))
+        
+        for p_id, name, price, stock in suggestions:
+            ctk.CTkButton(
+                self.suggestions_frame,
+                text=f"+ {name}  (LKR {price:.2f})",
+                height=28,
+                anchor="w",
+                fg_color="#3A3A3A",
+                hover_color="#4A4A4A",
+                command=lambda p=(p_id, name, price, stock): self.add_to_cart(*p)
+            ).pack(fill="x", pady=1)
     
     def remove_from_cart(self, item):
         """Remove item from cart"""
@@ -554,108 +672,51 @@ class BuildSmartPOS(ctk.CTk):
                 )
                 self.whatsapp_var.set(False)
         
-        total_amount = sum(item['subtotal'] for item in self.cart)
-        date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         try:
-            # Get customer ID if phone provided
-            customer_id = None
+            # Ask new customers for a name before the sale is written
+            customer_name = None
             if self.current_customer_phone:
                 self.cursor.execute(
-                    "SELECT id FROM customers WHERE phone_number = ?",
+                    "SELECT 1 FROM customers WHERE phone_number = ?",
                     (self.current_customer_phone,)
                 )
-                result = self.cursor.fetchone()
-                if result:
-                    customer_id = result[0]
-                else:
-                    # Create new customer
-                    name = simpledialog.askstring(
+                if not self.cursor.fetchone():
+                    customer_name = simpledialog.askstring(
                         "Customer Name",
                         "Enter customer name (optional):",
                         parent=self
                     )
-                    self.cursor.execute(
-                        "INSERT INTO customers (phone_number, name) VALUES (?, ?)",
-                        (self.current_customer_phone, name or "")
-                    )
-                    customer_id = self.cursor.lastrowid
             
-            # Create Transaction with customer phone for refund lookup
-            self.cursor.execute(
-                """INSERT INTO transactions (date_time, customer_id, customer_phone, total_amount, payment_method) 
-                   VALUES (?, ?, ?, ?, ?)""",
-                (date_time, customer_id, self.current_customer_phone, total_amount, 'Cash')
+            # Customer, transaction, line items, stock and loyalty in one transaction
+            loyalty_on = LOYALTY_AVAILABLE and self.config.get("features", {}).get("loyalty_enabled", True)
+            success, result = process_sale(
+                self.cart,
+                customer_phone=self.current_customer_phone,
+                customer_name=customer_name,
+                payment_method='Cash',
+                points_per_100=get_loyalty_manager().points_per_100 if loyalty_on else 0
             )
-            transaction_id = self.cursor.lastrowid
-            
-            # Add Sales Items & Update Stock
-            for item in self.cart:
-                self.cursor.execute(
-                    """INSERT INTO sales_items 
-                    (transaction_id, product_id, quantity_sold, unit_price, sub_total) 
-                    VALUES (?, ?, ?, ?, ?)""",
-                    (transaction_id, item['id'], item['qty'], item['price'], item['subtotal'])
-                )
-                
-                self.cursor.execute(
-                    "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?",
-                    (item['qty'], item['id'])
-                )
-            
-            self.conn.commit()
-            
-            # Add Loyalty Points
-            if customer_id and LOYALTY_AVAILABLE and self.config.get("features", {}).get("loyalty_enabled", True):
-                loyalty_mgr = get_loyalty_manager()
-                success, result = loyalty_mgr.add_points(
-                    self.current_customer_phone,
-                    total_amount,
-                    transaction_id
-                )
-                if success:
-                    points_msg = f"\n⭐ Earned {result['points_earned']} points!"
-                else:
-                    points_msg = ""
-            else:
-                points_msg = ""
-            
-            # Generate PDF
-            pdf_path = None
-            if PDF_AVAILABLE:
-                pdf_path = pdf_generator.generate_bill(
-                    transaction_id,
-                    self.cart,
-                    total_amount,
-                    date_time,
-                    customer_name=self.current_customer_phone
-                )
-            
-            # Send WhatsApp (async to prevent UI freeze)
-            if self.whatsapp_var.get() and self.current_customer_phone:
-                if WHATSAPP_AVAILABLE and self.config.get("features", {}).get("whatsapp_enabled", True):
-                    whatsapp_service = get_whatsapp_service()
-                    # Send in background thread to avoid freezing UI
-                    success, msg = whatsapp_service.send_invoice_async(
-                        self.current_customer_phone,
-                        transaction_id,
-                        total_amount,
-                        self.cart,
-                        pdf_path
-                    )
-                    whatsapp_msg = f"\n📱 {msg}"
-                else:
-                    whatsapp_msg = ""
-            else:
-                whatsapp_msg = ""
+            if not success:
+                messagebox.showerror("Error", result)
+                return
             
-            # Success message
-            msg = f"{translate('transaction_complete')}"
-            if pdf_path:
-                msg += f"\n{translate('bill_saved_to')} {pdf_path}"
-            msg += points_msg + whatsapp_msg
+            # Slow side effects run on background workers so the cashier
+            # can start the next sale straight away
+            self.start_post_sale_tasks({
+                'transaction_id': result['transaction_id'],
+                'cart': list(self.cart),
+                'total_amount': result['total_amount'],
+                'date_time': result['date_time'],
+                'phone': self.current_customer_phone,
+                'customer_name': result['customer_name'],
+                'send_whatsapp': bool(self.whatsapp_var.get() and self.current_customer_phone)
+            })
             
-            messagebox.showinfo("Success", msg)
+            ToastNotification.show(
+                self, f"{translate('transaction_complete')} (#{result['transaction_id']})", type="success"
+            )
+            if result['points_earned']:
+                ToastNotification.show(self, f"⭐ Earned {result['points_earned']} points!", type="success")
             
             # Reset
             self.cart = []
@@ -666,23 +727,78 @@ class BuildSmartPOS(ctk.CTk):
             self.load_products()
             
         except Exception as e:
-            self.conn.rollback()
             messagebox.showerror("Error", f"Transaction failed: {e}")
     
+    def start_post_sale_tasks(self, sale):
+        """Queue bill rendering and WhatsApp for a committed sale"""
+        executor = get_background_executor()
+        
+        def render_bill():
+            pdf_generator = FEATURES.load("pdf")
+            if pdf_generator is None:
+                raise RuntimeError(FEATURES.message("pdf"))
+            return pdf_generator.generate_bill(
+                sale['transaction_id'], sale['cart'], sale['total_amount'], sale['date_time'],
+                customer_name=sale['customer_name'] or sale['phone']  # As generate_transaction_bill shows it
+            )
+        
+        # Generate PDF, then send WhatsApp (which attaches it)
+        if PDF_AVAILABLE:
+            executor.submit(
+                render_bill,
+                on_success=lambda pdf_path: self.on_bill_ready(sale, pdf_path),
+                on_error=lambda e: self.on_bill_ready(sale, None, e)
+            )
+        else:
+            self.send_whatsapp_invoice(sale, None)
+    
+    def on_bill_ready(self, sale, pdf_path, error=None):
+        """Bill rendering finished (Tk thread)"""
+        if pdf_path:
+            ToastNotification.show(self, f"{translate('bill_saved_to')} {pdf_path}", duration=5000)
+        else:
+            ToastNotification.show(self, f"Bill generation failed: {error or 'unknown error'}", type="error")
+        self.send_whatsapp_invoice(sale, pdf_path)
+    
+    def send_whatsapp_invoice(self, sale, pdf_path):
+        """Queue the WhatsApp invoice if requested for this sale"""
+        if not sale['send_whatsapp']:
+            return
+        if not (WHATSAPP_AVAILABLE and self.config.get("features", {}).get("whatsapp_enabled", True)):
+            return
+        
+        def on_sent(outcome):
+            success, msg = outcome
+            ToastNotification.show(self, f"📱 {msg}", type="success" if success else "error")
+        
+        def send():
+            whatsapp_service = FEATURES.load("whatsapp")
+            if whatsapp_service is None:
+                raise RuntimeError(FEATURES.message("whatsapp"))
+            return whatsapp_service.get_whatsapp_service().send_invoice(
+                sale['phone'], sale['transaction_id'], sale['total_amount'], sale['cart'], pdf_path
+            )
+        
+        get_background_executor().submit(
+            send,
+            on_success=on_sent,
+            on_error=lambda e: ToastNotification.show(self, f"📱 WhatsApp failed: {e}", type="error")
+        )
+    
     def check_low_stock(self):
-        """Check and alert for low stock items"""
+        """Check and alert for low stock items (full reorder list: reports)"""
         try:
-            self.cursor.execute("""
-                SELECT name, stock_quantity, reorder_level
-                FROM products
-                WHERE stock_quantity <= reorder_level
-            """)
-            low_stock_items = self.cursor.fetchall()
-            
+            low_stock_items = open_stock_alerts(self.cursor)
+            demand_by_id = forecast_demand(self.cursor, [row[0] for row in low_stock_items[:5]])
+
             if low_stock_items:
                 msg = f"⚠️ {translate('low_stock_alert')}\n\n"
-                for item in low_stock_items[:5]:
-                    msg += f"• {item[0]}: {item[1]} {translate('stock')}\n"
+                for p_id, name, category, stock, reorder_level, level in low_stock_items[:5]:
+                    demand = demand_by_id.get(p_id, 0)
+                    msg += f"• {name}: {stock} {translate('stock')}"
+                    if demand > stock:
+                        msg += f" (~{demand:.0f} needed in {FORECAST_DAYS} days)"
+                    msg += "\n"
                 
                 if len(low_stock_items) > 5:
                     msg += f"\n...and {len(low_stock_items) - 5} more"
@@ -737,13 +853,25 @@ class BuildSmartPOS(ctk.CTk):
     
     def show_analytics(self):
         """Show analytics dashboard"""
-        if not ANALYTICS_AVAILABLE:
-            messagebox.showinfo("Not Available", "Analytics module not loaded")
+        if not FEATURES.available("analytics"):
+            messagebox.showinfo("Not Available", FEATURES.message("analytics"))
             return
-            
-        analytics = get_analytics_dashboard()
-        summary = analytics.get_sales_summary(30)
         
+        def load_summary():
+            # Importing pandas/matplotlib and querying both happen off the Tk thread
+            analytics_dashboard = FEATURES.load("analytics")
+            if analytics_dashboard is None:
+                raise RuntimeError(FEATURES.message("analytics"))
+            return analytics_dashboard.get_analytics_dashboard().get_sales_summary(30)
+        
+        LoadingSpinner(self, "Loading analytics...").run(
+            load_summary,
+            on_success=self.show_analytics_summary,
+            on_error=lambda e: messagebox.showinfo("Not Available", str(e))
+        )
+    
+    def show_analytics_summary(self, summary):
+        """Display the 30-day sales summary"""
         if summary:
             msg = f"📊 Sales Analytics (Last 30 Days)\n\n"
             msg += f"Today's Sales: LKR {summary['today_sales']:,.2f}\n"
@@ -763,35 +891,39 @@ class BuildSmartPOS(ctk.CTk):
     
     def show_product_manager(self):
         """Show product management interface"""
-        if not PRODUCT_MANAGER_AVAILABLE:
-            messagebox.showinfo("Not Available", "Product manager module not loaded")
+        module = FEATURES.load("product_manager")
+        if module is None:
+            messagebox.showinfo("Not Available", FEATURES.message("product_manager"))
             return
         
-        ProductManager(self, self)
+        module.ProductManager(self, self)
     
     def show_customer_manager(self):
         """Show customer management interface"""
-        if not CUSTOMER_MANAGER_AVAILABLE:
-            messagebox.showinfo("Not Available", "Customer manager module not loaded")
+        module = FEATURES.load("customer_manager")
+        if module is None:
+            messagebox.showinfo("Not Available", FEATURES.message("customer_manager"))
             return
         
-        CustomerManager(self, self)
+        module.CustomerManager(self, self)
     
     def show_reports(self):
         """Show report generator"""
-        if not REPORT_GENERATOR_AVAILABLE:
-            messagebox.showinfo("Not Available", "Report generator module not loaded")
+        module = FEATURES.load("reports")
+        if module is None:
+            messagebox.showinfo("Not Available", FEATURES.message("reports"))
             return
         
-        ReportGenerator(self, self)
+        module.ReportGenerator(self, self)
     
     def show_construction_estimator(self):
         """Show construction estimator"""
-        if not ESTIMATOR_AVAILABLE:
-            messagebox.showinfo("Not Available", "Construction estimator module not loaded")
+        construction_estimator = FEATURES.load("estimator")
+        if construction_estimator is None:
+            messagebox.showinfo("Not Available", FEATURES.message("estimator"))
             return
             
-        estimator = get_construction_estimator()
+        estimator = construction_estimator.get_construction_estimator()
         project_types = estimator.get_project_types()
         
         # Create simple dialog
@@ -851,11 +983,12 @@ class BuildSmartPOS(ctk.CTk):
     
     def show_refund_manager(self):
         """Show refund management interface"""
-        if not REFUND_MANAGER_AVAILABLE:
-            messagebox.showinfo("Not Available", "Refund manager module not loaded")
+        refund_manager = FEATURES.load("refunds")
+        if refund_manager is None:
+            messagebox.showinfo("Not Available", FEATURES.message("refunds"))
             return
         
-        show_refund_manager(self)
+        refund_manager.show_refund_manager(self)
     
     def check_license(self):
         """Check license validity on startup"""
@@ -909,3 +1042,7 @@ class BuildSmartPOS(ctk.CTk):
 if __name__ == "__main__":
     app = BuildSmartPOS()
     app.mainloop()
+    get_background_executor().shutdown()  # Let queued bills finish writing
+    get_message_outbox().stop()  # Unsent messages stay queued for next time
+    get_product_catalog().close()
+    close_all_pools()
@@ -0,0 +1,379 @@
+"""
+Message Outbox for BuildSmartOS
+Persistent outbound message queue drained by one rate-limited dispatcher
+"""
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from db import DB_NAME, connection, transaction
+from message_transports import PermanentSendError
+
+MAX_ATTEMPTS = 6             # Sends before a message is dead-lettered
+BACKOFF_BASE_SECONDS = 30    # First retry delay; doubles per attempt (with jitter)
+BACKOFF_MAX_SECONDS = 30 * 60
+IDLE_POLL_SECONDS = 5.0      # Longest the dispatcher sleeps without being woken
+BATCH_SIZE = 20              # Messages claimed per round trip
+SENT_RETENTION_DAYS = 30     # Delivered messages kept for the metrics/history
+LATENCY_SAMPLES = 500        # Recent transport send times kept in memory
+
+OUTBOX_COLUMNS = ('id', 'recipient', 'kind', 'body', 'attachment_path', 'attempts', 'created_at')
+
+# Oldest open message of each recipient; only these may be sent
+HEAD_OF_LINE = """
+    SELECT MIN(id) AS id FROM message_outbox
+    WHERE status IN ('pending', 'sending')
+    GROUP BY recipient
+"""
+
+
+class OutboxMessage:
+    """One claimed outbox row, as handed to a transport"""
+    __slots__ = OUTBOX_COLUMNS
+
+    def __init__(self, row):
+        for column, value in zip(OUTBOX_COLUMNS, row):
+            setattr(self, column, value)
+
+    def __repr__(self):
+        return f"OutboxMessage(id={self.id}, recipient={self.recipient!r}, kind={self.kind!r})"
+
+
+class TokenBucket:
+    """Allows `burst` sends at once, refilled at rate_per_minute"""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, stop_event):
+        """Take a token, waiting as needed; False if stop_event was set first"""
+        while not stop_event.is_set():
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            stop_event.wait(wait)
+        return False
+
+
+def backoff_seconds(attempts, retry_after=None):
+    """Delay before retry number `attempts` (1-based), at least what the server asked for"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    delay *= random.uniform(0.8, 1.2)  # Spread retries after an outage
+    return max(delay, retry_after or 0)
+
+
+class MessageOutbox:
+    """
+    SQLite-backed queue of outgoing WhatsApp messages.
+
+    Callers enqueue and return immediately; messages survive restarts.
+    A single dispatcher thread claims due messages and hands them to the
+    transport, up to transport.concurrency at a time (each to a different
+    recipient). Messages to one recipient go out in order: only the oldest
+    undelivered message per recipient is ever due, so a message waiting
+    for a retry holds back the ones queued after it. Failures are retried
+    with exponential backoff and dead-lettered after MAX_ATTEMPTS (or at
+    once for permanent errors). Delivery is at-least-once: a message still
+    'sending' when the app closed or crashed is sent again as soon as the
+    dispatcher next starts.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.transport = None
+        self.bucket = None
+        self.counters = {'sent': 0, 'retried': 0, 'dead_lettered': 0}
+        self._lock = threading.Lock()  # Counters are updated by sender threads
+        self.send_seconds = deque(maxlen=LATENCY_SAMPLES)
+
+    # ---- producers ----
+
+    def enqueue(self, recipient, body, kind="text", attachment_path=None, dedupe_key=None):
+        """
+        Queue a message for delivery.
+
+        dedupe_key (e.g. 'invoice:123') makes repeated enqueues of the same
+        message a no-op.
+
+        Returns:
+            (success, message_id or error message)
+        """
+        try:
+            now = time.time()
+            with transaction(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO message_outbox (recipient, kind, body, attachment_path, dedupe_key,
+                                                next_attempt_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(dedupe_key) DO NOTHING
+                """, (recipient, kind, body, attachment_path, dedupe_key, now, now))
+                if cursor.rowcount:
+                    message_id = cursor.lastrowid
+                else:
+                    cursor.execute("SELECT id FROM message_outbox WHERE dedupe_key = ?", (dedupe_key,))
+                    message_id = cursor.fetchone()[0]
+            self._wake.set()
+            return True, message_id
+        except Exception as e:
+            return False, f"Could not queue message: {e}"
+
+    # ---- dispatcher side ----
+
+    def claim_due(self, limit=BATCH_SIZE):
+        """Mark the due head-of-line messages as 'sending' and return them"""
+        now = time.time()
+        with transaction(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {', '.join('o.' + c for c in OUTBOX_COLUMNS)}
+                FROM ({HEAD_OF_LINE}) head
+                JOIN message_outbox o ON o.id = head.id
+                WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+                ORDER BY o.next_attempt_at, o.id
+                LIMIT ?
+            """, (now, limit))
+            messages = [OutboxMessage(row) for row in cursor.fetchall()]
+            cursor.executemany(
+                "UPDATE message_outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                [(now, m.id) for m in messages]
+            )
+        return messages
+
+    def seconds_until_due(self, cap=IDLE_POLL_SECONDS):
+        """How long the dispatcher may sleep before the next retry is due"""
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            # Messages queued behind a backing-off one aren't due, whatever their time
+            cursor.execute(f"""
+                SELECT MIN(o.next_attempt_at)
+                FROM ({HEAD_OF_LINE}) head
+                JOIN message_outbox o ON o.id = head.id
+                WHERE o.status = 'pending'
+            """)
+            next_due = cursor.fetchone()[0]
+        if next_due is None:
+            return cap
+        return max(0.0, min(cap, next_due - time.time()))
+
+    def mark_sent(self, message):
+        with transaction(self.db_name) as conn:
+            conn.execute("""
+                UPDATE message_outbox
+                SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL
+                WHERE id = ?
+            """, (time.time(), message.id))
+        with self._lock:
+            self.counters['sent'] += 1
+
+    def mark_failed(self, message, error, permanent=False):
+        """Schedule a retry, or dead-letter the message if it can't succeed"""
+        attempts = message.attempts + 1
+        dead = permanent or attempts >= MAX_ATTEMPTS
+        next_attempt = time.time() + backoff_seconds(attempts, getattr(error, 'retry_after', None))
+        with transaction(self.db_name) as conn:
+            conn.execute("""
+                UPDATE message_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, ('dead' if dead else 'pending', attempts, next_attempt, str(error)[:500], message.id))
+        with self._lock:
+            self.counters['dead_lettered' if dead else 'retried'] += 1
+
+    def release(self, messages):
+        """Return claimed but unsent messages to the queue (dispatcher stopping)"""
+        with transaction(self.db_name) as conn:
+            conn.executemany("UPDATE message_outbox SET status = 'pending' WHERE id = ? AND status = 'sending'",
+                             [(m.id,) for m in messages])
+
+    def recover(self):
+        """
+        Requeue claims left by the previous session and prune old delivered
+        messages. Called as the dispatcher starts; being the only dispatcher,
+        every 'sending' row then is one whose send was cut off.
+        """
+        now = time.time()
+        with transaction(self.db_name) as conn:
+            conn.execute("UPDATE message_outbox SET status = 'pending' WHERE status = 'sending'")
+            conn.execute("DELETE FROM message_outbox WHERE status = 'sent' AND sent_at < ?",
+                         (now - SENT_RETENTION_DAYS * 86400,))
+
+    def deliver(self, message):
+        """Send one claimed message and record the outcome"""
+        started = time.perf_counter()
+        try:
+            self.transport.send(message)
+        except PermanentSendError as e:
+            self.mark_failed(message, e, permanent=True)
+        except Exception as e:
+            self.mark_failed(message, e)
+        else:
+            self.mark_sent(message)
+        finally:
+            self.send_seconds.append(time.perf_counter() - started)
+
+    def send_batch(self, batch, senders=None):
+        """
+        Deliver claimed messages, in parallel on `senders` if given. A batch
+        holds at most one message per recipient, so parallel sends keep each
+        recipient's order. Returns False if stopped part-way (the rest are
+        released).
+        """
+        in_flight = []
+        try:
+            for i, message in enumerate(batch):
+                if not self.bucket.acquire(self._stop):
+                    self.release(batch[i:])
+                    return False
+                if senders is None:
+                    self.deliver(message)
+                else:
+                    in_flight.append(senders.submit(self.deliver, message))
+        finally:
+            wait(in_flight)
+            for future in in_flight:
+                if future.exception():
+                    print(f"Outbox send error: {future.exception()}")
+        return True
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception as e:
+            print(f"Outbox recovery failed: {e}")
+
+        concurrency = max(1, getattr(self.transport, 'concurrency', 1))
+        senders = None
+        if concurrency > 1:
+            senders = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="buildsmart-send")
+        try:
+            while not self._stop.is_set():
+                try:
+                    batch = self.claim_due(max(BATCH_SIZE, concurrency))
+                    if not batch:
+                        self._wake.wait(self.seconds_until_due())
+                        self._wake.clear()
+                        continue
+                    if not self.send_batch(batch, senders):
+                        return
+                except Exception as e:
+                    # Database busy/locked etc.; keep the dispatcher alive
+                    print(f"Outbox dispatcher error: {e}")
+                    self._stop.wait(IDLE_POLL_SECONDS)
+        finally:
+            if senders is not None:
+                senders.shutdown(wait=True)
+
+    def start(self, transport, rate_per_minute=None, burst=None):
+        """Start the dispatcher thread (once); rate defaults to the transport's"""
+        if self._thread is not None and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            self._thread.join()  # A stopping dispatcher still owns its claims
+        self.transport = transport
+        self.bucket = TokenBucket(rate_per_minute or transport.rate_per_minute, burst or transport.burst)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="buildsmart-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop after the message being sent; undelivered messages stay queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---- inspection ----
+
+    def requeue_dead(self, message_ids=None):
+        """Give dead-lettered messages (all, or the given ids) a fresh set of attempts"""
+        query = "UPDATE message_outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'"
+        params = [time.time()]
+        if message_ids is not None:
+            message_ids = list(message_ids)
+            if not message_ids:
+                return 0
+            query += f" AND id IN ({', '.join('?' * len(message_ids))})"
+            params.extend(message_ids)
+        with transaction(self.db_name) as conn:
+            count = conn.execute(query, params).rowcount
+        self._wake.set()
+        return count
+
+    def metrics(self):
+        """
+        Queue depth and latency figures.
+
+        Returns:
+            dict with pending, due, sending, dead, oldest_pending_seconds,
+            delivery_p50/p95 (enqueue to delivery, last LATENCY_SAMPLES
+            messages), send_p50/p95 (transport call, this session) and the
+            sent/retried/dead_lettered counters for this session
+        """
+        now = time.time()
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(SUM(status = 'pending'), 0),
+                       COALESCE(SUM(status = 'pending' AND next_attempt_at <= ?), 0),
+                       COALESCE(SUM(status = 'sending'), 0),
+                       COALESCE(SUM(status = 'dead'), 0),
+                       MIN(CASE WHEN status IN ('pending', 'sending') THEN created_at END)
+                FROM message_outbox
+                WHERE status != 'sent'
+            """, (now,))
+            pending, due, sending, dead, oldest = cursor.fetchone()
+            cursor.execute("""
+                SELECT sent_at - created_at FROM message_outbox
+                WHERE status = 'sent' ORDER BY sent_at DESC LIMIT ?
+            """, (LATENCY_SAMPLES,))
+            delivery = sorted(row[0] for row in cursor.fetchall())
+
+        send = sorted(self.send_seconds)
+        return {
+            'pending': pending,
+            'due': due,
+            'sending': sending,
+            'dead': dead,
+            'oldest_pending_seconds': now - oldest if oldest is not None else 0.0,
+            'delivery_p50': statistics.median(delivery) if delivery else None,
+            'delivery_p95': delivery[int(len(delivery) * 0.95)] if delivery else None,
+            'send_p50': statistics.median(send) if send else None,
+            'send_p95': send[int(len(send) * 0.95)] if send else None,
+            **self.counters,
+        }
+
+
+# Global instance
+_message_outbox = None
+
+def get_message_outbox():
+    """Get or create the shared message outbox"""
+    global _message_outbox
+    if _message_outbox is None:
+        _message_outbox = MessageOutbox()
+    return _message_outbox
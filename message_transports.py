@@ -0,0 +1,223 @@
+"""
+Message Transports for BuildSmartOS
+Ways to deliver an outbox message: WhatsApp Web (pywhatkit), an HTTP API, or an in-memory stub
+"""
+import os
+import threading
+import time
+
+
+class TransientSendError(Exception):
+    """Delivery failed but may succeed later (network, rate limit, server error)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds the remote side asked us to wait
+
+
+class PermanentSendError(Exception):
+    """Delivery can never succeed (bad number, rejected content); dead-letter it"""
+
+
+class StubTransport:
+    """
+    Records messages instead of sending them (tests, benchmarks, demos).
+
+    fail_next(n) makes the next n sends raise; latency simulates a slow API.
+    """
+
+    name = "stub"
+    rate_per_minute = 6000
+    burst = 100
+    concurrency = 8
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+        self._failures = []
+        self._lock = threading.Lock()
+
+    def fail_next(self, count=1, permanent=False, retry_after=None):
+        with self._lock:
+            self._failures.extend([(permanent, retry_after)] * count)
+
+    def send(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._failures:
+                permanent, retry_after = self._failures.pop(0)
+                if permanent:
+                    raise PermanentSendError("Stub rejected the message")
+                raise TransientSendError("Stub send failed", retry_after)
+            self.sent.append(message)
+
+
+class PyWhatKitTransport:
+    """
+    Sends through WhatsApp Web in the default browser.
+
+    One browser tab can only send one message at a time, and each send
+    waits for the page to load, so the rate is kept low. Attachments are
+    not supported; the text is sent alone.
+    """
+
+    name = "pywhatkit"
+    rate_per_minute = 3
+    burst = 1
+    concurrency = 1  # One browser tab
+
+    def __init__(self, wait_time=15):
+        import pywhatkit  # Slow import (pulls in pyautogui); done once, on the dispatcher
+        self.kit = pywhatkit
+        self.wait_time = wait_time
+
+    def send(self, message):
+        try:
+            self.kit.sendwhatmsg_instantly(message.recipient, message.body, wait_time=self.wait_time,
+                                           tab_close=True, close_time=3)
+        except Exception as e:
+            if type(e).__name__ == "CountryCodeException":
+                raise PermanentSendError(f"Invalid phone number: {message.recipient}")
+            error = str(e).lower()
+            if "web.whatsapp.com" in error:
+                raise TransientSendError("WhatsApp Web not accessible. Please ensure it is logged in.")
+            raise TransientSendError(f"WhatsApp send error: {e}")
+
+
+class HttpTransport:
+    """
+    Sends through a WhatsApp Business (Cloud API style) HTTP endpoint.
+
+    POST {api_url}/{phone_number_id}/messages with a bearer token. One
+    keep-alive session, with a connection pool sized for `concurrency`
+    parallel sends, is shared by the dispatcher's sender threads. PDF
+    attachments are uploaded to /media and sent as a document message.
+    A text too long for a caption goes out first as its own message; it
+    is remembered once delivered, so the outbox's retries of the document
+    don't repeat it.
+    """
+
+    name = "http"
+    rate_per_minute = 600
+    burst = 20
+    caption_limit = 1024  # Longer texts go out as a message before the document
+
+    def __init__(self, api_url, phone_number_id, api_key, timeout=15, concurrency=4):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.exceptions import NewConnectionError
+        self.requests = requests
+        self.NewConnectionError = NewConnectionError
+        base_url = f"{api_url.rstrip('/')}/{phone_number_id}"
+        self.messages_url = f"{base_url}/messages"
+        self.media_url = f"{base_url}/media"
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f"Bearer {api_key}"})
+        # Retries are the outbox's job (with backoff); the pool just keeps sockets warm
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Ids of long-text messages whose text went out before their document did.
+        # Set operations are atomic, and a message is only sent by one thread at a time
+        self.text_sent = set()
+
+    def send(self, message):
+        to = message.recipient.lstrip('+')
+        attachment = message.attachment_path
+        if not (attachment and os.path.exists(attachment)):
+            self.post(self.messages_url, json=self.text_payload(to, message.body))
+            return
+
+        document = {'filename': os.path.basename(attachment)}
+        if len(message.body) <= self.caption_limit:
+            document['caption'] = message.body
+        elif message.id not in self.text_sent:
+            self.post(self.messages_url, json=self.text_payload(to, message.body))
+            self.text_sent.add(message.id)
+        try:
+            document['id'] = self.upload(attachment)
+            self.post(self.messages_url, json={
+                'messaging_product': 'whatsapp', 'to': to, 'type': 'document', 'document': document
+            })
+        except TransientSendError:
+            raise  # The outbox retries; the text stays marked as sent
+        except Exception:
+            self.text_sent.discard(message.id)  # Dead-lettered
+            raise
+        self.text_sent.discard(message.id)
+
+    def text_payload(self, to, body):
+        return {'messaging_product': 'whatsapp', 'to': to, 'type': 'text', 'text': {'body': body}}
+
+    def upload(self, path):
+        """Upload a PDF; returns the media id"""
+        with open(path, 'rb') as f:
+            content = f.read()  # Bills are small; bytes can be resent if the connection drops
+        response = self.post(self.media_url, data={'messaging_product': 'whatsapp', 'type': 'application/pdf'},
+                             files={'file': (os.path.basename(path), content, 'application/pdf')})
+        try:
+            return response.json()['id']
+        except (ValueError, KeyError):
+            raise TransientSendError(f"Unexpected media upload response: {response.text[:200]}")
+
+    def post(self, url, **kwargs):
+        for attempt in range(2):
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+                break
+            except self.requests.ConnectionError as e:
+                # Retry once only if the request never went out; a connection that
+                # drops after sending may already have delivered it (the outbox retries)
+                if attempt or not self.never_sent(e):
+                    raise TransientSendError(f"WhatsApp API unreachable: {e}")
+            except self.requests.RequestException as e:
+                raise TransientSendError(f"WhatsApp API unreachable: {e}")
+        self.check(response)
+        return response
+
+    def never_sent(self, error):
+        """True if a connection error happened while connecting, before the request was written"""
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(error, self.requests.ConnectTimeout) or isinstance(reason, self.NewConnectionError)
+
+    def check(self, response):
+        """Map an API response to success, a retry or a dead letter"""
+        if response.status_code < 300:
+            return
+        detail = response.text[:200]
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get('Retry-After')
+            raise TransientSendError(f"WhatsApp API {response.status_code}: {detail}",
+                                     float(retry_after) if retry_after and retry_after.isdigit() else None)
+        raise PermanentSendError(f"WhatsApp API {response.status_code}: {detail}")
+
+    def close(self):
+        self.session.close()
+
+
+def create_transport(config):
+    """
+    Transport named by config['whatsapp']['transport'] (default 'pywhatkit').
+
+    Raises:
+        ImportError if the transport's package isn't installed,
+        ValueError for an unknown name or missing API settings
+    """
+    settings = config.get("whatsapp", {})
+    name = settings.get("transport", "pywhatkit")
+    if name == "pywhatkit":
+        return PyWhatKitTransport(wait_time=settings.get("send_delay_seconds", 15))
+    if name == "http":
+        api_key = config.get("api_keys", {}).get("whatsapp_api_key")
+        if not api_key or not settings.get("phone_number_id"):
+            raise ValueError("HTTP transport needs api_keys.whatsapp_api_key and whatsapp.phone_number_id")
+        return HttpTransport(settings.get("api_url", "https://graph.facebook.com/v19.0"),
+                             settings["phone_number_id"], api_key,
+                             concurrency=settings.get("max_concurrent_sends", 4))
+    if name == "stub":
+        return StubTransport()
+    raise ValueError(f"Unknown WhatsApp transport: {name}")
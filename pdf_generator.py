@@ -1,254 +1,445 @@
-from reportlab.lib.pagesizes import letter, A4
+"""
+PDF Bill Generator for BuildSmartOS
+Invoices drawn by one reusable BillRenderer: cached config, static branding as form XObjects, vector QR code
+"""
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.utils import ImageReader
+from reportlab.graphics.barcode.qrencoder import QRCode, QRErrorCorrectLevel
 import os
 import json
-from datetime import datetime
-import io
-
-try:
-    import qrcode
-    QR_AVAILABLE = True
-except ImportError:
-    QR_AVAILABLE = False
-    print("⚠️  qrcode not available - install with 'pip install qrcode[pil]' for QR code support")
-
-def load_config():
-    """Load configuration"""
-    try:
-        with open("config.json", 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {}
-
-def generate_qr_code(data):
-    """Generate QR code image in memory."""
-    if not QR_AVAILABLE:
-        return None
-    
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to ImageReader for reportlab
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        return ImageReader(img_buffer)
-    except Exception as e:
-        print(f"Error generating QR code: {e}")
-        return None
-
-def generate_bill(transaction_id, cart_items, total_amount, date_time, customer_name=None, 
+import threading
+
+from db import DB_NAME, connection
+from data_access import iter_pages, sale_item_page
+
+# Write compressed streams as binary; ASCII85 only makes the file 7-bit safe,
+# costs about a quarter of the render time and adds 25% to the size
+rl_config.useA85 = 0
+
+BILLS_DIR = "bills"
+QR_SIZE = 80    # Points; the verification code's side, quiet zone included
+QR_BORDER = 4  # Quiet zone in modules (the minimum scanners expect)
+QR_MASK = 0    # Fixed data mask (see qr_modules)
+
+# Colors
+PRIMARY_COLOR = (44/255, 201/255, 133/255)  # Green
+DARK_GRAY = (0.2, 0.2, 0.2)
+LIGHT_GRAY = (0.95, 0.95, 0.95)
+
+# Built-in PDF fonts (no embedding or registration needed)
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+FONT_OBLIQUE = "Helvetica-Oblique"
+
+# Page layout (points from the bottom of the page)
+ROW_HEIGHT = 22      # Item table rows
+ROWS_BOTTOM = 120    # Lowest row baseline; below it sit the carried-forward line and footer
+FORWARD_Y = 95       # Carried-forward subtotal
+PAGE_NUMBER_Y = 78   # "Page n of N", just above the footer band
+TOTALS_HEIGHT = 107  # Totals block under the last row (subtotal, discount, grand total)
+
+TERMS = (
+    "• All sales are final unless product is defective",
+    "• Returns accepted within 7 days with original receipt",
+    "• Warranty terms as per manufacturer",
+)
+
+
+def qr_modules(data):
+    """
+    QR code (error correction L) for data, as rows of dark/light booleans.
+
+    Scanners read the mask from the code itself, so any mask is valid;
+    trying all eight for the best score would cost about 6 ms per bill.
+    """
+    qr = QRCode(None, QRErrorCorrectLevel.L)
+    qr.addData(data)
+    qr.version = qr.calculate_version()
+    qr.makeImpl(False, QR_MASK)
+    return qr.modules
+
+
+def draw_qr_code(c, data, x, y, size=QR_SIZE, border=QR_BORDER):
+    """
+    Draw a QR code as one vector path with its lower-left corner at (x, y).
+
+    Dark modules in a row are merged into runs, so a bill's code is a few
+    hundred rectangles in a single fill, with no image to encode or embed.
+    """
+    modules = qr_modules(data)
+    count = len(modules)
+    cell = size / (count + 2 * border)
+    path = c.beginPath()
+    for row_index, row in enumerate(modules):
+        top = y + size - (border + row_index) * cell
+        col = 0
+        while col < count:
+            if row[col]:
+                start = col
+                while col < count and row[col]:
+                    col += 1
+                path.rect(x + (border + start) * cell, top - cell, (col - start) * cell, cell)
+            else:
+                col += 1
+    c.drawPath(path, stroke=0, fill=1)
+
+
+class BillRenderer:
+    """
+    Draws invoices; one instance is shared by every bill.
+
+    config.json is read once and re-read only when the file changes. The
+    branded header, footer and terms never change between bills, so each
+    document draws them once as form XObjects (named PDF content the
+    pages reference) instead of repeating the drawing operators.
+    """
+
+    def __init__(self, config_file="config.json", page_size=letter):
+        self.config_file = config_file
+        self.page_size = page_size
+        self._config = {}
+        self._config_mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def business(self):
+        """Business details from config.json, reloaded when the file changes"""
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._config_mtime:
+            with self._lock:
+                try:
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        self._config = json.load(f)
+                except (OSError, ValueError):
+                    self._config = {}
+                self._config_mtime = mtime
+        return self._config.get('business', {})
+
+    def define_forms(self, c):
+        """Draw the static regions of this document once, as named forms"""
+        width, height = self.page_size
+        business = self.business
+
+        # Header Box with business details and invoice title
+        c.beginForm("bill_header")
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.rect(0, height - 130, width, 130, fill=1, stroke=0)
+
+        c.setFillColorRGB(1, 1, 1)  # White text
+        c.setFont(FONT_BOLD, 26)
+        c.drawString(50, height - 50, business.get('name', 'BuildSmart Hardware Store'))
+
+        c.setFont(FONT, 11)
+        c.drawString(50, height - 75, business.get('address', '123 Main Street, Ratnapura'))
+        c.drawString(50, height - 92, f"📞 {business.get('phone', '077-1234567')}")
+        if business.get('email'):
+            c.drawString(50, height - 109, f"📧 {business.get('email')}")
+
+        inv_box_x = width - 200
+        c.roundRect(inv_box_x, height - 100, 150, 40, 5, fill=1, stroke=0)
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.setFont(FONT_BOLD, 18)
+        c.drawCentredString(inv_box_x + 75, height - 75, "INVOICE")
+        c.endForm()
+
+        # Footer with branding
+        footer_y = 80
+        c.beginForm("bill_footer")
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.rect(0, 0, width, 70, fill=1, stroke=0)
+
+        c.setFillColorRGB(1, 1, 1)
+        c.setFont(FONT_BOLD, 12)
+        c.drawCentredString(width/2, footer_y - 20, "Thank You for Your Business!")
+        c.setFont(FONT, 9)
+        c.drawCentredString(width/2, footer_y - 35, "Powered by BuildSmart OS - Sri Lanka's Smart Hardware POS")
+        c.drawCentredString(width/2, footer_y - 48, "For support: info@buildsmart.lk | +94 77 123 4567")
+        c.endForm()
+
+        # Terms & Conditions, drawn with its first line at y = 0
+        c.beginForm("bill_terms")
+        c.setFillColorRGB(*DARK_GRAY)
+        c.setFont(FONT_BOLD, 9)
+        c.drawString(50, 0, "Terms & Conditions:")
+        c.setFont(FONT, 8)
+        for i, line in enumerate(TERMS):
+            c.drawString(50, -15 - 12 * i, line)
+        c.endForm()
+
+    def draw_form_at(self, c, name, x, y):
+        """Place a form drawn at the origin at (x, y)"""
+        c.saveState()
+        c.translate(x, y)
+        c.doForm(name)
+        c.restoreState()
+
+    def draw_table_header(self, c, y):
+        """Item table header with its text baseline at y + 5; returns the first row's y"""
+        width = self.page_size[0]
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.roundRect(50, y - 5, width - 100, 25, 3, fill=1, stroke=0)
+
+        c.setFillColorRGB(1, 1, 1)
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(60, y + 5, "Item Description")
+        c.drawString(320, y + 5, "Qty")
+        c.drawString(400, y + 5, "Unit Price")
+        c.drawString(500, y + 5, "Total")
+        c.setFont(FONT, 10)
+        return y - 30
+
+    def finish_page(self, c, carried_forward=None):
+        """Footer, page number and (unless this is the last page) the running subtotal"""
+        width = self.page_size[0]
+        c.setFillColorRGB(*DARK_GRAY)
+        if carried_forward is not None:
+            c.setStrokeColorRGB(*DARK_GRAY)
+            c.setLineWidth(1)
+            c.line(350, FORWARD_Y + 15, width - 50, FORWARD_Y + 15)
+            c.setFont(FONT_BOLD, 10)
+            c.drawString(370, FORWARD_Y, "Carried forward:")
+            c.drawRightString(width - 60, FORWARD_Y, f"LKR {carried_forward:,.2f}")
+
+        # "Page n of " now; the total is a form filled in once the last page is known
+        label = f"Page {c.getPageNumber()} of "
+        c.setFont(FONT, 8)
+        c.drawString(50, PAGE_NUMBER_Y, label)
+        self.draw_form_at(c, "bill_page_count", 50 + c.stringWidth(label, FONT, 8), PAGE_NUMBER_Y)
+
+        c.doForm("bill_footer")
+        c.showPage()
+
+    def start_continuation_page(self, c, transaction_id):
+        """Branding and invoice number on a follow-on page; returns the next free y"""
+        c.doForm("bill_header")
+        y = self.page_size[1] - 165
+        c.setFillColorRGB(*DARK_GRAY)
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(50, y, f"Invoice No:")
+        c.setFont(FONT, 11)
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.drawString(150, y, f"#{str(transaction_id).zfill(6)} (continued)")
+        c.setFillColorRGB(*DARK_GRAY)
+        return y - 45
+
+    def render(self, filename, transaction_id, cart_items, total_amount, date_time, customer_name=None,
+               discount=0, payment_method='Cash'):
+        """
+        Draw one bill to filename.
+
+        cart_items may be any iterable (a cart list, or a generator reading
+        the lines from the database); it is consumed once, row by row. When
+        a page fills up its subtotal is carried forward to the next page,
+        which repeats the table header. The page count is a form defined
+        after the last page, so no second pass is needed.
+        """
+        c = canvas.Canvas(filename, pagesize=self.page_size)
+        width, height = self.page_size
+        self.define_forms(c)
+        c.doForm("bill_header")
+
+        # QR Code for verification
+        c.setFillColorRGB(0, 0, 0)
+        draw_qr_code(c, f"BuildSmart-{transaction_id}-{date_time}-{total_amount}",
+                     width - 130, height - 240)
+        c.setFillColorRGB(*DARK_GRAY)
+        c.setFont(FONT, 8)
+        c.drawCentredString(width - 90, height - 250, "Scan to verify")
+
+        # Bill Details Section
+        y = height - 165
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(50, y, f"Invoice No:")
+        c.setFont(FONT, 11)
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.drawString(150, y, f"#{str(transaction_id).zfill(6)}")
+        c.setFillColorRGB(*DARK_GRAY)
+
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(320, y, f"Date:")
+        c.setFont(FONT, 11)
+        c.drawString(370, y, date_time)
+
+        y -= 22
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(50, y, f"Payment Method:")
+        c.setFont(FONT, 11)
+        c.drawString(180, y, payment_method)
+
+        if customer_name:
+            c.setFont(FONT_BOLD, 11)
+            c.drawString(320, y, f"Customer:")
+            c.setFont(FONT, 11)
+            c.drawString(400, y, str(customer_name)[:25])
+
+        y -= 35
+        c.setStrokeColorRGB(*DARK_GRAY)
+        c.setLineWidth(2)
+        c.line(50, y, width - 140, y)  # Stops short of the QR code, which it would cross
+        c.setLineWidth(1)
+
+        # Items with alternating colors, a page at a time
+        y = self.draw_table_header(c, y - 30)
+        running_total = 0
+
+        for i, item in enumerate(cart_items):
+            if y < ROWS_BOTTOM:
+                self.finish_page(c, carried_forward=running_total)
+                y = self.draw_table_header(c, self.start_continuation_page(c, transaction_id))
+                c.setFillColorRGB(*DARK_GRAY)
+                c.setFont(FONT_OBLIQUE, 10)
+                c.drawString(60, y, "Brought forward")
+                c.drawString(505, y, f"LKR {running_total:,.2f}")
+                c.setFont(FONT, 10)
+                y -= ROW_HEIGHT
+
+            if i % 2 == 0:
+                c.setFillColorRGB(*LIGHT_GRAY)
+                c.roundRect(50, y - 5, width - 100, 20, 2, fill=1, stroke=0)
+
+            c.setFillColorRGB(*DARK_GRAY)
+            name = str(item.get('name', ''))[:40]  # Truncate long names
+            qty = item.get('qty', 0)
+            price = item.get('price', 0)
+            subtotal = item.get('subtotal', 0)
+
+            c.drawString(60, y, name)
+            c.drawString(330, y, f"{qty:g}")
+            c.drawString(405, y, f"LKR {price:,.2f}")
+            c.drawString(505, y, f"LKR {subtotal:,.2f}")
+            running_total += subtotal
+            y -= ROW_HEIGHT
+
+        # Totals go on a page of their own if the last rows left no room
+        if y - TOTALS_HEIGHT < FORWARD_Y:
+            self.finish_page(c, carried_forward=running_total)
+            y = self.start_continuation_page(c, transaction_id)
+
+        # Totals Box
+        y -= 25
+        c.setStrokeColorRGB(*DARK_GRAY)
+        c.setLineWidth(1)
+        c.line(350, y, width - 50, y)
+
+        y -= 25
+        c.setFont(FONT, 11)
+        c.drawString(370, y, "Subtotal:")
+        c.drawRightString(width - 60, y, f"LKR {(total_amount + discount):,.2f}")
+
+        if discount > 0:
+            y -= 22
+            c.drawString(370, y, "Discount:")
+            c.setFillColorRGB(0.8, 0.1, 0.1)
+            c.drawRightString(width - 60, y, f"- LKR {discount:,.2f}")
+            c.setFillColorRGB(*DARK_GRAY)
+
+        y -= 5
+        c.setLineWidth(2)
+        c.line(350, y, width - 50, y)
+
+        y -= 30
+        c.setFont(FONT_BOLD, 14)
+        c.drawString(370, y, "GRAND TOTAL:")
+        c.setFillColorRGB(*PRIMARY_COLOR)
+        c.setFont(FONT_BOLD, 16)
+        c.drawRightString(width - 60, y, f"LKR {total_amount:,.2f}")
+        c.setFillColorRGB(*DARK_GRAY)
+
+        y -= 50
+        if y > 150:  # Only if there's space
+            self.draw_form_at(c, "bill_terms", 0, y)
+
+        self.finish_page(c)
+
+        c.beginForm("bill_page_count")
+        c.setFillColorRGB(*DARK_GRAY)
+        c.setFont(FONT, 8)
+        c.drawString(0, 0, str(c.getPageNumber() - 1))
+        c.endForm()
+        c.save()
+        return filename
+
+
+# Global instance
+_bill_renderer = None
+
+def get_bill_renderer():
+    """Get or create the global bill renderer"""
+    global _bill_renderer
+    if _bill_renderer is None:
+        _bill_renderer = BillRenderer()
+    return _bill_renderer
+
+
+def generate_bill(transaction_id, cart_items, total_amount, date_time, customer_name=None,
                   discount=0, language='english', payment_method='Cash'):
     """
     Generates a professional PDF bill with QR code verification.
-    
+
     Args:
         transaction_id: Transaction ID
-        cart_items: List of dicts with name, qty, price, subtotal
+        cart_items: Dicts with name, qty, price, subtotal (a list, or any
+                    iterable - it is read once, so a generator keeps memory flat)
         total_amount: Final total amount after discount
         date_time: Transaction date/time
         customer_name: Customer name (optional)
         discount: Discount amount
         language: Invoice language
         payment_method: Payment method used
-    
+
     Returns:
         str: Path to generated PDF file
     """
-    if not os.path.exists("bills"):
-        os.makedirs("bills")
-
-    config = load_config()
-    business = config.get('business', {})
-
-    filename = f"bills/bill_{transaction_id}.pdf"
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-
-    # Colors
-    primary_color = (44/255, 201/255, 133/255)  # Green
-    dark_gray = (0.2, 0.2, 0.2)
-    light_gray = (0.95, 0.95, 0.95)
-
-    # Header Box with gradient effect
-    c.setFillColorRGB(*primary_color)
-    c.rect(0, height - 130, width, 130, fill=1, stroke=0)
-    
-    c.setFillColorRGB(1, 1, 1)  # White text
-    c.setFont("Helvetica-Bold", 26)
-    c.drawString(50, height - 50, business.get('name', 'BuildSmart Hardware Store'))
-    
-    c.setFont("Helvetica", 11)
-    c.drawString(50, height - 75, business.get('address', '123 Main Street, Ratnapura'))
-    c.drawString(50, height - 92, f"📞 {business.get('phone', '077-1234567')}")
-    if business.get('email'):
-        c.drawString(50, height - 109, f"📧 {business.get('email')}")
-    
-    # Invoice Title with box
-    inv_box_x = width - 200
-    c.setFillColorRGB(1, 1, 1)
-    c.roundRect(inv_box_x, height - 100, 150, 40, 5, fill=1, stroke=0)
-    c.setFillColorRGB(*primary_color)
-    c.setFont("Helvetica-Bold", 18)
-    c.drawCentredString(inv_box_x + 75, height - 75, "INVOICE")
-
-    # Reset to black
-    c.setFillColorRGB(*dark_gray)
-
-    # QR Code for verification (if available)
-    if QR_AVAILABLE:
-        qr_data = f"BuildSmart-{transaction_id}-{date_time}-{total_amount}"
-        qr_image = generate_qr_code(qr_data)
-        if qr_image:
-            qr_size = 80
-            c.drawImage(qr_image, width - 130, height - 240, qr_size, qr_size)
-            c.setFont("Helvetica", 8)
-            c.drawCentredString(width - 90, height - 250, "Scan to verify")
-
-    # Bill Details Section
-    y = height - 165
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(50, y, f"Invoice No:")
-    c.setFont("Helvetica", 11)
-    c.setFillColorRGB(*primary_color)
-    c.drawString(150, y, f"#{str(transaction_id).zfill(6)}")
-    c.setFillColorRGB(*dark_gray)
-    
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(320, y, f"Date:")
-    c.setFont("Helvetica", 11)
-    c.drawString(370, y, date_time)
-    
-    y -= 22
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(50, y, f"Payment Method:")
-    c.setFont("Helvetica", 11)
-    c.drawString(180, y, payment_method)
-    
-    if customer_name:
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(320, y, f"Customer:")
-        c.setFont("Helvetica", 11)
-        c.drawString(400, y, str(customer_name)[:25])
-
-    y -= 35
-    c.setStrokeColorRGB(*dark_gray)
-    c.setLineWidth(2)
-    c.line(50, y, width - 50, y)
-    c.setLineWidth(1)
-
-    # Table Header with enhanced styling
-    y -= 30
-    c.setFillColorRGB(*primary_color)
-    c.roundRect(50, y - 5, width - 100, 25, 3, fill=1, stroke=0)
-    
-    c.setFillColorRGB(1, 1, 1)
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(60, y + 5, "Item Description")
-    c.drawString(320, y + 5, "Qty")
-    c.drawString(400, y + 5, "Unit Price")
-    c.drawString(500, y + 5, "Total")
-
-    # Items with alternating colors
-    y -= 30
-    c.setFont("Helvetica", 10)
-    
-    for i, item in enumerate(cart_items):
-        # Alternate row colors
-        if i % 2 == 0:
-            c.setFillColorRGB(*light_gray)
-            c.roundRect(50, y - 5, width - 100, 20, 2, fill=1, stroke=0)
-        
-        c.setFillColorRGB(*dark_gray)
-        name = str(item.get('name', ''))[:40]  # Truncate long names
-        qty = item.get('qty', 0)
-        price = item.get('price', 0)
-        subtotal = item.get('subtotal', 0)
-        
-        c.drawString(60, y, name)
-        c.drawString(330, y, str(qty))
-        c.drawString(405, y, f"LKR {price:,.2f}")
-        c.drawString(505, y, f"LKR {subtotal:,.2f}")
-        y -= 22
+    if not os.path.exists(BILLS_DIR):
+        os.makedirs(BILLS_DIR)
 
-    # Totals Box with enhanced styling
-    y -= 25
-    c.setStrokeColorRGB(*dark_gray)
-    c.setLineWidth(1)
-    c.line(350, y, width - 50, y)
-    
-    y -= 25
-    c.setFont("Helvetica", 11)
-    c.drawString(370, y, "Subtotal:")
-    c.drawRightString(width - 60, y, f"LKR {(total_amount + discount):,.2f}")
-    
-    if discount > 0:
-        y -= 22
-        c.drawString(370, y, "Discount:")
-        c.setFillColorRGB(0.8, 0.1, 0.1)
-        c.drawRightString(width - 60, y, f"- LKR {discount:,.2f}")
-        c.setFillColorRGB(*dark_gray)
-    
-    y -= 5
-    c.setLineWidth(2)
-    c.line(350, y, width - 50, y)
-    
-    y -= 30
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(370, y, "GRAND TOTAL:")
-    c.setFillColorRGB(*primary_color)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawRightString(width - 60, y, f"LKR {total_amount:,.2f}")
-    c.setFillColorRGB(*dark_gray)
-
-    # Terms & Conditions Box
-    y -= 50
-    if y > 150:  # Only if there's space
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(50, y, "Terms & Conditions:")
-        c.setFont("Helvetica", 8)
-        y -= 15
-        c.drawString(50, y, "• All sales are final unless product is defective")
-        y -= 12
-        c.drawString(50, y, "• Returns accepted within 7 days with original receipt")
-        y -= 12
-        c.drawString(50, y, "• Warranty terms as per manufacturer")
-
-    # Footer with branding
-    footer_y = 80
-    c.setFillColorRGB(*primary_color)
-    c.rect(0, 0, width, 70, fill=1, stroke=0)
-    
-    c.setFillColorRGB(1, 1, 1)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawCentredString(width/2, footer_y - 20, "Thank You for Your Business!")
-    c.setFont("Helvetica", 9)
-    c.drawCentredString(width/2, footer_y - 35, "Powered by BuildSmart OS - Sri Lanka's Smart Hardware POS")
-    c.drawCentredString(width/2, footer_y - 48, "For support: info@buildsmart.lk | +94 77 123 4567")
-
-    c.save()
+    filename = f"{BILLS_DIR}/bill_{transaction_id}.pdf"
+    get_bill_renderer().render(filename, transaction_id, cart_items, total_amount, date_time,
+                               customer_name=customer_name, discount=discount,
+                               payment_method=payment_method)
     print(f"✅ Invoice #{transaction_id} generated: {filename}")
     return filename
 
+def transaction_lines(cursor, transaction_id):
+    """A stored transaction's lines as cart-style dicts, read a page at a time"""
+    for name, qty, price, subtotal in iter_pages(sale_item_page, cursor, transaction_id):
+        yield {'name': name, 'qty': qty, 'price': price, 'subtotal': subtotal}
+
+def generate_transaction_bill(transaction_id, db_name=DB_NAME):
+    """
+    (Re)generate the bill of a stored transaction, streaming its lines
+    from the database so contractor orders of any size use flat memory.
+
+    Returns:
+        str: Path to generated PDF file
+    """
+    with connection(db_name) as conn:
+        cursor = conn.cursor()
+        # Customer's name when one was recorded, else the phone number the sale was rung up with
+        cursor.execute("""
+            SELECT t.date_time, t.total_amount, COALESCE(t.discount_amount, 0), t.payment_method,
+                   COALESCE(NULLIF(TRIM(c.name), ''), t.customer_phone, c.phone_number)
+            FROM transactions t
+            LEFT JOIN customers c ON c.id = t.customer_id
+            WHERE t.id = ?
+        """, (transaction_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Transaction #{transaction_id} not found")
+        date_time, total_amount, discount, payment_method, customer_name = row
+        return generate_bill(transaction_id, transaction_lines(conn.cursor(), transaction_id),
+                             total_amount, date_time, customer_name=customer_name,
+                             discount=discount, payment_method=payment_method or 'Cash')
+
 def generate_quotation(quote_id, items, total_amount, customer_name, valid_until):
     """Generate a quotation PDF"""
     if not os.path.exists("quotations"):
         os.makedirs("quotations")
-    
+
     filename = f"quotations/quote_{quote_id}.pdf"
     # Similar structure to bill but with "QUOTATION" title
     # Implementation can be added based on need
@@ -0,0 +1,210 @@
+"""
+Product Catalog Cache for BuildSmartOS
+Process-wide in-memory product snapshot, reloaded only when products change
+"""
+import threading
+from db import DB_NAME, get_connection, open_connection
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'category', 'price_per_unit', 'cost_price', 'stock_quantity',
+    'unit_type', 'reorder_level', 'barcode', 'supplier_id', 'description'
+)
+
+
+class ProductRecord:
+    """Compact, read-only product row"""
+    __slots__ = PRODUCT_COLUMNS
+
+    def __init__(self, row):
+        for column, value in zip(PRODUCT_COLUMNS, row):
+            object.__setattr__(self, column, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProductRecord is read-only")
+
+    def __repr__(self):
+        return f"ProductRecord(id={self.id}, name={self.name!r}, stock={self.stock_quantity})"
+
+
+class ProductCatalog:
+    """
+    Cached view of the products table.
+
+    A dedicated connection polls PRAGMA data_version, which changes whenever
+    any other connection (this process's pool or another process) commits.
+    Only then is the product_changes log read, and only the products it
+    names are re-fetched. Records are replaced, never mutated, so a record
+    handed out earlier stays internally consistent.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._lock = threading.RLock()
+        self._watch_conn = None
+        self._data_version = None
+        self._last_change_id = 0
+        self._by_id = {}
+        self._by_barcode = {}
+        self._by_category = {}
+        self._sorted = None
+        self._loaded = False
+
+    # ---- loading ----
+
+    def _watch(self):
+        """Connection used only for PRAGMA data_version checks"""
+        if self._watch_conn is None:
+            self._watch_conn = open_connection(self.db_name)
+        return self._watch_conn
+
+    def _index(self, record):
+        self._sorted = None
+        self._by_id[record.id] = record
+        if record.barcode:
+            self._by_barcode[record.barcode] = record
+        self._by_category.setdefault(record.category, set()).add(record.id)
+
+    def _unindex(self, record):
+        self._sorted = None
+        self._by_id.pop(record.id, None)
+        if record.barcode and self._by_barcode.get(record.barcode) is record:
+            del self._by_barcode[record.barcode]
+        ids = self._by_category.get(record.category)
+        if ids is not None:
+            ids.discard(record.id)
+            if not ids:
+                del self._by_category[record.category]
+
+    def _full_reload(self, cursor):
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM product_changes")
+        last_change_id = cursor.fetchone()[0]
+        cursor.execute(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products")
+
+        self._by_id = {}
+        self._by_barcode = {}
+        self._by_category = {}
+        for row in cursor.fetchall():
+            self._index(ProductRecord(row))
+
+        self._last_change_id = last_change_id
+        self._loaded = True
+
+    def _apply_changes(self, cursor):
+        """Re-fetch products named in the change log since the last check"""
+        cursor.execute("SELECT MIN(id) FROM product_changes")
+        oldest = cursor.fetchone()[0]
+        if oldest is not None and oldest > self._last_change_id + 1:
+            # Our position was pruned away; we can't tell what changed
+            self._full_reload(cursor)
+            return
+
+        cursor.execute("""
+            SELECT product_id, MAX(id) FROM product_changes
+            WHERE id > ?
+            GROUP BY product_id
+        """, (self._last_change_id,))
+        changes = cursor.fetchall()
+        if not changes:
+            return
+
+        changed_ids = [product_id for product_id, _ in changes]
+        placeholders = ", ".join("?" * len(changed_ids))
+        cursor.execute(
+            f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE id IN ({placeholders})",
+            changed_ids
+        )
+        fresh = {row[0]: ProductRecord(row) for row in cursor.fetchall()}
+
+        for product_id in changed_ids:
+            old = self._by_id.get(product_id)
+            if old is not None:
+                self._unindex(old)
+            if product_id in fresh:
+                self._index(fresh[product_id])
+
+        self._last_change_id = max(change_id for _, change_id in changes)
+
+    def refresh(self):
+        """Bring the cache up to date if anything was committed since the last check"""
+        with self._lock:
+            data_version = self._watch().execute("PRAGMA data_version").fetchone()[0]
+            if self._loaded and data_version == self._data_version:
+                return False
+
+            conn = get_connection(self.db_name)
+            try:
+                cursor = conn.cursor()
+                if self._loaded:
+                    self._apply_changes(cursor)
+                else:
+                    self._full_reload(cursor)
+            finally:
+                conn.close()
+            self._data_version = data_version
+            return True
+
+    def invalidate(self):
+        """Force a full reload on next access"""
+        with self._lock:
+            self._loaded = False
+
+    # ---- lookups ----
+
+    def get(self, product_id):
+        """Product record by id, or None"""
+        with self._lock:
+            self.refresh()
+            return self._by_id.get(product_id)
+
+    def get_by_barcode(self, barcode):
+        """Product record by barcode, or None"""
+        with self._lock:
+            self.refresh()
+            return self._by_barcode.get(barcode)
+
+    def by_category(self, category):
+        """Products in a category, sorted by name"""
+        with self._lock:
+            self.refresh()
+            records = [self._by_id[pid] for pid in self._by_category.get(category, ())]
+        return sorted(records, key=lambda r: r.name)
+
+    def categories(self):
+        """Sorted list of non-empty category names"""
+        with self._lock:
+            self.refresh()
+            return sorted(c for c in self._by_category if c)
+
+    def all_products(self):
+        """Snapshot list of every product, sorted by name"""
+        with self._lock:
+            self.refresh()
+            if self._sorted is None:
+                self._sorted = sorted(self._by_id.values(), key=lambda r: r.name)
+            return list(self._sorted)
+
+    def find_by_name(self, term):
+        """First product (by name) whose name contains term, case-insensitive"""
+        term = term.lower()
+        for record in self.all_products():
+            if term in record.name.lower():
+                return record
+        return None
+
+    def close(self):
+        """Close the watcher connection"""
+        with self._lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
+
+
+# Global instance
+_product_catalog = None
+
+def get_product_catalog():
+    """Get or create the shared product catalog"""
+    global _product_catalog
+    if _product_catalog is None:
+        _product_catalog = ProductCatalog()
+    return _product_catalog
@@ -0,0 +1,308 @@
+"""
+Product Importer for BuildSmartOS
+Streaming CSV import with validation, batched upserts by barcode (or name) and a rejects file
+"""
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+from db import DB_NAME, transaction
+
+BATCH_SIZE = 2000  # Rows validated and written per transaction
+
+# Columns the importer understands, in INSERT order
+IMPORT_COLUMNS = (
+    'name', 'category', 'price_per_unit', 'cost_price', 'stock_quantity',
+    'unit_type', 'barcode', 'reorder_level', 'description'
+)
+
+# Always supplied on INSERT (NOT NULL is checked before ON CONFLICT applies)
+REQUIRED_COLUMNS = ('name', 'price_per_unit', 'stock_quantity', 'unit_type', 'barcode')
+
+DEFAULTS = {
+    'category': None,
+    'cost_price': 0.0,
+    'stock_quantity': 0.0,
+    'unit_type': 'Unit',
+    'barcode': None,
+    'reorder_level': 10,
+    'description': None,
+}
+
+
+def _number(value, cast, field):
+    try:
+        return cast(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} is not a number: {value!r}")
+
+
+def validate_row(row):
+    """
+    Clean one CSV row.
+
+    Returns:
+        dict of column -> value for the columns present in the row
+
+    Raises:
+        ValueError with a reason suitable for the rejects file
+    """
+    values = {}
+    for column in IMPORT_COLUMNS:
+        raw = row.get(column)
+        if raw is None:
+            continue  # Column not in this file; leave existing data alone
+        raw = raw.strip()
+
+        if column == 'name':
+            if not raw:
+                raise ValueError("name is required")
+            values[column] = raw
+        elif column in ('price_per_unit', 'cost_price', 'stock_quantity'):
+            if raw == "":
+                if column == 'price_per_unit':
+                    raise ValueError("price_per_unit is required")
+                values[column] = DEFAULTS[column]
+                continue
+            number = _number(raw, float, column)
+            if number < 0:
+                raise ValueError(f"{column} cannot be negative: {raw}")
+            values[column] = number
+        elif column == 'reorder_level':
+            values[column] = _number(raw, lambda v: int(float(v)), column) if raw else DEFAULTS[column]
+        elif column == 'unit_type':
+            values[column] = raw or DEFAULTS[column]
+        else:
+            # Empty barcode -> NULL, so barcode-less rows don't collide on UNIQUE
+            values[column] = raw or None
+
+    if 'name' not in values:
+        raise ValueError("name is required")
+    if 'price_per_unit' not in values:
+        raise ValueError("price_per_unit is required")
+    return values
+
+
+def estimate_rows(file_path):
+    """Approximate data row count (newlines minus header), for progress only"""
+    lines = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return max(lines - 1, 1)
+
+
+class ImportCancelled(Exception):
+    """Raised internally when the user cancels an import"""
+
+
+class ProductImporter:
+    """
+    Import a (possibly very large) product CSV.
+
+    Rows are read lazily and written in batches, each batch in its own short
+    transaction so checkouts can interleave with a long import. Rows are
+    matched on barcode; rows without one are matched on name (and category,
+    if the file has that column) among products that have no barcode either.
+    Existing products are updated with the columns the file provides, new
+    ones inserted. Invalid rows are copied to a
+    '<file>_rejects_<timestamp>.csv' next to the source with an error column.
+    """
+
+    def __init__(self, db_name=DB_NAME, batch_size=BATCH_SIZE):
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.cancel_event = threading.Event()
+        self.rows_done = 0
+        self.rows_estimated = 0
+
+    @property
+    def progress(self):
+        """Fraction complete (0-1); safe to poll from the UI thread"""
+        if not self.rows_estimated:
+            return 0.0
+        return min(1.0, self.rows_done / self.rows_estimated)
+
+    def cancel(self):
+        """Stop after the batch in progress (committed batches are kept)"""
+        self.cancel_event.set()
+
+    def _plan(self, columns, update_columns, match_category):
+        """SQL and matching rules for one file's columns"""
+        placeholders = ", ".join("?" * len(columns))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in update_columns)
+        insert = f"INSERT INTO products ({', '.join(columns)}) VALUES ({placeholders})"
+        return {
+            'columns': columns,
+            'update_columns': update_columns,
+            'match_category': match_category,
+            'upsert': f"{insert} ON CONFLICT(barcode) DO UPDATE SET {updates}",
+            'insert': insert,
+            'update': f"UPDATE products SET {', '.join(f'{c} = ?' for c in update_columns)} WHERE id = ?",
+        }
+
+    def _name_key(self, plan, values):
+        """Key for rows without a barcode: the name, plus the category when the file has one"""
+        if plan['match_category']:
+            return values['name'], values.get('category')
+        return values['name']
+
+    def _upsert(self, plan, rows):
+        """Upsert rows in one transaction; returns (inserted, updated), raises on failure"""
+        columns = plan['columns']
+        with_barcode = [values for values, _ in rows if values.get('barcode')]
+        barcodes = list({values['barcode'] for values in with_barcode})
+
+        # Barcode-less rows can't use ON CONFLICT (NULLs never collide), so they
+        # are matched by name against barcode-less products only (a barcoded
+        # product of the same name is a different item); a repeat within the
+        # batch updates the earlier row
+        by_name = {}
+        for values, _ in rows:
+            if not values.get('barcode'):
+                by_name[self._name_key(plan, values)] = values
+        repeats = sum(1 for values, _ in rows if not values.get('barcode')) - len(by_name)
+
+        with transaction(self.db_name) as conn:
+            cursor = conn.cursor()
+            seen = set()
+            if barcodes:
+                cursor.execute(
+                    f"SELECT barcode FROM products WHERE barcode IN ({', '.join('?' * len(barcodes))})",
+                    barcodes
+                )
+                seen = {row[0] for row in cursor.fetchall()}
+            if with_barcode:
+                cursor.executemany(plan['upsert'], [
+                    tuple(values.get(c, DEFAULTS.get(c)) for c in columns) for values in with_barcode
+                ])
+
+            existing = {}
+            if by_name:
+                names = list({values['name'] for values in by_name.values()})
+                cursor.execute(f"""
+                    SELECT name, category, MIN(id) FROM products
+                    WHERE name IN ({', '.join('?' * len(names))}) AND COALESCE(barcode, '') = ''
+                    GROUP BY name, category
+                    ORDER BY MIN(id) DESC
+                """, names)
+                for name, category, product_id in cursor.fetchall():
+                    # Oldest product wins when several share the key
+                    existing[(name, category) if plan['match_category'] else name] = product_id
+            cursor.executemany(plan['update'], [
+                tuple(values.get(c, DEFAULTS.get(c)) for c in plan['update_columns']) + (existing[key],)
+                for key, values in by_name.items() if key in existing
+            ])
+            cursor.executemany(plan['insert'], [
+                tuple(values.get(c, DEFAULTS.get(c)) for c in columns)
+                for key, values in by_name.items() if key not in existing
+            ])
+
+        # A barcode already in the table (or earlier in this batch) is an update
+        inserted = updated = 0
+        for values in with_barcode:
+            if values['barcode'] in seen:
+                updated += 1
+            else:
+                inserted += 1
+                seen.add(values['barcode'])
+        matched = sum(1 for key in by_name if key in existing)
+        inserted += len(by_name) - matched
+        updated += matched + repeats
+        return inserted, updated
+
+    def _write_batch(self, plan, rows, rejects):
+        """Upsert validated rows, isolating rows the database refuses; returns (inserted, updated)"""
+        try:
+            return self._upsert(plan, rows)
+        except Exception:
+            pass
+
+        # A row broke the batch (e.g. a constraint); retry one by one to isolate it
+        inserted = updated = 0
+        for row in rows:
+            try:
+                i, u = self._upsert(plan, [row])
+                inserted += i
+                updated += u
+            except Exception as e:
+                rejects.append((row[1], f"database error: {e}"))
+        return inserted, updated
+
+    def run(self, file_path):
+        """
+        Import file_path.
+
+        Returns:
+            dict with inserted, updated, rejected, rows, rejects_path, cancelled, seconds
+        """
+        started = time.perf_counter()
+        self.cancel_event.clear()
+        self.rows_done = 0
+        self.rows_estimated = estimate_rows(file_path)
+
+        summary = {'inserted': 0, 'updated': 0, 'rejected': 0, 'rows': 0,
+                   'rejects_path': None, 'cancelled': False}
+        rejects_file = None
+        rejects_writer = None
+
+        try:
+            with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f)
+                if not reader.fieldnames:
+                    raise ValueError("CSV file has no header row")
+                reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+                source_fields = list(reader.fieldnames)
+
+                # New products get defaults for missing columns; existing products
+                # only have the columns present in the file updated
+                columns = [c for c in IMPORT_COLUMNS if c in source_fields or c in REQUIRED_COLUMNS]
+                update_columns = [c for c in columns if c in source_fields and c != 'barcode']
+                plan = self._plan(columns, update_columns, 'category' in source_fields)
+
+                while True:
+                    if self.cancel_event.is_set():
+                        raise ImportCancelled()
+
+                    chunk = list(islice(reader, self.batch_size))
+                    if not chunk:
+                        break
+
+                    valid, rejects = [], []
+                    for row in chunk:
+                        try:
+                            valid.append((validate_row(row), row))
+                        except ValueError as e:
+                            rejects.append((row, str(e)))
+
+                    if valid:
+                        inserted, updated = self._write_batch(plan, valid, rejects)
+                        summary['inserted'] += inserted
+                        summary['updated'] += updated
+
+                    if rejects:
+                        if rejects_writer is None:
+                            base, _ = os.path.splitext(file_path)
+                            summary['rejects_path'] = f"{base}_rejects_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+                            rejects_file = open(summary['rejects_path'], 'w', encoding='utf-8', newline='')
+                            rejects_writer = csv.DictWriter(
+                                rejects_file, fieldnames=source_fields + ['error'], extrasaction='ignore'
+                            )
+                            rejects_writer.writeheader()
+                        for row, reason in rejects:
+                            rejects_writer.writerow({**row, 'error': reason})
+                        summary['rejected'] += len(rejects)
+
+                    summary['rows'] += len(chunk)
+                    self.rows_done = summary['rows']
+        except ImportCancelled:
+            summary['cancelled'] = True
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        summary['seconds'] = time.perf_counter() - started
+        return summary
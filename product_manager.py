@@ -5,7 +5,12 @@ Complete CRUD operations for product inventory
 
 import customtkinter as ctk
 from tkinter import messagebox, filedialog
-import sqlite3
+from db import get_connection
+from data_access import product_page, product_totals, forecast_demand, FORECAST_DAYS
+from product_catalog import get_product_catalog
+from product_import import ProductImporter
+from async_executor import get_background_executor
+from ui_components import ProgressBar, VirtualTable, TableColumn, PagedRowProvider, SearchController, LoadingSpinner
 import csv
 from datetime import datetime
 import os
@@ -34,8 +39,7 @@ class ProductManager(ctk.CTkToplevel):
         # Database connection
         self.db_path = "buildsmart_hardware.db"
         
-        # Current filter
-        self.current_search = ""
+        # Current filter (category is read by the search worker)
         self.current_category = "All"
         
         self.create_ui()
@@ -56,17 +60,16 @@ class ProductManager(ctk.CTkToplevel):
         controls_frame = ctk.CTkFrame(self)
         controls_frame.pack(fill="x", padx=20, pady=(0, 10))
         
-        # Search box
-        self.search_var = ctk.StringVar()
-        self.search_var.trace("w", lambda *args: self.load_products())
-        
-        search_entry = ctk.CTkEntry(
+        # Search box (debounced; the query runs on a worker thread)
+        self.search_bar = SearchController(
             controls_frame,
-            placeholder_text="🔍 Search products...",
-            textvariable=self.search_var,
-            width=300
+            query=self.query_products,
+            on_results=self.show_products,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load products: {e}"),
+            placeholder="Search products...",
+            fg_color="transparent"
         )
-        search_entry.pack(side="left", padx=10, pady=10)
+        self.search_bar.pack(side="left", padx=10, pady=10)
         
         # Category filter
         self.category_var = ctk.StringVar(value="All")
@@ -76,7 +79,7 @@ class ProductManager(ctk.CTkToplevel):
             controls_frame,
             values=categories,
             variable=self.category_var,
-            command=lambda x: self.load_products()
+            command=self.set_category
         )
         category_menu.pack(side="left", padx=10)
         
@@ -107,9 +110,28 @@ class ProductManager(ctk.CTkToplevel):
         )
         import_btn.pack(side="right", padx=5)
         
-        # Products list frame
-        self.products_frame = ctk.CTkScrollableFrame(self, height=450)
-        self.products_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        # Products table (only visible rows have widgets; pages load on scroll)
+        self.products_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Name", 200, 1, fmt=lambda v: v[:30], sort_key='name', anchor="w"),
+                TableColumn("Category", 120, 2, sort_key='category'),
+                TableColumn("Price", 100, 3, fmt=lambda v: f"LKR {v:,.2f}", sort_key='price_per_unit'),
+                TableColumn("Cost", 100, 4, fmt=lambda v: f"LKR {v or 0:,.2f}", sort_key='cost_price'),
+                TableColumn("Stock", 80, 5, fmt=lambda v: f"{v:.0f}", sort_key='stock_quantity'),
+                TableColumn("Unit", 80, 6, sort_key='unit_type'),
+                TableColumn("Barcode", 120, 7, sort_key='barcode'),
+                TableColumn(f"{FORECAST_DAYS}d Demand", 90, 9, fmt=lambda v: "-" if v is None else f"{v:.0f}"),
+            ],
+            actions=[
+                ("✏️ Edit", 70, self.edit_product, "#007bff", "#0056b3"),
+                ("🗑️ Delete", 70, lambda p: self.delete_product(p[0], p[1]), "#dc3545", "#c82333"),
+            ],
+            # Red tint for low stock
+            row_color=lambda p: "#3d2020" if p[5] <= (p[8] or 0) else None,
+            empty_text="No products found"
+        )
+        self.products_table.pack(fill="both", expand=True, padx=20, pady=10)
         
         # Stats footer
         self.stats_label = ctk.CTkLabel(
@@ -122,154 +144,69 @@ class ProductManager(ctk.CTkToplevel):
     def get_categories(self):
         """Get all unique categories from database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category")
-            categories = ["All"] + [row[0] for row in cursor.fetchall()]
-            conn.close()
-            return categories
+            return ["All"] + get_product_catalog().categories()
         except Exception as e:
             print(f"Error getting categories: {e}")
             return ["All"]
     
+    def set_category(self, category):
+        """Category menu changed"""
+        self.current_category = category
+        self.load_products()
+    
     def load_products(self):
-        """Load and display products"""
-        # Clear current display
-        for widget in self.products_frame.winfo_children():
-            widget.destroy()
-        
-        # Get search and filter values
-        search_term = self.search_var.get().lower()
-        category = self.category_var.get()
-        
+        """Reload the product list for the current search and category"""
+        self.search_bar.search_now()
+    
+    def query_products(self, search_term):
+        """
+        Footer stats and the first page for a search (runs on a worker thread).
+        
+        Returns:
+            (category, order, totals, first page)
+        """
+        category = None if self.current_category == "All" else self.current_category
+        order = self.products_table.order
+        conn = get_connection(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            
-            # Build query
-            query = "SELECT id, name, category, price_per_unit, cost_price, stock_quantity, unit_type, barcode, reorder_level FROM products WHERE 1=1"
-            params = []
-            
-            if search_term:
-                query += " AND (LOWER(name) LIKE ? OR LOWER(category) LIKE ? OR barcode LIKE ?)"
-                params.extend([f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"])
-            
-            if category != "All":
-                query += " AND category = ?"
-                params.append(category)
-            
-            query += " ORDER BY name"
-            
-            cursor.execute(query, params)
-            products = cursor.fetchall()
-            
-            # Create header
-            self.create_product_header()
-            
-            # Display products
-            for product in products:
-                self.create_product_row(product)
-            
-            # Update stats
-            total_value = sum(p[3] * p[5] for p in products)
-            low_stock = sum(1 for p in products if p[5] <= p[8])
-            
-            self.stats_label.configure(
-                text=f"📊 Total Products: {len(products)} | 💰 Inventory Value: LKR {total_value:,.2f} | ⚠️ Low Stock: {low_stock}"
-            )
-            
+            # Footer stats come from one aggregate query, not the listed rows
+            totals = product_totals(cursor, search_term, category)
+            # Ranked full-text search (falls back to LIKE when unavailable)
+            page = self.with_forecasts(cursor, product_page(cursor, search_term, category, order=order))
+        finally:
             conn.close()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load products: {e}")
+        return category, order, totals, page
     
-    def create_product_header(self):
-        """Create table header"""
-        header_frame = ctk.CTkFrame(self.products_frame, fg_color="#2b2b2b")
-        header_frame.pack(fill="x", pady=(0, 5))
-        
-        headers = [
-            ("Name", 200),
-            ("Category", 120),
-            ("Price", 100),
-            ("Cost", 100),
-            ("Stock", 80),
-            ("Unit", 80),
-            ("Barcode", 120),
-            ("Actions", 180)
-        ]
+    def show_products(self, search_term, result):
+        """Display the latest search results (Tk thread)"""
+        category, order, totals, page = result
+        self.stats_label.configure(
+            text=f"📊 Total Products: {totals['count']} | 💰 Inventory Value: LKR {totals['inventory_value']:,.2f} | ⚠️ Low Stock: {totals['low_stock']}"
+        )
         
-        for text, width in headers:
-            label = ctk.CTkLabel(
-                header_frame,
-                text=text,
-                font=("Roboto", 12, "bold"),
-                width=width
+        # Reuse the prefetched page unless the sort changed while searching
+        self.products_table.set_provider(
+            PagedRowProvider(lambda after, order: self.fetch_products(search_term, category, after, order)),
+            first_page=page if order == self.products_table.order else None
+        )
+    
+    def fetch_products(self, search_term, category, after, order):
+        """One page of products for the table"""
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            return self.with_forecasts(
+                cursor, product_page(cursor, search_term, category, after=after, order=order)
             )
-            label.pack(side="left", padx=5, pady=5)
+        finally:
+            conn.close()
     
-    def create_product_row(self, product):
-        """Create a row for a product"""
-        p_id, name, category, price, cost, stock, unit, barcode, reorder = product
-        
-        row_frame = ctk.CTkFrame(self.products_frame)
-        row_frame.pack(fill="x", pady=2)
-        
-        # Color code based on stock
-        if stock <= reorder:
-            row_frame.configure(fg_color="#3d2020")  # Red tint for low stock
-        
-        # Name
-        name_label = ctk.CTkLabel(row_frame, text=name[:30], width=200, anchor="w")
-        name_label.pack(side="left", padx=5, pady=5)
-        
-        # Category
-        cat_label = ctk.CTkLabel(row_frame, text=category or "N/A", width=120)
-        cat_label.pack(side="left", padx=5)
-        
-        # Price
-        price_label = ctk.CTkLabel(row_frame, text=f"LKR {price:,.2f}", width=100)
-        price_label.pack(side="left", padx=5)
-        
-        # Cost
-        cost_label = ctk.CTkLabel(row_frame, text=f"LKR {cost:,.2f}", width=100)
-        cost_label.pack(side="left", padx=5)
-        
-        # Stock
-        stock_label = ctk.CTkLabel(row_frame, text=f"{stock:.0f}", width=80)
-        stock_label.pack(side="left", padx=5)
-        
-        # Unit
-        unit_label = ctk.CTkLabel(row_frame, text=unit, width=80)
-        unit_label.pack(side="left", padx=5)
-        
-        # Barcode
-        barcode_label = ctk.CTkLabel(row_frame, text=barcode or "N/A", width=120)
-        barcode_label.pack(side="left", padx=5)
-        
-        # Action buttons
-        actions_frame = ctk.CTkFrame(row_frame, fg_color="transparent")
-        actions_frame.pack(side="left", padx=5)
-        
-        edit_btn = ctk.CTkButton(
-            actions_frame,
-            text="✏️ Edit",
-            width=70,
-            command=lambda: self.edit_product(product),
-            fg_color="#007bff",
-            hover_color="#0056b3"
-        )
-        edit_btn.pack(side="left", padx=2)
-        
-        delete_btn = ctk.CTkButton(
-            actions_frame,
-            text="🗑️ Delete",
-            width=70,
-            command=lambda: self.delete_product(p_id, name),
-            fg_color="#dc3545",
-            hover_color="#c82333"
-        )
-        delete_btn.pack(side="left", padx=2)
+    def with_forecasts(self, cursor, page):
+        """Append each product's stored demand forecast (None if none) to a page's rows"""
+        rows, next_key = page
+        demand = forecast_demand(cursor, [row[0] for row in rows])
+        return [tuple(row) + (demand.get(row[0]),) for row in rows], next_key
     
     def add_product(self):
         """Open dialog to add new product"""
@@ -288,7 +225,7 @@ class ProductManager(ctk.CTkToplevel):
         
         if result:
             try:
-                conn = sqlite3.connect(self.db_path)
+                conn = get_connection(self.db_path)
                 cursor = conn.cursor()
                 
                 # Check if product has sales
@@ -319,7 +256,7 @@ class ProductManager(ctk.CTkToplevel):
                 messagebox.showerror("Error", f"Failed to delete product: {e}")
     
     def import_products(self):
-        """Import products from CSV"""
+        """Import products from CSV (runs in the background with progress)"""
         file_path = filedialog.askopenfilename(
             title="Select CSV File",
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
@@ -328,51 +265,13 @@ class ProductManager(ctk.CTkToplevel):
         if not file_path:
             return
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                csv_reader = csv.DictReader(file)
-                
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                
-                imported = 0
-                skipped = 0
-                
-                for row in csv_reader:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO products (name, category, price_per_unit, cost_price, stock_quantity, 
-                                                unit_type, barcode, reorder_level)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            row.get('name', ''),
-                            row.get('category', ''),
-                            float(row.get('price_per_unit', 0)),
-                            float(row.get('cost_price', 0)),
-                            float(row.get('stock_quantity', 0)),
-                            row.get('unit_type', 'Unit'),
-                            row.get('barcode', ''),
-                            int(row.get('reorder_level', 10))
-                        ))
-                        imported += 1
-                    except Exception as e:
-                        print(f"Skipped row: {e}")
-                        skipped += 1
-                
-                conn.commit()
-                conn.close()
-                
-                messagebox.showinfo(
-                    "Import Complete",
-                    f"Imported: {imported} products\nSkipped: {skipped} rows"
-                )
-                
-                self.load_products()
-                if hasattr(self.main_app, 'load_products'):
-                    self.main_app.load_products()
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to import CSV: {e}")
+        ImportProgressDialog(self, file_path, self.db_path, callback=self.on_import_finished)
+    
+    def on_import_finished(self):
+        """Refresh product lists after an import (even a cancelled one keeps its batches)"""
+        self.load_products()
+        if hasattr(self.main_app, 'load_products'):
+            self.main_app.load_products()
     
     def export_products(self):
         """Export products to CSV"""
@@ -386,18 +285,12 @@ class ProductManager(ctk.CTkToplevel):
         if not file_path:
             return
         
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT name, category, price_per_unit, cost_price, stock_quantity, 
-                       unit_type, barcode, reorder_level
-                FROM products
-                ORDER BY name
-            """)
-            
-            products = cursor.fetchall()
-            conn.close()
+        def write():
+            products = [
+                (r.name, r.category, r.price_per_unit, r.cost_price, r.stock_quantity,
+                 r.unit_type, r.barcode, r.reorder_level)
+                for r in get_product_catalog().all_products()
+            ]
             
             with open(file_path, 'w', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
@@ -406,11 +299,13 @@ class ProductManager(ctk.CTkToplevel):
                     'stock_quantity', 'unit_type', 'barcode', 'reorder_level'
                 ])
                 writer.writerows(products)
-            
-            messagebox.showinfo("Success", f"Exported {len(products)} products to CSV!")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export CSV: {e}")
+            return len(products)
+        
+        LoadingSpinner(self, "Exporting products...").run(
+            write,
+            on_success=lambda count: messagebox.showinfo("Success", f"Exported {count} products to CSV!"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to export CSV: {e}")
+        )
 
 
 class ProductDialog(ctk.CTkToplevel):
@@ -512,7 +407,7 @@ class ProductDialog(ctk.CTkToplevel):
         if not self.product:
             return
         
-        p_id, name, category, price, cost, stock, unit, barcode, reorder = self.product
+        p_id, name, category, price, cost, stock, unit, barcode, reorder = self.product[:9]
         
         self.name_entry.insert(0, name)
         self.category_entry.insert(0, category or "")
@@ -550,7 +445,7 @@ class ProductDialog(ctk.CTkToplevel):
         description = self.description_entry.get("1.0", "end").strip()
         
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             if self.product:  # Update existing
@@ -584,6 +479,107 @@ class ProductDialog(ctk.CTkToplevel):
             messagebox.showerror("Error", f"Failed to save product: {e}")
 
 
+class ImportProgressDialog(ctk.CTkToplevel):
+    """Progress window for a background CSV import"""
+    
+    POLL_MS = 100
+    
+    def __init__(self, parent, file_path, db_path, callback=None):
+        super().__init__(parent)
+        
+        self.file_path = file_path
+        self.callback = callback
+        self.importer = ProductImporter(db_path)
+        
+        self.title("Importing Products")
+        self.geometry("420x200")
+        self.resizable(False, False)
+        
+        # Make it modal
+        self.transient(parent)
+        self.grab_set()
+        
+        # Closing the window cancels rather than orphaning the import
+        self.protocol("WM_DELETE_WINDOW", self.cancel_import)
+        
+        self.create_ui()
+        
+        executor = get_background_executor()
+        executor.attach(parent.master)  # No-op when the main app already attached
+        executor.submit(
+            self.importer.run, file_path,
+            on_success=self.on_import_done,
+            on_error=self.on_import_failed
+        )
+        self.after(self.POLL_MS, self.update_progress)
+    
+    def create_ui(self):
+        """Create the progress widgets"""
+        ctk.CTkLabel(
+            self,
+            text=f"📥 {os.path.basename(self.file_path)}",
+            font=("Roboto", 16, "bold")
+        ).pack(pady=(20, 10))
+        
+        self.progress_bar = ProgressBar(self)
+        self.progress_bar.pack(fill="x", padx=20)
+        
+        self.status_label = ctk.CTkLabel(self, text="Reading file...", text_color="gray")
+        self.status_label.pack(pady=5)
+        
+        self.cancel_btn = ctk.CTkButton(
+            self,
+            text="❌ Cancel",
+            command=self.cancel_import,
+            fg_color="#6c757d",
+            hover_color="#5a6268",
+            height=35
+        )
+        self.cancel_btn.pack(pady=10)
+    
+    def update_progress(self):
+        """Poll the importer's counters (runs on the Tk thread)"""
+        if not self.winfo_exists():
+            return
+        self.progress_bar.set(self.importer.progress)
+        self.status_label.configure(
+            text=f"{self.importer.rows_done:,} of ~{self.importer.rows_estimated:,} rows"
+        )
+        self.after(self.POLL_MS, self.update_progress)
+    
+    def cancel_import(self):
+        """Stop after the current batch; the summary still arrives via on_import_done"""
+        self.importer.cancel()
+        self.cancel_btn.configure(state="disabled", text="Cancelling...")
+    
+    def on_import_done(self, summary):
+        """Show the import summary"""
+        lines = [
+            f"Inserted: {summary['inserted']} products",
+            f"Updated: {summary['updated']} products",
+            f"Rejected: {summary['rejected']} rows",
+        ]
+        if summary['rejects_path']:
+            lines.append(f"\nRejected rows saved to:\n{summary['rejects_path']}")
+        if summary['cancelled']:
+            lines.append("\nImport cancelled - rows already imported were kept.")
+        
+        self.destroy()
+        messagebox.showinfo(
+            "Import Cancelled" if summary['cancelled'] else "Import Complete",
+            "\n".join(lines)
+        )
+        if self.callback:
+            self.callback()
+    
+    def on_import_failed(self, error):
+        """Report a failed import"""
+        self.destroy()
+        messagebox.showerror("Error", f"Failed to import CSV: {error}")
+        if self.callback:
+            self.callback()
+
+
 if __name__ == "__main__":
     # Test the module
     app = ctk.CTk()
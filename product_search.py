@@ -0,0 +1,196 @@
+"""
+Product Search for BuildSmartOS
+Ranked full-text product search (FTS5 trigram index) with a LIKE fallback
+"""
+import sqlite3
+
+# Trigram index can only match terms of at least three characters
+MIN_FTS_TERM_LENGTH = 3
+
+# bm25 column weights: name, category, barcode, description
+BM25_WEIGHTS = (10.0, 4.0, 8.0, 1.0)
+
+# Columns a product listing may be sorted by (NULLs folded so keyset comparisons work)
+SORT_EXPRESSIONS = {
+    'name': "p.name",
+    'category': "COALESCE(p.category, '')",
+    'price_per_unit': "p.price_per_unit",
+    'cost_price': "COALESCE(p.cost_price, 0)",
+    'stock_quantity': "p.stock_quantity",
+    'unit_type': "p.unit_type",
+    'barcode': "COALESCE(p.barcode, '')",
+}
+
+_fts_available = None
+
+
+def fts_available(cursor):
+    """True if the products_fts index exists in this database"""
+    global _fts_available
+    if _fts_available is None:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )
+        _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def split_terms(search_term):
+    """Split a search box entry into (indexable, short) lower-case terms"""
+    words = search_term.lower().split()
+    long_terms = [w for w in words if len(w) >= MIN_FTS_TERM_LENGTH]
+    short_terms = [w for w in words if len(w) < MIN_FTS_TERM_LENGTH]
+    return long_terms, short_terms
+
+
+def build_match_query(terms):
+    """Build an FTS5 MATCH expression requiring every term (as a quoted substring)"""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _like_clause(terms, params):
+    """AND together a substring filter per term across the searchable columns"""
+    clauses = []
+    for term in terms:
+        pattern = f"%{term}%"
+        clauses.append(
+            "(LOWER(p.name) LIKE ? OR LOWER(p.category) LIKE ? "
+            "OR p.barcode LIKE ? OR LOWER(p.description) LIKE ?)"
+        )
+        params.extend([pattern] * 4)
+    return " AND ".join(clauses)
+
+
+def _search_queries(search_term, columns, category=None, sort_expr=None):
+    """
+    Candidate (query, params) pairs for a product search, best strategy first.
+
+    Each query selects the requested columns followed by a sort_key column
+    (sort_expr if given, else bm25 rank for full-text matches and the name
+    otherwise) and a sort_id.
+    """
+    select_list = ", ".join(f"p.{col}" for col in columns)
+    long_terms, short_terms = split_terms(search_term)
+    queries = []
+
+    if long_terms:
+        params = [build_match_query(long_terms)]
+        query = f"""
+            SELECT {select_list},
+                   {sort_expr or f"bm25(products_fts, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]}, {BM25_WEIGHTS[2]}, {BM25_WEIGHTS[3]})"} AS sort_key,
+                   p.id AS sort_id
+            FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH ?
+        """
+        if short_terms:
+            query += " AND " + _like_clause(short_terms, params)
+        if category:
+            query += " AND p.category = ?"
+            params.append(category)
+        queries.append(('fts', query, params))
+
+    # Fallback: substring scan (short terms, or no FTS5 index)
+    params = []
+    query = f"SELECT {select_list}, {sort_expr or 'p.name'} AS sort_key, p.id AS sort_id FROM products p WHERE 1=1"
+    if long_terms or short_terms:
+        query += " AND " + _like_clause(long_terms + short_terms, params)
+    if category:
+        query += " AND p.category = ?"
+        params.append(category)
+    queries.append(('like', query, params))
+    return queries
+
+
+def _run_search(cursor, search_term, columns, category, wrap, extra_params, sort_expr=None):
+    """Execute the best available search strategy, falling back to LIKE"""
+    for kind, query, params in _search_queries(search_term, columns, category, sort_expr):
+        if kind == 'fts' and not fts_available(cursor):
+            continue
+        try:
+            cursor.execute(wrap(query), params + extra_params)
+            return cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if kind != 'fts':
+                raise
+            print(f"Full-text search error, using LIKE search: {e}")
+
+
+def search_products(cursor, search_term, columns, category=None, limit=None):
+    """
+    Search products by name, category, barcode and description.
+
+    Args:
+        cursor: Database cursor
+        search_term: Text typed by the user (multiple words are ANDed)
+        columns: Product column names to return, in order
+        category: Optional exact category filter
+        limit: Optional maximum number of rows
+
+    Returns:
+        List of row tuples, best matches first
+    """
+    width = len(columns)
+    suffix = " ORDER BY sort_key, p.name" + (" LIMIT ?" if limit else "")
+    rows = _run_search(cursor, search_term, columns, category,
+                       lambda query: query + suffix, [limit] if limit else [])
+    return [row[:width] for row in rows]
+
+
+def search_products_page(cursor, search_term, columns, category=None, after=None, limit=100, order=None):
+    """
+    One keyset page of search_products results.
+
+    Args:
+        after: next_key returned with the previous page (None for the first page)
+        limit: Page size
+        order: Optional (column, descending) from SORT_EXPRESSIONS instead of
+               relevance/name order
+
+    Returns:
+        (rows, next_key) - next_key is None on the last page
+    """
+    width = len(columns)
+    sort_expr, descending = None, False
+    if order:
+        sort_expr, descending = SORT_EXPRESSIONS[order[0]], order[1]
+    direction = "DESC" if descending else "ASC"
+
+    extra_params = []
+    condition = ""
+    if after is not None:
+        condition = f"WHERE (sort_key, sort_id) {'<' if descending else '>'} (?, ?)"
+        extra_params.extend(after)
+    extra_params.append(limit + 1)  # One extra row tells us whether another page exists
+
+    rows = _run_search(
+        cursor, search_term, columns, category,
+        lambda query: f"""
+            SELECT * FROM ({query}) {condition}
+            ORDER BY sort_key {direction}, sort_id {direction} LIMIT ?
+        """,
+        extra_params, sort_expr
+    )
+    next_key = tuple(rows[limit - 1][width:]) if len(rows) > limit else None
+    return [row[:width] for row in rows[:limit]], next_key
+
+
+def count_products(cursor, search_term="", category=None):
+    """
+    Footer statistics for a product search without fetching the rows.
+
+    Returns:
+        dict with count, inventory_value, low_stock
+    """
+    rows = _run_search(
+        cursor, search_term, ('price_per_unit', 'stock_quantity', 'reorder_level'), category,
+        lambda query: f"""
+            SELECT COUNT(*),
+                   COALESCE(SUM(price_per_unit * stock_quantity), 0),
+                   COALESCE(SUM(stock_quantity <= reorder_level), 0)
+            FROM ({query})
+        """,
+        []
+    )
+    count, inventory_value, low_stock = rows[0]
+    return {'count': count, 'inventory_value': inventory_value, 'low_stock': low_stock}
@@ -5,11 +5,13 @@ Search transactions and process refunds
 
 import customtkinter as ctk
 from tkinter import messagebox
-import sqlite3
 from datetime import datetime, timedelta
 from pathlib import Path
 
-DB_NAME = "buildsmart_hardware.db"
+from db import DB_NAME, get_connection, connection, date_key
+from data_access import refund_search_page
+from ui_components import VirtualTable, TableColumn, PagedRowProvider, LoadingSpinner
+from async_executor import CancellationToken
 
 def show_refund_manager(parent):
     """Display refund management window"""
@@ -19,10 +21,16 @@ def show_refund_manager(parent):
     refund_window.title("Refund Manager")
     refund_window.geometry("1000x700")
     
-    # Database connection
-    conn = sqlite3.connect(DB_NAME)
+    # Database connection (returned to the pool when the window closes)
+    conn = get_connection(DB_NAME)
     cursor = conn.cursor()
     
+    def release_connection(event):
+        if event.widget is refund_window:
+            conn.close()
+    
+    refund_window.bind("<Destroy>", release_connection, add="+")
+    
     # Main container
     main_frame = ctk.CTkFrame(refund_window)
     main_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -109,12 +117,34 @@ def show_refund_manager(parent):
         font=("Arial", 14, "bold")
     ).pack(pady=5)
     
-    # Results list
-    results_text = ctk.CTkTextbox(results_frame, height=300, font=("Courier", 11))
-    results_text.pack(fill="both", expand=True, padx=10, pady=10)
+    # Results list (rows are fetched a page at a time as it scrolls)
+    def view_selected(row):
+        view_transaction_details(row[0])
+    
+    results_table = VirtualTable(
+        results_frame,
+        columns=[
+            TableColumn("ID", 60, 0),
+            TableColumn("Date", 170, 1, anchor="w"),
+            TableColumn("Customer", 120, 2, fmt=lambda v: v or "Walk-in"),
+            TableColumn("Amount", 110, 3, fmt=lambda v: f"LKR {v:,.2f}"),
+            TableColumn("Refunded", 110, 5, fmt=lambda v: f"LKR {v:,.2f}"),
+            TableColumn("Status", 90, 6),
+        ],
+        actions=[("🔍 Details", 90, view_selected, "#17a2b8", "#117a8b")],
+        row_color=lambda row: "#3d2020" if row[6] == 'REFUNDED' else None,
+        on_select=view_selected,
+        row_height=36,
+        empty_text="No transactions found."
+    )
+    results_table.pack(fill="both", expand=True, padx=10, pady=10)
+    
+    results_count_label = ctk.CTkLabel(results_frame, text="", font=("Arial", 12))
+    results_count_label.pack(pady=(0, 5))
     
     # Selected transaction details
     selected_transaction_id = [None]  # Using list to allow modification in nested functions
+    search_spinner = [None]
     
     details_frame = ctk.CTkFrame(main_frame)
     details_frame.pack(fill="x", padx=20, pady=10)
@@ -130,87 +160,57 @@ def show_refund_manager(parent):
     
     def search_transactions():
         """Search for transactions based on criteria"""
-        results_text.delete("1.0", "end")
         details_text.delete("1.0", "end")
         selected_transaction_id[0] = None
         
-        # Build query
-        query = """
-            SELECT t.id, t.date_time, t.customer_phone, t.total_amount, t.payment_method,
-                   COALESCE(r.refund_amount, 0) as refunded,
-                   CASE WHEN r.id IS NOT NULL THEN 'REFUNDED' ELSE 'ACTIVE' END as status
-            FROM transactions t
-            LEFT JOIN refunds r ON t.id = r.transaction_id
-            WHERE 1=1
-        """
-        params = []
-        
-        # Add filters
+        # Filters
         phone = phone_entry.get().strip()
-        if phone:
-            query += " AND t.customer_phone LIKE ?"
-            params.append(f"%{phone}%")
-        
         trans_id = transaction_id_entry.get().strip()
-        if trans_id:
-            query += " AND t.id = ?"
-            params.append(trans_id)
         
-        date_from = date_from_entry.get().strip()
-        if date_from:
-            query += " AND DATE(t.date_time) >= ?"
-            params.append(date_from)
+        try:
+            date_from = date_from_entry.get().strip()
+            date_from_key = date_key(date_from) if date_from else None
+            
+            date_to = date_to_entry.get().strip()
+            date_to_key = date_key(date_to) if date_to else None
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Dates must be in YYYY-MM-DD format")
+            return
         
-        date_to = date_to_entry.get().strip()
-        if date_to:
-            query += " AND DATE(t.date_time) <= ?"
-            params.append(date_to)
+        def fetch_page(after, order):
+            return refund_search_page(
+                cursor, phone=phone, transaction_id=trans_id,
+                date_from_key=date_from_key, date_to_key=date_to_key, after=after
+            )
         
-        query += " ORDER BY t.date_time DESC LIMIT 50"
+        def fetch_first_page():
+            # Worker thread: the window's cursor belongs to the Tk thread
+            with connection(DB_NAME) as worker_conn:
+                return refund_search_page(
+                    worker_conn.cursor(), phone=phone, transaction_id=trans_id,
+                    date_from_key=date_from_key, date_to_key=date_to_key
+                )
         
-        try:
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            if not results:
-                results_text.insert("1.0", "No transactions found.\n")
-                return
-            
-            # Display results
-            header = f"{'ID':<6} {'Date':<20} {'Customer':<15} {'Amount':<12} {'Refunded':<12} {'Status':<10}\n"
-            results_text.insert("1.0", header)
-            results_text.insert("end", "=" * 90 + "\n")
-            
-            for row in results:
-                trans_id, date, phone, amount, payment, refunded, status = row
-                phone_display = phone if phone else "Walk-in"
-                line = f"{trans_id:<6} {date:<20} {phone_display:<15} LKR {amount:<8.2f} LKR {refunded:<8.2f} {status:<10}\n"
-                results_text.insert("end", line)
-            
-            results_text.insert("end", f"\nTotal: {len(results)} transaction(s) found\n")
-            results_text.insert("end", "\nDouble-click a transaction ID to view details\n")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Search failed: {e}")
+        def show_results(first_page):
+            results_table.set_provider(PagedRowProvider(fetch_page), first_page=first_page)
+            results_count_label.configure(
+                text="Click a transaction to view details" if results_table.row_count else ""
+            )
+        
+        # A new search replaces one still running
+        if search_spinner[0] is not None:
+            search_spinner[0].cancel()
+        search_spinner[0] = LoadingSpinner(results_frame, "Searching...", token=CancellationToken())
+        search_spinner[0].run(
+            fetch_first_page,
+            on_success=show_results,
+            on_error=lambda e: messagebox.showerror("Error", f"Search failed: {e}")
+        )
     
-    def view_transaction_details(event=None):
+    def view_transaction_details(trans_id):
         """View details of selected transaction"""
         try:
-            # Get selected line
-            index = results_text.index("insert")
-            line_num = int(index.split('.')[0])
-            line = results_text.get(f"{line_num}.0", f"{line_num}.end")
-            
-            # Skip header and separator lines
-            if line_num <= 2 or "=" in line or "Total:" in line or "Double-click" in line:
-                return
-            
-            # Extract transaction ID (first column)
-            trans_id = line.split()[0]
-            if not trans_id.isdigit():
-                return
-            
-            selected_transaction_id[0] = int(trans_id)
+            selected_transaction_id[0] = trans_id
             
             # Get transaction details
             cursor.execute("""
@@ -225,7 +225,7 @@ def show_refund_manager(parent):
             
             # Get transaction items
             cursor.execute("""
-                SELECT si.product_id, p.name, si.quantity, si.unit_price, si.subtotal
+                SELECT si.product_id, p.name, si.quantity_sold, si.unit_price, si.sub_total
                 FROM sales_items si
                 JOIN products p ON si.product_id = p.id
                 WHERE si.transaction_id = ?
@@ -267,13 +267,10 @@ def show_refund_manager(parent):
         except Exception as e:
             pass  # Silently ignore selection errors
     
-    # Bind double-click to view details
-    results_text.bind("<Double-Button-1>", view_transaction_details)
-    
     def process_refund():
         """Process refund for selected transaction"""
         if not selected_transaction_id[0]:
-            messagebox.showwarning("No Selection", "Please select a transaction first by double-clicking it in the results.")
+            messagebox.showwarning("No Selection", "Please select a transaction first by clicking it in the results.")
             return
         
         trans_id = selected_transaction_id[0]
@@ -353,7 +350,7 @@ def show_refund_manager(parent):
                 # Restore stock if requested
                 if restore_stock_var.get():
                     cursor.execute("""
-                        SELECT product_id, quantity
+                        SELECT product_id, quantity_sold
                         FROM sales_items
                         WHERE transaction_id = ?
                     """, (trans_id,))
@@ -362,7 +359,7 @@ def show_refund_manager(parent):
                     for product_id, qty in items:
                         cursor.execute("""
                             UPDATE products
-                            SET stock = stock + ?
+                            SET stock_quantity = stock_quantity + ?
                             WHERE id = ?
                         """, (qty, product_id))
                 
@@ -435,19 +432,6 @@ def show_refund_manager(parent):
         width=120
     ).pack(side="right", padx=10)
     
-    # Create refunds table if it doesn't exist
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS refunds (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            transaction_id INTEGER NOT NULL,
-            refund_amount REAL NOT NULL,
-            refund_reason TEXT,
-            refund_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (transaction_id) REFERENCES transactions(id)
-        )
-    """)
-    conn.commit()
-    
     # Set default date range to last 30 days
     set_last_30_days()
 
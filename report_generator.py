@@ -5,11 +5,37 @@ Generate comprehensive business reports in text and CSV formats
 
 import customtkinter as ctk
 from tkinter import messagebox, filedialog
-import sqlite3
+from db import get_connection, date_key
+from data_access import customer_totals, customer_report_page, iter_pages, reorder_candidates, FORECAST_DAYS
+from ui_components import VirtualTable, TableColumn, ListRowProvider, PagedRowProvider, LoadingSpinner
+from async_executor import CancellationToken, TaskTimeout
 import csv
 from datetime import datetime, timedelta
 import os
 
+REPORT_TIMEOUT = 120  # Seconds before a report is abandoned
+
+
+def lkr(value):
+    """Money with cents, e.g. 'LKR 1,250.00'"""
+    return f"LKR {value or 0:,.2f}"
+
+
+def lkr_whole(value):
+    """Money rounded to rupees, e.g. 'LKR 1,250'"""
+    return f"LKR {value or 0:,.0f}"
+
+
+def table_lines(columns, rows):
+    """Fixed-width text lines for table rows (for TXT export)"""
+    widths = [max(len(column.title), column.width // 8) for column in columns]
+    yield " ".join(column.title.ljust(width) for column, width in zip(columns, widths)).rstrip() + "\n"
+    yield "-" * (sum(widths) + len(widths) - 1) + "\n"
+    for row in rows:
+        yield " ".join(
+            column.text(row)[:width].ljust(width) for column, width in zip(columns, widths)
+        ).rstrip() + "\n"
+
 
 class ReportGenerator(ctk.CTkToplevel):
     """Report Generator Window"""
@@ -55,37 +81,38 @@ class ReportGenerator(ctk.CTkToplevel):
             font=("Roboto", 16, "bold")
         ).pack(pady=10)
         
-        # Report types
+        # Report types (each builder runs on a worker thread)
         reports = [
-            ("📈 Daily Sales Report", self.generate_daily_sales),
-            ("📅 Monthly Sales Report", self.generate_monthly_sales),
-            ("📊 Product Performance", self.generate_product_performance),
-            ("💰 Profit Analysis", self.generate_profit_analysis),
-            ("👥 Customer Report", self.generate_customer_report),
-            ("📦 Inventory Report", self.generate_inventory_report),
-            ("⚠️ Low Stock Alert", self.generate_low_stock_report),
-            ("💳 Payment Methods", self.generate_payment_methods_report),
-            ("🏆 Top Customers", self.generate_top_customers_report),
-            ("📉 Sales Trends (7 Days)", self.generate_sales_trend_report),
+            ("📈 Daily Sales Report", self.build_daily_sales),
+            ("📅 Monthly Sales Report", self.build_monthly_sales),
+            ("📊 Product Performance", self.build_product_performance),
+            ("💰 Profit Analysis", self.build_profit_analysis),
+            ("👥 Customer Report", self.build_customer_report),
+            ("📦 Inventory Report", self.build_inventory_report),
+            ("⚠️ Low Stock Alert", self.build_low_stock_report),
+            ("💳 Payment Methods", self.build_payment_methods_report),
+            ("🏆 Top Customers", self.build_top_customers_report),
+            ("📉 Sales Trends (7 Days)", self.build_sales_trend_report),
         ]
         
-        for text, command in reports:
+        for text, build in reports:
             btn = ctk.CTkButton(
                 selection_frame,
                 text=text,
-                command=command,
+                command=lambda b=build: self.run_report(b),
                 anchor="w",
                 height=40
             )
             btn.pack(fill="x", padx=10, pady=5)
         
-        # Right side - report display
-        self.report_frame = ctk.CTkScrollableFrame(types_frame)
+        # Right side - report display: summary text above a virtualized table
+        self.report_frame = ctk.CTkFrame(types_frame)
         self.report_frame.pack(side="right", fill="both", expand=True, pady=10)
         
         # Display initial message
-        self.report_text = ctk.CTkTextbox(self.report_frame, font=("Courier New", 11))
-        self.report_text.pack(fill="both", expand=True)
+        self.report_text = ctk.CTkTextbox(self.report_frame, font=("Courier New", 11), height=170)
+        self.report_text.pack(fill="x")
+        self.report_table = None
         self.report_text.insert("1.0", "Select a report type from the left to generate a report...")
         self.report_text.configure(state="disabled")
         
@@ -111,9 +138,42 @@ class ReportGenerator(ctk.CTkToplevel):
         
         self.current_report_data = None
         self.current_report_type = None
+        self.current_report_columns = None
+        self.report_spinner = None
     
-    def display_report(self, title, content, data=None):
-        """Display report in the text area"""
+    def run_report(self, build):
+        """
+        Build a report off the Tk thread and display it when ready.
+        
+        build() returns display_report's arguments. Starting another report
+        cancels one still running.
+        """
+        if self.report_spinner is not None:
+            self.report_spinner.cancel()
+        
+        self.report_spinner = LoadingSpinner(self.report_frame, "Generating report...", token=CancellationToken())
+        self.report_spinner.run(
+            build,
+            on_success=lambda report: self.display_report(*report),
+            on_error=self.on_report_failed,
+            timeout=REPORT_TIMEOUT
+        )
+    
+    def on_report_failed(self, error):
+        """Report a failed or timed-out report"""
+        if isinstance(error, TaskTimeout):
+            messagebox.showerror("Error", "The report took too long and was cancelled.")
+        else:
+            messagebox.showerror("Error", f"Failed to generate report: {error}")
+    
+    def display_report(self, title, content, data=None, columns=None, provider=None):
+        """
+        Display report summary text, and its rows in a table.
+        
+        data is a list of rows, or a function returning an iterator of rows
+        for reports too large to hold in memory (then provider pages the
+        table). Rows are exported to CSV as-is.
+        """
         self.report_text.configure(state="normal")
         self.report_text.delete("1.0", "end")
         
@@ -126,429 +186,414 @@ class ReportGenerator(ctk.CTkToplevel):
         self.report_text.insert("1.0", header + content)
         self.report_text.configure(state="disabled")
         
+        # Columns differ per report, so each report gets a fresh table
+        if self.report_table is not None:
+            self.report_table.destroy()
+            self.report_table = None
+        if columns:
+            self.report_table = VirtualTable(self.report_frame, columns, row_height=32)
+            self.report_table.pack(fill="both", expand=True, pady=(5, 0))
+            self.report_table.set_provider(provider or ListRowProvider(data or []))
+        
         self.current_report_data = data
         self.current_report_type = title
+        self.current_report_columns = columns
     
-    def generate_daily_sales(self):
+    def build_daily_sales(self):
         """Generate daily sales report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # Get transactions
-            cursor.execute("""
-                SELECT t.id, t.date_time, t.total_amount, t.payment_method,
-                       c.name, c.phone_number
-                FROM transactions t
-                LEFT JOIN customers c ON t.customer_id = c.id
-                WHERE DATE(t.date_time) = ?
-                ORDER BY t.date_time DESC
-            """, (today,))
-            
-            transactions = cursor.fetchall()
-            
-            # Calculate stats
-            total_sales = sum(t[2] for t in transactions)
-            transaction_count = len(transactions)
-            avg_transaction = total_sales / transaction_count if transaction_count > 0 else 0
-            
-            # Build report
-            content = f"Date: {today}\n\n"
-            content += f"Total Sales: LKR {total_sales:,.2f}\n"
-            content += f"Transactions: {transaction_count}\n"
-            content += f"Average Transaction: LKR {avg_transaction:,.2f}\n\n"
-            content += "-"*80 + "\n"
-            content += f"{'Time':<20} {'Customer':<25} {'Amount':<15} {'Payment'}\n"
-            content += "-"*80 + "\n"
-            
-            for trans in transactions:
-                trans_id, date_time, amount, payment, cust_name, cust_phone = trans
-                time = date_time.split()[1] if ' ' in date_time else date_time
-                customer = cust_name or cust_phone or "Walk-in"
-                content += f"{time:<20} {customer[:24]:<25} {f'LKR {amount:,.2f}':<15} {payment or 'Cash'}\n"
-            
-            conn.close()
-            
-            self.display_report("DAILY SALES REPORT", content, transactions)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        # Get transactions
+        cursor.execute("""
+            SELECT t.id, t.date_time, t.total_amount, t.payment_method,
+                   c.name, c.phone_number
+            FROM transactions t
+            LEFT JOIN customers c ON t.customer_id = c.id
+            WHERE t.date_key = ?
+            ORDER BY t.date_time DESC
+        """, (date_key(today),))
+        
+        transactions = cursor.fetchall()
+        
+        # Calculate stats
+        total_sales = sum(t[2] for t in transactions)
+        transaction_count = len(transactions)
+        avg_transaction = total_sales / transaction_count if transaction_count > 0 else 0
+        
+        # Build report
+        content = f"Date: {today}\n\n"
+        content += f"Total Sales: LKR {total_sales:,.2f}\n"
+        content += f"Transactions: {transaction_count}\n"
+        content += f"Average Transaction: LKR {avg_transaction:,.2f}\n"
+        
+        columns = [
+            TableColumn("Time", 160, lambda t: t[1].split()[1] if ' ' in t[1] else t[1],
+                        sort_key='time', anchor="w"),
+            TableColumn("Customer", 200, lambda t: (t[4] or t[5] or "Walk-in")[:24],
+                        sort_key='customer', anchor="w"),
+            TableColumn("Amount", 120, 2, fmt=lkr, sort_key='amount'),
+            TableColumn("Payment", 100, 3, fmt=lambda v: v or "Cash", sort_key='payment'),
+        ]
+        
+        conn.close()
+        
+        return "DAILY SALES REPORT", content, transactions, columns
     
-    def generate_monthly_sales(self):
+    def build_monthly_sales(self):
         """Generate monthly sales report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get current month
-            now = datetime.now()
-            month_start = now.replace(day=1).strftime('%Y-%m-%d')
-            
-            # Get monthly data
-            cursor.execute("""
-                SELECT DATE(date_time) as sale_date,
-                       COUNT(*) as transactions,
-                       SUM(total_amount) as daily_sales
-                FROM transactions
-                WHERE DATE(date_time) >= ?
-                GROUP BY DATE(date_time)
-                ORDER BY sale_date
-            """, (month_start,))
-            
-            daily_data = cursor.fetchall()
-            
-            # Total stats
-            total_sales = sum(d[2] for d in daily_data)
-            total_transactions = sum(d[1] for d in daily_data)
-            avg_daily = total_sales / len(daily_data) if daily_data else 0
-            
-            # Build report
-            content = f"Month: {now.strftime('%B %Y')}\n\n"
-            content += f"Total Sales: LKR {total_sales:,.2f}\n"
-            content += f"Total Transactions: {total_transactions}\n"
-            content += f"Average Daily Sales: LKR {avg_daily:,.2f}\n"
-            content += f"Trading Days: {len(daily_data)}\n\n"
-            content += "-"*80 + "\n"
-            content += f"{'Date':<15} {'Transactions':<15} {'Sales'}\n"
-            content += "-"*80 + "\n"
-            
-            for date, trans_count, sales in daily_data:
-                content += f"{date:<15} {trans_count:<15} LKR {sales:,.2f}\n"
-            
-            conn.close()
-            
-            self.display_report("MONTHLY SALES REPORT", content, daily_data)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        # Get current month
+        now = datetime.now()
+        month_start = now.replace(day=1).strftime('%Y-%m-%d')
+        
+        # Get monthly data
+        cursor.execute("""
+            SELECT c.date as sale_date,
+                   s.transaction_count as transactions,
+                   s.gross_sales as daily_sales
+            FROM sales_daily s
+            JOIN calendar c ON c.date_key = s.date_key
+            WHERE s.date_key >= ?
+              AND s.transaction_count > 0
+            ORDER BY s.date_key
+        """, (date_key(month_start),))
+        
+        daily_data = cursor.fetchall()
+        
+        # Total stats
+        total_sales = sum(d[2] for d in daily_data)
+        total_transactions = sum(d[1] for d in daily_data)
+        avg_daily = total_sales / len(daily_data) if daily_data else 0
+        
+        # Build report
+        content = f"Month: {now.strftime('%B %Y')}\n\n"
+        content += f"Total Sales: LKR {total_sales:,.2f}\n"
+        content += f"Total Transactions: {total_transactions}\n"
+        content += f"Average Daily Sales: LKR {avg_daily:,.2f}\n"
+        content += f"Trading Days: {len(daily_data)}\n"
+        
+        columns = [
+            TableColumn("Date", 120, 0, sort_key='date', anchor="w"),
+            TableColumn("Transactions", 120, 1, sort_key='transactions'),
+            TableColumn("Sales", 150, 2, fmt=lkr, sort_key='sales'),
+        ]
+        
+        conn.close()
+        
+        return "MONTHLY SALES REPORT", content, daily_data, columns
     
-    def generate_product_performance(self):
+    def build_product_performance(self):
         """Generate product performance report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT p.name, p.category,
-                       COUNT(si.id) as times_sold,
-                       SUM(si.quantity_sold) as total_quantity,
-                       SUM(si.sub_total) as total_revenue,
-                       p.stock_quantity
-                FROM products p
-                LEFT JOIN sales_items si ON p.id = si.product_id
-                GROUP BY p.id
-                ORDER BY total_revenue DESC
-            """)
-            
-            products = cursor.fetchall()
-            
-            # Build report
-            content = f"Total Products: {len(products)}\n\n"
-            content += "-"*100 + "\n"
-            content += f"{'Product':<35} {'Category':<15} {'Qty Sold':<12} {'Revenue':<18} {'Stock'}\n"
-            content += "-"*100 + "\n"
-            
-            for prod in products:
-                name, category, times_sold, quantity, revenue, stock = prod
-                quantity = quantity or 0
-                revenue = revenue or 0
-                content += f"{name[:34]:<35} {(category or 'N/A')[:14]:<15} {quantity:<12.0f} {f'LKR {revenue:,.2f}':<18} {stock:.0f}\n"
-            
-            conn.close()
-            
-            self.display_report("PRODUCT PERFORMANCE REPORT", content, products)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT p.name, p.category,
+                   SUM(s.line_count) as times_sold,
+                   SUM(s.quantity) as total_quantity,
+                   SUM(s.revenue) as total_revenue,
+                   p.stock_quantity
+            FROM products p
+            LEFT JOIN sales_daily_product s ON p.id = s.product_id
+            GROUP BY p.id
+            ORDER BY total_revenue DESC
+        """)
+        
+        products = cursor.fetchall()
+        
+        # Build report
+        content = f"Total Products: {len(products)}\n"
+        
+        columns = [
+            TableColumn("Product", 260, 0, fmt=lambda v: v[:34], sort_key='name', anchor="w"),
+            TableColumn("Category", 120, 1, fmt=lambda v: (v or "N/A")[:14], sort_key='category'),
+            TableColumn("Qty Sold", 90, 3, fmt=lambda v: f"{v or 0:.0f}", sort_key='quantity'),
+            TableColumn("Revenue", 140, 4, fmt=lkr, sort_key='revenue'),
+            TableColumn("Stock", 80, 5, fmt=lambda v: f"{v:.0f}", sort_key='stock'),
+        ]
+        
+        conn.close()
+        
+        return "PRODUCT PERFORMANCE REPORT", content, products, columns
     
-    def generate_profit_analysis(self):
+    def build_profit_analysis(self):
         """Generate profit analysis report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT p.name, p.category,
-                       SUM(si.quantity_sold) as quantity_sold,
-                       p.cost_price, p.price_per_unit,
-                       SUM(si.sub_total) as revenue,
-                       SUM(si.quantity_sold * p.cost_price) as cost
-                FROM sales_items si
-                JOIN products p ON si.product_id = p.id
-                GROUP BY si.product_id
-                ORDER BY (SUM(si.sub_total) - SUM(si.quantity_sold * p.cost_price)) DESC
-            """)
-            
-            products = cursor.fetchall()
-            
-            total_revenue = sum(p[5] for p in products)
-            total_cost = sum(p[6] for p in products)
-            total_profit = total_revenue - total_cost
-            profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-            
-            # Build report
-            content = f"Total Revenue: LKR {total_revenue:,.2f}\n"
-            content += f"Total Cost: LKR {total_cost:,.2f}\n"
-            content += f"Total Profit: LKR {total_profit:,.2f}\n"
-            content += f"Profit Margin: {profit_margin:.2f}%\n\n"
-            content += "-"*110 + "\n"
-            content += f"{'Product':<30} {'Category':<12} {'Qty':<8} {'Revenue':<16} {'Cost':<16} {'Profit':<16} {'Margin'}\n"
-            content += "-"*110 + "\n"
-            
-            for prod in products:
-                name, category, qty, cost_price, sell_price, revenue, cost = prod
-                profit = revenue - cost
-                margin = (profit / revenue * 100) if revenue > 0 else 0
-                
-                content += f"{name[:29]:<30} {(category or 'N/A')[:11]:<12} {qty:<8.0f} "
-                content += f"{f'LKR {revenue:,.0f}':<16} {f'LKR {cost:,.0f}':<16} "
-                content += f"{f'LKR {profit:,.0f}':<16} {margin:.1f}%\n"
-            
-            conn.close()
-            
-            self.display_report("PROFIT ANALYSIS REPORT", content, products)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT p.name, p.category,
+                   SUM(s.quantity) as quantity_sold,
+                   p.cost_price, p.price_per_unit,
+                   SUM(s.revenue) as revenue,
+                   SUM(s.quantity * p.cost_price) as cost
+            FROM sales_daily_product s
+            JOIN products p ON s.product_id = p.id
+            GROUP BY s.product_id
+            ORDER BY (SUM(s.revenue) - SUM(s.quantity * p.cost_price)) DESC
+        """)
+        
+        products = cursor.fetchall()
+        
+        total_revenue = sum(p[5] for p in products)
+        total_cost = sum(p[6] for p in products)
+        total_profit = total_revenue - total_cost
+        profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+        
+        # Build report
+        content = f"Total Revenue: LKR {total_revenue:,.2f}\n"
+        content += f"Total Cost: LKR {total_cost:,.2f}\n"
+        content += f"Total Profit: LKR {total_profit:,.2f}\n"
+        content += f"Profit Margin: {profit_margin:.2f}%\n"
+        
+        def margin(p):
+            return ((p[5] - p[6]) / p[5] * 100) if p[5] > 0 else 0
+        
+        columns = [
+            TableColumn("Product", 220, 0, fmt=lambda v: v[:29], sort_key='name', anchor="w"),
+            TableColumn("Category", 100, 1, fmt=lambda v: (v or "N/A")[:11], sort_key='category'),
+            TableColumn("Qty", 60, 2, fmt=lambda v: f"{v:.0f}", sort_key='quantity'),
+            TableColumn("Revenue", 120, 5, fmt=lkr_whole, sort_key='revenue'),
+            TableColumn("Cost", 120, 6, fmt=lkr_whole, sort_key='cost'),
+            TableColumn("Profit", 120, lambda p: p[5] - p[6], fmt=lkr_whole, sort_key='profit'),
+            TableColumn("Margin", 70, margin, fmt=lambda v: f"{v:.1f}%", sort_key='margin'),
+        ]
+        
+        conn.close()
+        
+        return "PROFIT ANALYSIS REPORT", content, products, columns
     
-    def generate_customer_report(self):
+    def build_customer_report(self):
         """Generate customer report"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        totals = customer_totals(cursor)
+        total_customers = totals['count']
+        total_value = totals['total_purchases']
+        active_customers = totals['active']
+        
+        # Build report
+        content = f"Total Customers: {total_customers}\n"
+        content += f"Active Customers: {active_customers}\n"
+        content += f"Total Customer Value: LKR {total_value:,.2f}\n"
+        content += f"Average Value: LKR {total_value/total_customers if total_customers > 0 else 0:,.2f}\n"
+        
+        conn.close()
+        
+        # Every customer, fetched a page at a time as the table scrolls
+        columns = [
+            TableColumn("Name", 200, 0, fmt=lambda v: (v or "N/A")[:24], sort_key='name', anchor="w"),
+            TableColumn("Phone", 120, 1, sort_key='phone_number'),
+            TableColumn("Purchases", 130, 2, fmt=lkr_whole, sort_key='total_purchases'),
+            TableColumn("Points", 80, 3, fmt=lambda v: f"{v or 0:.0f}", sort_key='loyalty_points'),
+            TableColumn("Trans.", 70, 4),
+            TableColumn("Last Purchase", 110, 5, fmt=lambda v: v[:10] if v else "Never"),
+        ]
+        
+        return (
+            "CUSTOMER REPORT", content, self.stream_customer_report, columns,
+            PagedRowProvider(self.fetch_customer_report_page)
+        )
+    
+    def fetch_customer_report_page(self, after, order):
+        """One page of the customer report table"""
+        conn = get_connection(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT c.name, c.phone_number, c.total_purchases, c.loyalty_points,
-                       COUNT(t.id) as transaction_count,
-                       MAX(t.date_time) as last_purchase
-                FROM customers c
-                LEFT JOIN transactions t ON c.id = t.customer_id
-                GROUP BY c.id
-                ORDER BY c.total_purchases DESC
-            """)
-            
-            customers = cursor.fetchall()
-            
-            total_customers = len(customers)
-            total_value = sum(c[2] for c in customers)
-            active_customers = sum(1 for c in customers if c[4] > 0)
-            
-            # Build report
-            content = f"Total Customers: {total_customers}\n"
-            content += f"Active Customers: {active_customers}\n"
-            content += f"Total Customer Value: LKR {total_value:,.2f}\n"
-            content += f"Average Value: LKR {total_value/total_customers if total_customers > 0 else 0:,.2f}\n\n"
-            content += "-"*105 + "\n"
-            content += f"{'Name':<25} {'Phone':<15} {'Purchases':<16} {'Points':<10} {'Trans.':<10} {'Last Purchase'}\n"
-            content += "-"*105 + "\n"
-            
-            for cust in customers:
-                name, phone, purchases, points, trans_count, last_purchase = cust
-                last = last_purchase[:10] if last_purchase else "Never"
-                content += f"{(name or 'N/A')[:24]:<25} {phone:<15} {f'LKR {purchases:,.0f}':<16} "
-                content += f"{points:<10.0f} {trans_count:<10} {last}\n"
-            
+            return customer_report_page(conn.cursor(), after=after, order=order)
+        finally:
             conn.close()
-            
-            self.display_report("CUSTOMER REPORT", content, customers)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
     
-    def generate_inventory_report(self):
-        """Generate inventory valuation report"""
+    def stream_customer_report(self):
+        """Every customer report row, read page by page (used by exports)"""
+        conn = get_connection(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT name, category, stock_quantity, cost_price, price_per_unit,
-                       (stock_quantity * cost_price) as cost_value,
-                       (stock_quantity * price_per_unit) as selling_value
-                FROM products
-                WHERE stock_quantity > 0
-                ORDER BY cost_value DESC
-            """)
-            
-            products = cursor.fetchall()
-            
-            total_cost = sum(p[5] for p in products)
-            total_selling = sum(p[6] for p in products)
-            potential_profit = total_selling - total_cost
-            
-            # Build report
-            content = f"Items in Stock: {len(products)}\n"
-            content += f"Total Inventory Cost: LKR {total_cost:,.2f}\n"
-            content += f"Total Selling Value: LKR {total_selling:,.2f}\n"
-            content += f"Potential Profit: LKR {potential_profit:,.2f}\n\n"
-            content += "-"*110 + "\n"
-            content += f"{'Product':<30} {'Category':<12} {'Stock':<10} {'Cost/Unit':<14} {'Cost Value':<16} {'Sell Value'}\n"
-            content += "-"*110 + "\n"
-            
-            for prod in products:
-                name, category, stock, cost_price, sell_price, cost_val, sell_val = prod
-                content += f"{name[:29]:<30} {(category or 'N/A')[:11]:<12} {stock:<10.0f} "
-                content += f"{f'LKR {cost_price:,.0f}':<14} {f'LKR {cost_val:,.0f}':<16} LKR {sell_val:,.0f}\n"
-            
+            yield from iter_pages(customer_report_page, conn.cursor())
+        finally:
             conn.close()
-            
-            self.display_report("INVENTORY VALUATION REPORT", content, products)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
     
-    def generate_low_stock_report(self):
+    def build_inventory_report(self):
+        """Generate inventory valuation report"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT name, category, stock_quantity, cost_price, price_per_unit,
+                   (stock_quantity * cost_price) as cost_value,
+                   (stock_quantity * price_per_unit) as selling_value
+            FROM products
+            WHERE stock_quantity > 0
+            ORDER BY cost_value DESC
+        """)
+        
+        products = cursor.fetchall()
+        
+        total_cost = sum(p[5] for p in products)
+        total_selling = sum(p[6] for p in products)
+        potential_profit = total_selling - total_cost
+        
+        # Build report
+        content = f"Items in Stock: {len(products)}\n"
+        content += f"Total Inventory Cost: LKR {total_cost:,.2f}\n"
+        content += f"Total Selling Value: LKR {total_selling:,.2f}\n"
+        content += f"Potential Profit: LKR {potential_profit:,.2f}\n"
+        
+        columns = [
+            TableColumn("Product", 220, 0, fmt=lambda v: v[:29], sort_key='name', anchor="w"),
+            TableColumn("Category", 100, 1, fmt=lambda v: (v or "N/A")[:11], sort_key='category'),
+            TableColumn("Stock", 80, 2, fmt=lambda v: f"{v:.0f}", sort_key='stock'),
+            TableColumn("Cost/Unit", 110, 3, fmt=lkr_whole, sort_key='cost_price'),
+            TableColumn("Cost Value", 130, 5, fmt=lkr_whole, sort_key='cost_value'),
+            TableColumn("Sell Value", 130, 6, fmt=lkr_whole, sort_key='selling_value'),
+        ]
+        
+        conn.close()
+        
+        return "INVENTORY VALUATION REPORT", content, products, columns
+    
+    def build_low_stock_report(self):
         """Generate low stock alert report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT name, category, stock_quantity, reorder_level, 
-                       price_per_unit, supplier_id
-                FROM products
-                WHERE stock_quantity <= reorder_level
-                ORDER BY (reorder_level - stock_quantity) DESC
-            """)
-            
-            products = cursor.fetchall()
-            
-            # Build report
-            content = f"⚠️ Low Stock Items: {len(products)}\n\n"
-            
-            if not products:
-                content += "All products are adequately stocked!\n"
-            else:
-                content += "-"*90 + "\n"
-                content += f"{'Product':<35} {'Category':<15} {'Stock':<10} {'Reorder':<10} {'Status'}\n"
-                content += "-"*90 + "\n"
-                
-                for prod in products:
-                    name, category, stock, reorder, price, supplier = prod
-                    shortage = reorder - stock
-                    status = "CRITICAL" if stock <= reorder * 0.5 else "LOW"
-                    content += f"{name[:34]:<35} {(category or 'N/A')[:14]:<15} {stock:<10.0f} {reorder:<10} {status}\n"
-            
-            conn.close()
-            
-            self.display_report("LOW STOCK ALERT REPORT", content, products)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        # Below reorder level, or short of the stored demand forecast
+        products = reorder_candidates(cursor)
+        
+        # Build report
+        content = f"⚠️ Low Stock Items: {len(products)}\n"
+        content += f"(includes items whose stock won't cover the {FORECAST_DAYS}-day forecast)\n\n"
+        
+        if not products:
+            content += "All products are adequately stocked!\n"
+        
+        def status(p):
+            if p[3] <= p[4] * 0.5:
+                return "CRITICAL"
+            return "LOW" if p[3] <= p[4] else "FORECAST"
+        
+        columns = [
+            TableColumn("Product", 240, 1, fmt=lambda v: v[:31], sort_key='name', anchor="w"),
+            TableColumn("Category", 110, 2, fmt=lambda v: (v or "N/A")[:13], sort_key='category'),
+            TableColumn("Stock", 70, 3, fmt=lambda v: f"{v:.0f}", sort_key='stock'),
+            TableColumn("Reorder", 70, 4, sort_key='reorder_level'),
+            TableColumn(f"{FORECAST_DAYS}d Demand", 100, 5, fmt=lambda v: f"{v:.0f}", sort_key='demand'),
+            TableColumn("Status", 90, status, sort_key='status'),
+        ]
+        
+        conn.close()
+        
+        return "LOW STOCK ALERT REPORT", content, products, columns
     
-    def generate_payment_methods_report(self):
+    def build_payment_methods_report(self):
         """Generate payment methods breakdown"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT payment_method, COUNT(*) as count, SUM(total_amount) as total
-                FROM transactions
-                GROUP BY payment_method
-                ORDER BY total DESC
-            """)
-            
-            methods = cursor.fetchall()
-            
-            total_amount = sum(m[2] for m in methods)
-            
-            # Build report
-            content = f"Total Sales: LKR {total_amount:,.2f}\n\n"
-            content += "-"*70 + "\n"
-            content += f"{'Payment Method':<25} {'Transactions':<18} {'Amount':<20} {'%'}\n"
-            content += "-"*70 + "\n"
-            
-            for method, count, amount in methods:
-                percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-                content += f"{(method or 'Cash'):<25} {count:<18} {f'LKR {amount:,.2f}':<20} {percentage:.1f}%\n"
-            
-            conn.close()
-            
-            self.display_report("PAYMENT METHODS REPORT", content, methods)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT payment_method, SUM(transaction_count) as count, SUM(amount) as total
+            FROM sales_daily_payment
+            GROUP BY payment_method
+            ORDER BY total DESC
+        """)
+        
+        methods = cursor.fetchall()
+        
+        total_amount = sum(m[2] for m in methods)
+        
+        # Build report
+        content = f"Total Sales: LKR {total_amount:,.2f}\n"
+        
+        columns = [
+            TableColumn("Payment Method", 180, 0, fmt=lambda v: v or "Cash", sort_key='method', anchor="w"),
+            TableColumn("Transactions", 120, 1, sort_key='count'),
+            TableColumn("Amount", 150, 2, fmt=lkr, sort_key='amount'),
+            TableColumn("%", 70, lambda m: (m[2] / total_amount * 100) if total_amount > 0 else 0,
+                        fmt=lambda v: f"{v:.1f}%", sort_key='share'),
+        ]
+        
+        conn.close()
+        
+        return "PAYMENT METHODS REPORT", content, methods, columns
     
-    def generate_top_customers_report(self):
+    def build_top_customers_report(self):
         """Generate top customers report"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT c.name, c.phone_number, c.total_purchases, 
-                       COUNT(t.id) as transactions,
-                       AVG(t.total_amount) as avg_transaction
-                FROM customers c
-                JOIN transactions t ON c.id = t.customer_id
-                GROUP BY c.id
-                ORDER BY c.total_purchases DESC
-                LIMIT 20
-            """)
-            
-            customers = cursor.fetchall()
-            
-            # Build report
-            content = f"Top 20 Customers by Purchase Value\n\n"
-            content += "-"*95 + "\n"
-            content += f"{'Rank':<6} {'Name':<25} {'Phone':<15} {'Total':<18} {'Trans.':<10} {'Avg'}\n"
-            content += "-"*95 + "\n"
-            
-            for i, cust in enumerate(customers, 1):
-                name, phone, total, trans, avg in cust
-                content += f"{i:<6} {(name or 'N/A')[:24]:<25} {phone:<15} {f'LKR {total:,.0f}':<18} {trans:<10} LKR {avg:,.0f}\n"
-            
-            conn.close()
-            
-            self.display_report("TOP CUSTOMERS REPORT", content, customers)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT c.name, c.phone_number, c.total_purchases, 
+                   COUNT(t.id) as transactions,
+                   AVG(t.total_amount) as avg_transaction
+            FROM customers c
+            JOIN transactions t ON c.id = t.customer_id
+            GROUP BY c.id
+            ORDER BY c.total_purchases DESC
+            LIMIT 20
+        """)
+        
+        # Rank is part of the row so it survives re-sorting
+        customers = [(i,) + tuple(cust) for i, cust in enumerate(cursor.fetchall(), 1)]
+        
+        # Build report
+        content = f"Top 20 Customers by Purchase Value\n"
+        
+        columns = [
+            TableColumn("Rank", 50, 0, sort_key='rank'),
+            TableColumn("Name", 200, 1, fmt=lambda v: (v or "N/A")[:24], sort_key='name', anchor="w"),
+            TableColumn("Phone", 120, 2, sort_key='phone'),
+            TableColumn("Total", 130, 3, fmt=lkr_whole, sort_key='total'),
+            TableColumn("Trans.", 70, 4, sort_key='transactions'),
+            TableColumn("Avg", 110, 5, fmt=lkr_whole, sort_key='average'),
+        ]
+        
+        conn.close()
+        
+        return "TOP CUSTOMERS REPORT", content, customers, columns
     
-    def generate_sales_trend_report(self):
+    def build_sales_trend_report(self):
         """Generate 7-day sales trend"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Last 7 days
-            dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
-            
-            daily_sales = []
-            for date in dates:
-                cursor.execute("""
-                    SELECT COUNT(*), COALESCE(SUM(total_amount), 0)
-                    FROM transactions
-                    WHERE DATE(date_time) = ?
-                """, (date,))
-                count, total = cursor.fetchone()
-                daily_sales.append((date, count, total))
-            
-            total_week = sum(d[2] for d in daily_sales)
-            avg_daily = total_week / 7
-            
-            # Build report
-            content = f"7-Day Sales Trend\n\n"
-            content += f"Total Week Sales: LKR {total_week:,.2f}\n"
-            content += f"Average Daily: LKR {avg_daily:,.2f}\n\n"
-            content += "-"*70 + "\n"
-            content += f"{'Date':<15} {'Day':<12} {'Transactions':<15} {'Sales'}\n"
-            content += "-"*70 + "\n"
-            
-            for date_str, count, total in daily_sales:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                day_name = date_obj.strftime('%A')
-                content += f"{date_str:<15} {day_name:<12} {count:<15} LKR {total:,.2f}\n"
-            
-            conn.close()
-            
-            self.display_report("SALES TREND REPORT (7 DAYS)", content, daily_sales)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {e}")
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        # Last 7 days
+        dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
+        
+        # One range scan over the daily rollup instead of a query per day
+        cursor.execute("""
+            SELECT date_key, transaction_count, gross_sales
+            FROM sales_daily
+            WHERE date_key BETWEEN ? AND ?
+        """, (date_key(dates[0]), date_key(dates[-1])))
+        totals_by_key = {row[0]: row[1:] for row in cursor.fetchall()}
+        
+        daily_sales = []
+        for date in dates:
+            count, total = totals_by_key.get(date_key(date), (0, 0))
+            daily_sales.append((date, count, total))
+        
+        total_week = sum(d[2] for d in daily_sales)
+        avg_daily = total_week / 7
+        
+        # Build report
+        content = f"7-Day Sales Trend\n\n"
+        content += f"Total Week Sales: LKR {total_week:,.2f}\n"
+        content += f"Average Daily: LKR {avg_daily:,.2f}\n"
+        
+        columns = [
+            TableColumn("Date", 120, 0, sort_key='date', anchor="w"),
+            TableColumn("Day", 100, lambda d: datetime.strptime(d[0], '%Y-%m-%d').strftime('%A')),
+            TableColumn("Transactions", 120, 1, sort_key='transactions'),
+            TableColumn("Sales", 150, 2, fmt=lkr, sort_key='sales'),
+        ]
+        
+        conn.close()
+        
+        return "SALES TREND REPORT (7 DAYS)", content, daily_sales, columns
     
     def export_txt(self):
         """Export current report as TXT"""
@@ -564,13 +609,18 @@ class ReportGenerator(ctk.CTkToplevel):
         )
         
         if file_path:
-            try:
-                content = self.report_text.get("1.0", "end")
+            content = self.report_text.get("1.0", "end")
+            columns = self.current_report_columns
+            rows = self.current_report_data or []
+            
+            def write():
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(content)
-                messagebox.showinfo("Success", f"Report exported to {file_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export: {e}")
+                    if columns:
+                        f.write("\n")
+                        f.writelines(table_lines(columns, rows() if callable(rows) else rows))
+            
+            self.run_export(write, file_path)
     
     def export_csv(self):
         """Export current report data as CSV"""
@@ -586,13 +636,23 @@ class ReportGenerator(ctk.CTkToplevel):
         )
         
         if file_path:
-            try:
+            rows = self.current_report_data
+            
+            def write():
+                # Large reports pass a row generator factory instead of a list
                 with open(file_path, 'w', newline='', encoding='utf-8') as f:
                     writer = csv.writer(f)
-                    writer.writerows(self.current_report_data)
-                messagebox.showinfo("Success", f"Report exported to {file_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export: {e}")
+                    writer.writerows(rows() if callable(rows) else rows)
+            
+            self.run_export(write, file_path)
+    
+    def run_export(self, write, file_path):
+        """Write an export file on a worker thread"""
+        LoadingSpinner(self.report_frame, "Exporting...").run(
+            write,
+            on_success=lambda _: messagebox.showinfo("Success", f"Report exported to {file_path}"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to export: {e}")
+        )
 
 
 if __name__ == "__main__":
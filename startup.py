@@ -40,27 +40,29 @@ def check_dependencies():
         'cv2': 'Barcode Scanner',
         'matplotlib': 'Analytics',
         'pandas': 'Data Processing',
-        'sklearn': 'AI Predictions'
+        'numpy': 'AI Predictions'
     }
     
     missing_required = []
     missing_optional = []
     
+    # Locate modules without importing them (importing pandas, sklearn and
+    # cv2 here would cost seconds before the window even appears)
+    from feature_registry import module_available
+    
     # Check required modules
     for module, description in required_modules.items():
-        try:
-            __import__(module)
+        if module_available(module):
             print(f"   ✅ {description}")
-        except ImportError:
+        else:
             print(f"   ❌ {description} (missing: {module})")
             missing_required.append(module)
     
     # Check optional modules
     for module, description in optional_modules.items():
-        try:
-            __import__(module)
+        if module_available(module):
             print(f"   ✅ {description} (optional)")
-        except ImportError:
+        else:
             print(f"   ⚠️ {description} (optional, missing: {module})")
             missing_optional.append(module)
     
@@ -96,7 +98,8 @@ def check_database():
     
     # Test database connection
     try:
-        conn = sqlite3.connect(db_path)
+        from db import get_connection
+        conn = get_connection(db_path)
         cursor = conn.cursor()
         
         # Check required tables
@@ -0,0 +1,134 @@
+"""
+Stock Alerts for BuildSmartOS
+Low-stock crossings (recorded by trigger) coalesced into one WhatsApp digest per recipient
+"""
+import json
+from datetime import datetime, timedelta
+
+from db import DB_NAME, connection, transaction
+
+DIGEST_WINDOW_MINUTES = 30  # Gather alerts this long after the first one before sending
+DIGEST_MAX_LINES = 25       # Products listed per digest; the rest are summarized
+
+
+class StockAlertDigest:
+    """
+    Sends the alerts in stock_alerts as digests.
+
+    The stock_alert_update and stock_alert_insert triggers (database_setup)
+    add a row whenever a product drops to or below its reorder level, runs
+    out, or is added already low; hysteresis
+    there keeps a product hovering at its level from alerting repeatedly.
+    Once the oldest undigested alert is DIGEST_WINDOW_MINUTES old, every
+    undigested alert is folded into one message per recipient and queued
+    in the message outbox. Products that recovered in the meantime are
+    left out.
+    """
+
+    def __init__(self, db_name=DB_NAME, config=None):
+        self.db_name = db_name
+        self.config = config if config is not None else self.load_config()
+        settings = self.config.get("alerts", {})
+        self.window = timedelta(minutes=settings.get("digest_window_minutes", DIGEST_WINDOW_MINUTES))
+        self.recipients = settings.get("recipients") or [
+            phone for phone in [self.config.get("business", {}).get("phone")] if phone
+        ]
+
+    def load_config(self):
+        """Load configuration"""
+        try:
+            with open("config.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def digest_due(self, now=None):
+        """True once the oldest undigested alert has waited out the window"""
+        now = now or datetime.now()
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(created_at) FROM stock_alerts WHERE digested_at IS NULL")
+            oldest = cursor.fetchone()[0]
+        return oldest is not None and oldest <= (now - self.window).strftime("%Y-%m-%d %H:%M:%S")
+
+    def pending(self, cursor):
+        """
+        (last alert id, rows) for undigested alerts of products still below
+        their level; rows are (name, stock_quantity, reorder_level, level),
+        out-of-stock first.
+        """
+        cursor.execute("SELECT MAX(id) FROM stock_alerts WHERE digested_at IS NULL")
+        last_id = cursor.fetchone()[0]
+        if last_id is None:
+            return None, []
+        cursor.execute("""
+            SELECT p.name, p.stock_quantity, p.reorder_level, s.level
+            FROM stock_alert_state s
+            JOIN products p ON p.id = s.product_id
+            WHERE s.product_id IN (
+                SELECT product_id FROM stock_alerts WHERE digested_at IS NULL AND id <= ?
+            )
+            ORDER BY s.level = 'out' DESC, p.stock_quantity - COALESCE(p.reorder_level, 0), p.name
+        """, (last_id,))
+        return last_id, cursor.fetchall()
+
+    def create_message(self, rows):
+        """Format one digest"""
+        business_name = self.config.get("business", {}).get("name", "BuildSmart Hardware")
+        out = sum(1 for row in rows if row[3] == 'out')
+
+        message = f"⚠️ *LOW STOCK DIGEST* - {business_name}\n"
+        message += f"{len(rows)} product(s) need reordering"
+        message += f" ({out} out of stock)\n\n" if out else "\n\n"
+        for name, stock, reorder_level, level in rows[:DIGEST_MAX_LINES]:
+            marker = "❌" if level == 'out' else "•"
+            message += f"{marker} {name}: {stock:g} left (reorder at {reorder_level or 0})\n"
+        if len(rows) > DIGEST_MAX_LINES:
+            message += f"...and {len(rows) - DIGEST_MAX_LINES} more\n"
+        message += f"\n_BuildSmart OS Alert System_"
+        return message
+
+    def send(self, force=False):
+        """
+        Queue a digest for each recipient if one is due.
+
+        The alerts are marked digested only after every recipient's message
+        is queued; the outbox dedupe key makes a retry after a failure
+        harmless.
+
+        Returns:
+            (success, message); message is None when there was nothing to do
+        """
+        if not force and not self.digest_due():
+            return True, None
+        if not self.recipients:
+            return False, "No alert recipients configured (alerts.recipients in config.json)"
+
+        with connection(self.db_name) as conn:
+            last_id, rows = self.pending(conn.cursor())
+        if last_id is None:
+            return True, None
+
+        if rows:
+            from whatsapp_service import get_whatsapp_service
+            service = get_whatsapp_service()
+            message = self.create_message(rows)
+            for phone in self.recipients:
+                success, result = service.queue_message(phone, message, "alert",
+                                                        dedupe_key=f"stock-digest:{last_id}:{phone}")
+                if not success:
+                    return False, f"Stock digest not queued for {phone}: {result}"
+
+        with transaction(self.db_name) as conn:
+            conn.execute("""
+                UPDATE stock_alerts SET digested_at = datetime('now', 'localtime')
+                WHERE digested_at IS NULL AND id <= ?
+            """, (last_id,))
+        if not rows:
+            return True, "Alerted products have recovered; no digest needed"
+        return True, f"Stock digest with {len(rows)} product(s) queued for {len(self.recipients)} recipient(s)"
+
+
+def run_digest_job(force=False, db_name=DB_NAME):
+    """Send a stock digest if one is due (cheap when not; run it every minute or so)"""
+    return StockAlertDigest(db_name).send(force)
@@ -0,0 +1,82 @@
+"""
+Stub WhatsApp API for BuildSmartOS tests and benchmarks
+A local Cloud-API-shaped HTTP server whose replies can be scripted per request
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubWhatsAppHandler(BaseHTTPRequestHandler):
+    """
+    Cloud-API-shaped stub: /media returns an id, /messages accepts anything.
+
+    Responses queued in server.script are used first, one per request:
+    a status code, (status, headers) or (status, headers, body),
+    DROP_CONNECTION to close the socket without answering, or None for the
+    normal reply.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.paths.append(self.path)
+            scripted = self.server.script.popleft() if self.server.script else None
+            if scripted is None:
+                if self.path.endswith("/media"):
+                    self.server.uploads += 1
+                    reply = {'id': f"media-{self.server.uploads}"}
+                else:
+                    self.server.messages.append(json.loads(body))
+                    reply = {'messages': [{'id': f"wamid.{len(self.server.messages)}"}]}
+                status, headers = 200, {}
+
+        if scripted is DROP_CONNECTION:
+            self.close_connection = True
+            return
+        if scripted is not None:
+            if not isinstance(scripted, tuple):
+                scripted = (scripted,)
+            status = scripted[0]
+            headers = scripted[1] if len(scripted) > 1 else {}
+            reply = scripted[2] if len(scripted) > 2 else {'error': {'code': status}}
+        payload = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+DROP_CONNECTION = object()  # Scripted stub response: hang up without replying
+
+
+def start_stub_server(latency=0.0):
+    """Local stub WhatsApp API on a free port, served from a daemon thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWhatsAppHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.connections = server.requests = server.uploads = 0
+    server.messages = []
+    server.paths = []
+    server.script = deque()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,372 @@
+"""
+Message Transport Tests for BuildSmartOS
+HttpTransport against the local stub WhatsApp API, checked through MessageOutbox outcomes
+
+Run from the application folder:
+    python -m unittest discover tests
+"""
+import importlib.util
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import message_outbox
+from database_setup import migrate_message_outbox
+from db import close_all_pools, connection, transaction
+from message_outbox import MessageOutbox, TokenBucket, MAX_ATTEMPTS, BACKOFF_BASE_SECONDS
+from tests.stub_whatsapp import DROP_CONNECTION, start_stub_server
+
+REQUESTS_AVAILABLE = importlib.util.find_spec("requests") is not None
+
+
+@unittest.skipUnless(REQUESTS_AVAILABLE, "HttpTransport needs requests")
+class HttpTransportOutboxTest(unittest.TestCase):
+    """Each test queues messages, scripts the stub's replies and checks the outbox rows"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        from message_transports import HttpTransport
+
+        self.workdir = tempfile.mkdtemp(prefix="buildsmart_test_")
+        self.db_name = os.path.join(self.workdir, "outbox.db")
+        conn = sqlite3.connect(self.db_name)
+        migrate_message_outbox(conn.cursor())
+        conn.commit()
+        conn.close()
+
+        server = self.server
+        with server.lock:
+            server.script.clear()
+            server.messages.clear()
+            server.paths.clear()
+            server.requests = server.connections = 0
+
+        self.transport = HttpTransport(f"http://127.0.0.1:{server.server_port}/v19.0", "123456",
+                                       "test-key", timeout=5, concurrency=4)
+        self.outbox = MessageOutbox(self.db_name)
+        self.outbox.transport = self.transport
+        self.outbox.bucket = TokenBucket(1_000_000, burst=1000)
+
+    def tearDown(self):
+        self.outbox.stop()
+        self.transport.close()
+        close_all_pools()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # ---- helpers ----
+
+    def enqueue(self, recipient="+94770000001", body="Hello", attachment_path=None):
+        success, message_id = self.outbox.enqueue(recipient, body, attachment_path=attachment_path)
+        self.assertTrue(success, message_id)
+        return message_id
+
+    def send_due(self):
+        """One dispatcher round, on this thread: claim what is due and send it"""
+        batch = self.outbox.claim_due()
+        self.outbox.send_batch(batch)
+        return [message.id for message in batch]
+
+    def make_due(self):
+        """Skip the backoff wait of every pending message"""
+        with transaction(self.db_name) as conn:
+            conn.execute("UPDATE message_outbox SET next_attempt_at = 0 WHERE status = 'pending'")
+
+    def row(self, message_id):
+        with connection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT status, attempts, next_attempt_at, last_error
+                FROM message_outbox WHERE id = ?
+            """, (message_id,))
+            status, attempts, next_attempt_at, last_error = cursor.fetchone()
+        return {'status': status, 'attempts': attempts, 'delay': next_attempt_at - time.time(),
+                'last_error': last_error or ""}
+
+    def write_pdf(self):
+        path = os.path.join(self.workdir, "bill_1.pdf")
+        with open(path, 'wb') as f:
+            f.write(b"%PDF-1.4\n" + b"0" * 2048)
+        return path
+
+    # ---- responses ----
+
+    def test_delivered_message_is_marked_sent(self):
+        message_id = self.enqueue(body="Invoice #1")
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'sent')
+        self.assertEqual(row['attempts'], 1)
+        self.assertEqual(self.server.messages, [{
+            'messaging_product': 'whatsapp', 'to': '94770000001', 'type': 'text',
+            'text': {'body': 'Invoice #1'}
+        }])
+
+    def test_rate_limit_is_retried_after_retry_after(self):
+        self.server.script.append((429, {'Retry-After': '120'}))
+        message_id = self.enqueue()
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertEqual(row['attempts'], 1)
+        self.assertIn("429", row['last_error'])
+        self.assertGreater(row['delay'], 115)  # Server's wait beats the 30 s first backoff
+        self.assertEqual(self.outbox.counters['retried'], 1)
+
+    def test_server_error_is_retried_with_backoff(self):
+        self.server.script.append(503)
+        message_id = self.enqueue()
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertEqual(row['attempts'], 1)
+        self.assertIn("503", row['last_error'])
+        self.assertGreater(row['delay'], BACKOFF_BASE_SECONDS * 0.8 - 5)
+        self.assertLess(row['delay'], BACKOFF_BASE_SECONDS * 1.2 + 1)
+
+        # Not due again until the backoff has passed; then it goes through
+        self.assertEqual(self.send_due(), [])
+        self.make_due()
+        self.send_due()
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'sent')
+        self.assertEqual(row['attempts'], 2)
+
+    def test_client_error_is_dead_lettered(self):
+        self.server.script.append(400)
+        message_id = self.enqueue()
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'dead')
+        self.assertEqual(row['attempts'], 1)
+        self.assertIn("400", row['last_error'])
+        self.assertEqual(self.outbox.counters['dead_lettered'], 1)
+        self.assertEqual(self.server.messages, [])
+
+    def test_repeated_server_errors_are_dead_lettered(self):
+        self.server.script.extend([500] * MAX_ATTEMPTS)
+        message_id = self.enqueue()
+        for _ in range(MAX_ATTEMPTS):
+            self.send_due()
+            self.make_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'dead')
+        self.assertEqual(row['attempts'], MAX_ATTEMPTS)
+        self.assertEqual(self.server.requests, MAX_ATTEMPTS)
+        self.assertEqual(self.outbox.counters['retried'], MAX_ATTEMPTS - 1)
+        self.assertEqual(self.send_due(), [])  # Dead messages are never claimed
+
+    # ---- connections ----
+
+    def closed_port(self):
+        """A local port nothing listens on"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def test_refused_connection_is_retried_once_at_once(self):
+        refused = None
+        try:
+            self.transport.requests.post(f"http://127.0.0.1:{self.closed_port()}/", timeout=5)
+        except self.transport.requests.ConnectionError as e:
+            refused = e
+        real_post = self.transport.session.post
+        calls = []
+
+        def post(url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                raise refused  # Failed while connecting: nothing was sent
+            return real_post(url, **kwargs)
+
+        message_id = self.enqueue()
+        with mock.patch.object(self.transport.session, 'post', side_effect=post):
+            self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'sent')
+        self.assertEqual(row['attempts'], 1)  # The reconnect is not an outbox retry
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_unreachable_server_is_a_retry(self):
+        from message_transports import HttpTransport
+
+        transport = HttpTransport(f"http://127.0.0.1:{self.closed_port()}/v19.0", "123456", "test-key", timeout=5)
+        self.outbox.transport = transport
+        message_id = self.enqueue()
+        try:
+            self.send_due()
+        finally:
+            transport.close()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertEqual(row['attempts'], 1)
+        self.assertIn("unreachable", row['last_error'])
+
+    def test_connection_dropped_after_sending_is_not_resent_at_once(self):
+        self.server.script.append(DROP_CONNECTION)
+        message_id = self.enqueue()
+        self.send_due()
+
+        # The request reached the server, so only the outbox may retry it, after a backoff
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertEqual(row['attempts'], 1)
+        self.assertIn("unreachable", row['last_error'])
+        self.assertEqual(self.server.requests, 1)
+
+        self.make_due()
+        self.send_due()
+        self.assertEqual(self.row(message_id)['status'], 'sent')
+        self.assertEqual(self.server.requests, 2)
+
+    # ---- attachments ----
+
+    def test_attachment_is_uploaded_and_sent_as_document(self):
+        message_id = self.enqueue(body="Invoice #7", attachment_path=self.write_pdf())
+        self.send_due()
+
+        self.assertEqual(self.row(message_id)['status'], 'sent')
+        self.assertEqual([path.rsplit("/", 1)[-1] for path in self.server.paths], ['media', 'messages'])
+        document = self.server.messages[0]['document']
+        self.assertEqual(document['id'], 'media-1')
+        self.assertEqual(document['filename'], 'bill_1.pdf')
+        self.assertEqual(document['caption'], 'Invoice #7')
+
+    def test_long_text_is_not_repeated_when_the_document_is_retried(self):
+        body = "Invoice #8\n" + "x" * 1100  # Too long for a caption
+        self.server.script.extend([None, 503])  # Text goes out, the upload fails
+        message_id = self.enqueue(body=body, attachment_path=self.write_pdf())
+        self.send_due()
+
+        self.assertEqual(self.row(message_id)['status'], 'pending')
+        self.make_due()
+        self.send_due()
+
+        self.assertEqual(self.row(message_id)['status'], 'sent')
+        self.assertEqual([m['type'] for m in self.server.messages], ['text', 'document'])
+        self.assertEqual(self.server.messages[0]['text']['body'], body)
+        self.assertNotIn('caption', self.server.messages[1]['document'])
+        self.assertEqual(self.transport.text_sent, set())
+
+    def test_failed_media_upload_is_retried(self):
+        self.server.script.append(500)
+        message_id = self.enqueue(attachment_path=self.write_pdf())
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertIn("500", row['last_error'])
+        self.assertEqual(self.server.paths, ["/v19.0/123456/media"])  # No message without its PDF
+
+        self.make_due()
+        self.send_due()
+        self.assertEqual(self.row(message_id)['status'], 'sent')
+        self.assertEqual(self.server.messages[0]['type'], 'document')
+
+    def test_media_upload_without_id_is_retried(self):
+        self.server.script.append((200, {}, {'unexpected': True}))
+        message_id = self.enqueue(attachment_path=self.write_pdf())
+        self.send_due()
+
+        row = self.row(message_id)
+        self.assertEqual(row['status'], 'pending')
+        self.assertIn("Unexpected media upload response", row['last_error'])
+        self.assertEqual(self.server.messages, [])
+
+    def test_rejected_media_upload_is_dead_lettered(self):
+        self.server.script.append(413)
+        message_id = self.enqueue(attachment_path=self.write_pdf())
+        self.send_due()
+
+        self.assertEqual(self.row(message_id)['status'], 'dead')
+        self.assertEqual(self.server.messages, [])
+
+    # ---- ordering ----
+
+    def test_failed_message_holds_back_its_recipient_only(self):
+        first = self.enqueue("+94770000001", "A1")
+        second = self.enqueue("+94770000001", "A2")
+        other = self.enqueue("+94770000002", "B1")
+        self.server.script.append(503)  # A1 is sent first and fails
+
+        self.assertEqual(self.send_due(), [first, other])
+        self.assertEqual(self.row(first)['status'], 'pending')
+        self.assertEqual(self.row(other)['status'], 'sent')
+
+        # A2 waits behind A1's backoff
+        self.assertEqual(self.send_due(), [])
+        self.assertEqual(self.row(second)['attempts'], 0)
+
+        self.make_due()
+        self.assertEqual(self.send_due(), [first])
+        self.assertEqual(self.send_due(), [second])
+        bodies = [m['text']['body'] for m in self.server.messages]
+        self.assertEqual(bodies, ["B1", "A1", "A2"])
+
+    def test_send_cut_off_by_closing_is_resent_on_start(self):
+        first = self.enqueue("+94770000001", "A1")
+        second = self.enqueue("+94770000001", "A2")
+        self.assertEqual([m.id for m in self.outbox.claim_due()], [first])  # App closed mid-send
+
+        self.outbox.start(self.transport, rate_per_minute=1_000_000, burst=1000)
+        deadline = time.time() + 10
+        while time.time() < deadline and self.outbox.metrics()['sent'] < 2:
+            time.sleep(0.02)
+        self.outbox.stop()
+
+        self.assertEqual(self.row(first)['status'], 'sent')
+        self.assertEqual(self.row(second)['status'], 'sent')
+        self.assertEqual([m['text']['body'] for m in self.server.messages], ["A1", "A2"])
+
+    def test_dispatcher_keeps_each_recipients_order(self):
+        recipients = [f"+9477000000{r}" for r in range(4)]
+        for i in range(5):
+            for recipient in recipients:
+                self.enqueue(recipient, f"{recipient}:{i}")
+        self.server.script.extend([503, 500, (429, {'Retry-After': '0'})])
+
+        with mock.patch.object(message_outbox, 'BACKOFF_BASE_SECONDS', 0.05):
+            self.outbox.start(self.transport, rate_per_minute=1_000_000, burst=1000)
+            deadline = time.time() + 15
+            while time.time() < deadline:
+                metrics = self.outbox.metrics()
+                if not metrics['pending'] and not metrics['sending']:
+                    break
+                time.sleep(0.02)
+            self.outbox.stop()
+
+        metrics = self.outbox.metrics()
+        self.assertEqual((metrics['pending'], metrics['sending'], metrics['dead']), (0, 0, 0))
+        self.assertEqual(metrics['retried'], 3)
+        self.assertEqual(metrics['sent'], 20)
+        for recipient in recipients:
+            to = recipient.lstrip('+')
+            bodies = [m['text']['body'] for m in self.server.messages if m['to'] == to]
+            self.assertEqual(bodies, [f"{recipient}:{i}" for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,8 +5,9 @@ Modern, consistent UI elements built with CustomTkinter.
 
 import customtkinter as ctk
 from tkinter import messagebox
-import time
-from threading import Thread
+from bisect import bisect_right
+
+from async_executor import get_background_executor
 
 
 class ModernButton(ctk.CTkButton):
@@ -33,6 +34,8 @@ class ModernButton(ctk.CTkButton):
 class ToastNotification:
     """Toast notification system for user feedback."""
     
+    active = []  # Visible toasts, stacked top-down
+    
     @staticmethod
     def show(parent, message, duration=3000, type="info"):
         """
@@ -79,19 +82,22 @@ class ToastNotification:
         )
         label.pack(padx=20, pady=10)
         
-        # Position at top center
-        toast.place(relx=0.5, rely=0.05, anchor="n")
+        # Position at top center, below any toasts still showing
+        slot = len(ToastNotification.active)
+        ToastNotification.active.append(toast)
+        toast.place(relx=0.5, rely=0.05 + 0.07 * slot, anchor="n")
         
-        # Auto-hide after duration
+        # Auto-hide after duration (on the Tk thread; widgets aren't thread-safe)
         def hide_toast():
-            time.sleep(duration / 1000)
+            if toast in ToastNotification.active:
+                ToastNotification.active.remove(toast)
             try:
                 toast.place_forget()
                 toast.destroy()
             except:
                 pass
         
-        Thread(target=hide_toast, daemon=True).start()
+        toast.after(duration, hide_toast)
         
         return toast
 
@@ -99,8 +105,9 @@ class ToastNotification:
 class LoadingSpinner:
     """Loading indicator widget."""
     
-    def __init__(self, parent, message="Loading..."):
+    def __init__(self, parent, message="Loading...", token=None):
         self.frame = ctk.CTkFrame(parent, fg_color="transparent")
+        self.token = token
         
         # Semi-transparent overlay
         self.overlay = ctk.CTkFrame(
@@ -117,9 +124,21 @@ class LoadingSpinner:
         )
         self.label.pack(padx=40, pady=30)
         
+        # A CancellationToken makes the operation cancellable
+        if token is not None:
+            ctk.CTkButton(
+                self.overlay,
+                text="Cancel",
+                command=self.cancel,
+                fg_color="#6c757d",
+                hover_color="#5a6268",
+                width=100
+            ).pack(pady=(0, 20))
+        
     def show(self):
         """Show loading indicator."""
         self.overlay.place(relx=0.5, rely=0.5, anchor="center")
+        self.overlay.lift()
         
     def hide(self):
         """Hide loading indicator."""
@@ -127,6 +146,47 @@ class LoadingSpinner:
             self.overlay.place_forget()
         except:
             pass
+    
+    def close(self):
+        """Remove the overlay for good."""
+        try:
+            self.overlay.destroy()
+        except:
+            pass
+    
+    def cancel(self):
+        """Cancel the running operation (its callbacks will not run)."""
+        if self.token is not None:
+            self.token.cancel()
+        self.close()
+    
+    def run(self, func, *args, on_success=None, on_error=None, timeout=None, process=False, **kwargs):
+        """
+        Show the overlay while func runs on the background executor.
+        
+        The overlay is removed when the task finishes or is cancelled (a
+        spinner runs one task). Callbacks run on the Tk thread afterwards;
+        see BackgroundExecutor.submit for timeout and process.
+        
+        Returns:
+            concurrent.futures.Future
+        """
+        def finish(callback):
+            def handler(value):
+                self.close()
+                if callback:
+                    callback(value)
+            return handler
+        
+        self.show()
+        executor = get_background_executor()
+        executor.attach(self.overlay._root())
+        return executor.submit(
+            func, *args,
+            on_success=finish(on_success),
+            on_error=finish(on_error or (lambda e: print(f"Background task failed: {e}"))),
+            token=self.token, timeout=timeout, process=process, **kwargs
+        )
 
 
 class ConfirmDialog:
@@ -322,6 +382,484 @@ class SearchBar(ctk.CTkFrame):
         return self.entry.get()
 
 
+class SearchController(SearchBar):
+    """
+    Search bar that debounces typing and runs the query off the Tk thread.
+    
+    query(term) runs on a background worker and must not touch widgets;
+    on_results(term, result) is called on the Tk thread. Each new term
+    supersedes the previous search: a superseded query that has not started
+    yet is skipped, and results that arrive after a newer search began are
+    dropped, so only the latest result set is ever applied.
+    """
+    
+    DEBOUNCE_MS = 250
+    
+    def __init__(self, master, query, on_results, on_error=None, debounce_ms=DEBOUNCE_MS, **kwargs):
+        super().__init__(master, search_callback=self.schedule, **kwargs)
+        
+        self.query = query
+        self.on_results = on_results
+        self.on_error = on_error
+        self.debounce_ms = debounce_ms
+        
+        self.generation = 0     # Bumped by every search; older results are stale
+        self.after_id = None    # Pending debounce timer
+        self.last_term = None   # Term of the latest search (cursor keys don't re-run it)
+        
+        self.executor = get_background_executor()
+        self.executor.attach(self._root())
+    
+    def schedule(self, term):
+        """Run a search for term once typing pauses for debounce_ms."""
+        if term == self.last_term:
+            return
+        self.last_term = term
+        self.generation += 1
+        self.cancel_pending()
+        generation = self.generation
+        self.after_id = self.after(self.debounce_ms, lambda: self.start(generation, term))
+    
+    def search_now(self):
+        """Search the current term immediately (initial load, filter change, refresh)."""
+        self.cancel_pending()
+        self.last_term = self.get()
+        self.generation += 1
+        self.start(self.generation, self.last_term)
+    
+    def cancel_pending(self):
+        """Forget a debounced search that has not started yet."""
+        if self.after_id is not None:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+    
+    def start(self, generation, term):
+        """Submit the query to a worker; only the latest generation is delivered."""
+        self.after_id = None
+        
+        def task():
+            if generation != self.generation:
+                return None  # Superseded while queued behind other work
+            return self.query(term)
+        
+        self.executor.submit(
+            task,
+            on_success=lambda result: self.deliver(generation, term, result),
+            on_error=lambda error: self.fail(generation, error)
+        )
+    
+    def deliver(self, generation, term, result):
+        if generation == self.generation and self.winfo_exists():
+            self.on_results(term, result)
+    
+    def fail(self, generation, error):
+        if generation != self.generation or not self.winfo_exists():
+            return
+        if self.on_error:
+            self.on_error(error)
+        else:
+            print(f"Search failed: {error}")
+    
+    def destroy(self):
+        self.cancel_pending()
+        self.generation += 1  # Drop anything still in flight
+        super().destroy()
+
+
+class VirtualScrollFrame(ctk.CTkFrame):
+    """
+    Scrollable list that only materializes the rows in view.
+    
+    Rows are (kind, data) pairs. Each kind has a fixed height and a small
+    pool of fixed-height row frames, filled once by create_row(row, kind)
+    and updated by bind_row(row, kind, data) as they scroll into view, so
+    the widget count stays proportional to the window size, not the list
+    length. Callbacks may keep references to child widgets as attributes
+    of the row frame.
+    
+    on_scroll_end(), if given, is called (from idle time) whenever the last
+    row comes into view, e.g. to append the next page with append_rows().
+    """
+    
+    SCROLL_UNITS = 40  # Pixels per wheel notch / arrow click
+    WHEEL_EVENTS = ("<MouseWheel>", "<Button-4>", "<Button-5>")
+    
+    live_lists = set()  # Lists the shared wheel handler dispatches to (removed on destroy)
+    
+    def __init__(self, master, row_heights, create_row, bind_row, on_scroll_end=None, **kwargs):
+        super().__init__(master, **kwargs)
+        
+        self.row_heights = row_heights
+        self.create_row = create_row
+        self.bind_row = bind_row
+        self.on_scroll_end = on_scroll_end
+        self.scroll_end_pending = False
+        
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent")
+        self.viewport.pack(side="left", fill="both", expand=True)
+        
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        self.rows = []
+        self.offsets = []         # Top edge of each row (unscaled pixels)
+        self.total_height = 0
+        self.top = 0              # Current scroll position (unscaled pixels)
+        self.generation = 0       # Bumped by set_rows()/refresh() to force rebinding
+        
+        self.pool = {kind: [] for kind in row_heights}  # Every widget built, per kind
+        self.bound = {}           # widget -> (generation, row index) it currently shows
+        
+        self.viewport.bind("<Configure>", lambda e: self.render())
+        
+        # Rows are created and recycled while scrolling, so the wheel is caught
+        # app-wide; one binding per application serves every list
+        root = self._root()
+        if not getattr(root, "virtual_wheel_bound", False):
+            for sequence in self.WHEEL_EVENTS:
+                root.bind_all(sequence, VirtualScrollFrame.dispatch_mousewheel, add="+")
+            root.virtual_wheel_bound = True
+        VirtualScrollFrame.live_lists.add(self)
+    
+    @staticmethod
+    def dispatch_mousewheel(event):
+        """App-wide wheel handler: pass the event to the list under the pointer."""
+        for scroll_frame in list(VirtualScrollFrame.live_lists):
+            scroll_frame.on_mousewheel(event)
+    
+    def destroy(self):
+        VirtualScrollFrame.live_lists.discard(self)
+        super().destroy()
+    
+    def set_rows(self, rows, keep_position=False):
+        """Replace the list contents."""
+        self.rows = list(rows)
+        self.offsets = []
+        y = 0
+        for kind, _ in self.rows:
+            self.offsets.append(y)
+            y += self.row_heights[kind]
+        self.total_height = y
+        if not keep_position:
+            self.top = 0
+        self.refresh()
+    
+    def append_rows(self, rows):
+        """Add rows at the end, keeping the scroll position and bound widgets."""
+        y = self.total_height
+        for kind, data in rows:
+            self.rows.append((kind, data))
+            self.offsets.append(y)
+            y += self.row_heights[kind]
+        self.total_height = y
+        self.render()
+    
+    def refresh(self):
+        """Re-bind the visible rows (after their data changed)."""
+        self.generation += 1
+        self.render()
+    
+    def scroll_to(self, top):
+        """Scroll so that `top` (unscaled pixels) is at the top of the view."""
+        self.top = top
+        self.render()
+    
+    def view_height(self):
+        """Viewport height in unscaled pixels."""
+        return self.viewport.winfo_height() / self._get_widget_scaling()
+    
+    def render(self):
+        """Place pooled widgets for the rows currently in view."""
+        height = self.view_height()
+        self.top = max(0, min(self.top, self.total_height - height))
+        
+        # Every widget is free until claimed by a visible row
+        free = {kind: list(widgets) for kind, widgets in self.pool.items()}
+        placed = []
+        
+        index = max(0, bisect_right(self.offsets, self.top) - 1)
+        while index < len(self.rows) and self.offsets[index] < self.top + height:
+            kind, data = self.rows[index]
+            key = (self.generation, index)
+            
+            # Prefer the widget already showing this row, so it needs no rebind
+            widget = next((w for w in free[kind] if self.bound.get(w) == key), None)
+            if widget is not None:
+                free[kind].remove(widget)
+            elif free[kind]:
+                widget = free[kind].pop()
+            else:
+                widget = ctk.CTkFrame(self.viewport, height=self.row_heights[kind],
+                                      fg_color="transparent")
+                widget.pack_propagate(False)
+                self.create_row(widget, kind)
+                self.pool[kind].append(widget)
+            
+            if self.bound.get(widget) != key:
+                self.bind_row(widget, kind, data)
+                self.bound[widget] = key
+            placed.append((widget, self.offsets[index] - self.top))
+            index += 1
+        
+        for widgets in free.values():
+            for widget in widgets:
+                widget.place_forget()
+                self.bound.pop(widget, None)
+        for widget, y in placed:
+            widget.place(x=0, y=y, relwidth=1.0)
+        
+        if self.total_height > 0:
+            self.scrollbar.set(self.top / self.total_height,
+                               min(1.0, (self.top + height) / self.total_height))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        
+        if self.on_scroll_end and index >= len(self.rows) and not self.scroll_end_pending:
+            self.scroll_end_pending = True
+            self.after_idle(self.fire_scroll_end)
+    
+    def fire_scroll_end(self):
+        """Run on_scroll_end outside of render()."""
+        self.scroll_end_pending = False
+        self.on_scroll_end()
+    
+    def on_scrollbar(self, action, *args):
+        """Handle scrollbar drag ('moveto') and step ('scroll') commands."""
+        if action == "moveto":
+            self.top = float(args[0]) * self.total_height
+        elif action == "scroll":
+            amount, unit = float(args[0]), args[1]
+            step = self.view_height() if unit == "pages" else self.SCROLL_UNITS
+            self.top += amount * step
+        self.render()
+    
+    def on_mousewheel(self, event):
+        """Scroll when the wheel is used over this list."""
+        # The viewport itself or a widget inside it (not a sibling like .!canvas2)
+        path, viewport = str(event.widget), str(self.viewport)
+        if path != viewport and not path.startswith(viewport + "."):
+            return
+        if event.num == 4 or event.delta > 0:
+            self.top -= self.SCROLL_UNITS
+        else:
+            self.top += self.SCROLL_UNITS
+        self.render()
+
+
+class TableColumn:
+    """
+    One VirtualTable column.
+    
+    value is an index into the row tuple or a function of the row; fmt turns
+    the value into display text. Columns with a sort_key can be sorted by
+    clicking the header (the provider decides what the key means).
+    """
+    
+    def __init__(self, title, width, value, fmt=None, sort_key=None, anchor="center", text_color=None):
+        self.title = title
+        self.width = width
+        self.value = value
+        self.fmt = fmt
+        self.sort_key = sort_key
+        self.anchor = anchor
+        self.text_color = text_color
+    
+    def get(self, row):
+        """Raw value of this column for a row."""
+        return self.value(row) if callable(self.value) else row[self.value]
+    
+    def text(self, row):
+        """Display text of this column for a row."""
+        value = self.get(row)
+        if self.fmt:
+            return self.fmt(value)
+        return "N/A" if value is None else str(value)
+
+
+class ListRowProvider:
+    """Row provider over rows already in memory; sorts in memory."""
+    
+    def __init__(self, rows):
+        self.rows = list(rows)
+    
+    def fetch(self, after, sort):
+        """Return (rows, next_key) - everything in one page."""
+        rows = self.rows
+        if sort:
+            column, descending = sort
+            rows = sorted(rows, key=lambda r: (column.get(r) is None, column.get(r)), reverse=descending)
+        return rows, None
+
+
+class PagedRowProvider:
+    """
+    Row provider over a keyset-paginated query.
+    
+    fetch_page(after, order) must return (rows, next_key), where order is
+    None (default order) or (column sort_key, descending).
+    """
+    
+    def __init__(self, fetch_page):
+        self.fetch_page = fetch_page
+    
+    def fetch(self, after, sort):
+        """Return the page after `after` under the given sort."""
+        order = (sort[0].sort_key, sort[1]) if sort else None
+        return self.fetch_page(after, order)
+
+
+class VirtualTable(ctk.CTkFrame):
+    """
+    Table with a sortable header, backed by a row provider.
+    
+    Only the visible rows have widgets (see VirtualScrollFrame); scrolling
+    near the end fetches the provider's next page. actions are
+    (text, width, callback(row), fg_color, hover_color) buttons shown on
+    every row; row_color(row) may return a background colour for the row.
+    """
+    
+    def __init__(self, master, columns, actions=(), row_height=40, row_color=None,
+                 on_select=None, empty_text="No records found", **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        
+        self.columns = columns
+        self.actions = actions
+        self.row_color = row_color
+        self.on_select = on_select
+        
+        self.provider = None
+        self.sort = None          # (column, descending) or None for the provider's default
+        self.next_key = None      # Key for the next page, None when everything is loaded
+        self.loading = False
+        self.row_count = 0
+        
+        # Header
+        self.header = ctk.CTkFrame(self, fg_color="#2b2b2b")
+        self.header.pack(fill="x", pady=(0, 5))
+        self.header_widgets = []
+        for column in columns:
+            if column.sort_key is not None:
+                widget = ctk.CTkButton(
+                    self.header, text=column.title, width=column.width,
+                    font=("Roboto", 12, "bold"), fg_color="transparent",
+                    hover_color="#3b3b3b", command=lambda c=column: self.sort_by(c)
+                )
+            else:
+                widget = ctk.CTkLabel(self.header, text=column.title, width=column.width,
+                                      font=("Roboto", 12, "bold"))
+            widget.pack(side="left", padx=5, pady=5)
+            self.header_widgets.append(widget)
+        if actions:
+            actions_width = sum(action[1] + 4 for action in actions)
+            ctk.CTkLabel(self.header, text="Actions", width=actions_width,
+                         font=("Roboto", 12, "bold")).pack(side="left", padx=5, pady=5)
+        
+        # Body
+        self.body = VirtualScrollFrame(
+            self, {"row": row_height}, self.create_row, self.bind_row,
+            on_scroll_end=self.load_more, fg_color="transparent"
+        )
+        self.body.pack(fill="both", expand=True)
+        
+        self.empty_label = ctk.CTkLabel(self.body.viewport, text=empty_text, font=("Roboto", 14))
+    
+    @property
+    def order(self):
+        """Current sort as (column sort_key, descending), or None - what providers are asked for."""
+        return (self.sort[0].sort_key, self.sort[1]) if self.sort else None
+    
+    def set_provider(self, provider, first_page=None):
+        """
+        Show a new provider's rows (keeps the current sort).
+        
+        first_page may be (rows, next_key) already fetched for the current
+        order (e.g. on a worker thread) to skip the first fetch.
+        """
+        self.provider = provider
+        self.reload(first_page)
+    
+    def reload(self, first_page=None):
+        """Fetch the first page again (after a filter, sort or data change)."""
+        if self.provider is None:
+            return
+        if first_page is not None:
+            rows, self.next_key = first_page
+        else:
+            self.loading = True
+            try:
+                rows, self.next_key = self.provider.fetch(None, self.sort)
+            finally:
+                self.loading = False
+        self.row_count = len(rows)
+        self.body.set_rows([("row", row) for row in rows])
+        
+        if rows:
+            self.empty_label.place_forget()
+        else:
+            self.empty_label.place(relx=0.5, y=20, anchor="n")
+    
+    def load_more(self):
+        """Append the next page, if any (called when the last row is in view)."""
+        if self.next_key is None or self.loading or self.provider is None:
+            return
+        self.loading = True
+        try:
+            rows, self.next_key = self.provider.fetch(self.next_key, self.sort)
+        except Exception as e:
+            self.next_key = None
+            print(f"Error loading more rows: {e}")
+            return
+        finally:
+            self.loading = False
+        self.row_count += len(rows)
+        self.body.append_rows([("row", row) for row in rows])
+    
+    def sort_by(self, column):
+        """Sort by column; clicking the same column again reverses the order."""
+        descending = bool(self.sort and self.sort[0] is column and not self.sort[1])
+        self.sort = (column, descending)
+        for col, widget in zip(self.columns, self.header_widgets):
+            arrow = (" ▼" if descending else " ▲") if col is column else ""
+            widget.configure(text=col.title + arrow)
+        self.reload()
+    
+    def create_row(self, frame, kind):
+        """Build the widgets of one pooled row (once)."""
+        frame.inner = ctk.CTkFrame(frame)
+        frame.inner.pack(fill="both", expand=True, pady=2)
+        frame.default_color = frame.inner.cget("fg_color")
+        
+        frame.cells = []
+        for column in self.columns:
+            label = ctk.CTkLabel(frame.inner, text="", width=column.width, anchor=column.anchor)
+            if column.text_color:
+                label.configure(text_color=column.text_color)
+            label.pack(side="left", padx=5)
+            if self.on_select:
+                label.bind("<Button-1>", lambda e, f=frame: self.on_select(f.row))
+            frame.cells.append(label)
+        
+        frame.buttons = []
+        if self.actions:
+            actions_frame = ctk.CTkFrame(frame.inner, fg_color="transparent")
+            actions_frame.pack(side="left", padx=5)
+            for text, width, callback, fg_color, hover_color in self.actions:
+                button = ctk.CTkButton(actions_frame, text=text, width=width,
+                                       fg_color=fg_color, hover_color=hover_color)
+                button.pack(side="left", padx=2)
+                frame.buttons.append((button, callback))
+    
+    def bind_row(self, frame, kind, row):
+        """Show `row` in a pooled row frame."""
+        frame.row = row
+        for column, label in zip(self.columns, frame.cells):
+            label.configure(text=column.text(row))
+        for button, callback in frame.buttons:
+            button.configure(command=lambda r=row, cb=callback: cb(r))
+        color = self.row_color(row) if self.row_color else None
+        frame.inner.configure(fg_color=color or frame.default_color)
+
+
 class ProgressBar(ctk.CTkFrame):
     """Animated progress bar."""
     
@@ -404,3 +942,4 @@ def create_card(parent, title=None, **kwargs):
         title_label.pack(pady=(10, 5), padx=10, anchor="w")
     
     return card
+
@@ -1,19 +1,19 @@
 """
 WhatsApp Invoice Service for BuildSmartOS
-Sends invoices via WhatsApp using pywhatkit
+Formats invoices and alerts and queues them in the message outbox
 """
-import pywhatkit as kit
 import json
-import os
-import threading
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from message_outbox import get_message_outbox
+from message_transports import create_transport
 
 class WhatsAppService:
     def __init__(self):
         self.config = self.load_config()
         self.country_code = self.config.get("whatsapp", {}).get("country_code", "+94")
-        self.send_delay = self.config.get("whatsapp", {}).get("send_delay_seconds", 15)
         self.enabled = self.config.get("features", {}).get("whatsapp_enabled", True)
+        self.outbox = get_message_outbox()
     
     def load_config(self):
         """Load configuration"""
@@ -43,83 +43,45 @@ class WhatsAppService:
         
         return phone
     
-    def send_invoice(self, phone_number, transaction_id, total_amount, items_list, pdf_path=None):
-        """Send invoice via WhatsApp"""
+    def queue_message(self, phone_number, message, kind, attachment_path=None, dedupe_key=None):
+        """Validate the number and queue the message in the outbox"""
         if not self.enabled:
             return False, "WhatsApp service is disabled"
         
+        # Validate phone number
+        if not phone_number:
+            return False, "Phone number is required"
+        
+        formatted_phone = self.format_phone_number(phone_number)
+        
+        # Validate formatted number
+        if not formatted_phone or len(formatted_phone) < 10:
+            return False, f"Invalid phone number format: {phone_number}"
+        
+        success, result = self.outbox.enqueue(formatted_phone, message, kind, attachment_path, dedupe_key)
+        if not success:
+            return False, result
+        return True, formatted_phone
+    
+    def send_invoice(self, phone_number, transaction_id, total_amount, items_list, pdf_path=None):
+        """Queue an invoice; the outbox dispatcher delivers it (retrying if needed)"""
         try:
-            # Validate phone number
-            if not phone_number:
-                return False, "Phone number is required"
-            
-            # Format phone number
-            formatted_phone = self.format_phone_number(phone_number)
-            
-            # Validate formatted number
-            if not formatted_phone or len(formatted_phone) < 10:
-                return False, f"Invalid phone number format: {phone_number}"
-            
-            # Create message
             business_name = self.config.get("business", {}).get("name", "BuildSmart Hardware")
             message = self.create_invoice_message(business_name, transaction_id, total_amount, items_list)
-            
-            # Calculate send time (current time + delay)
-            now = datetime.now()
-            send_time = now + timedelta(seconds=self.send_delay)
-            hour = send_time.hour
-            minute = send_time.minute
-            
-            # Validate time (pywhatkit requires future time)
-            if send_time <= now:
-                send_time = now + timedelta(seconds=20)
-                hour = send_time.hour
-                minute = send_time.minute
-            
-            # Send message with error handling
-            try:
-                kit.sendwhatmsg(formatted_phone, message, hour, minute, wait_time=15, tab_close=True, close_time=3)
-                return True, f"Invoice sent via WhatsApp to {formatted_phone}"
-            except Exception as send_error:
-                # Log the specific sending error
-                error_msg = str(send_error)
-                if "web.whatsapp.com" in error_msg.lower():
-                    return False, "WhatsApp Web not accessible. Please ensure browser is open and WhatsApp Web is logged in."
-                elif "internet" in error_msg.lower():
-                    return False, "Internet connection issue. Please check your connection."
-                else:
-                    return False, f"WhatsApp send error: {error_msg}"
-            
+            success, result = self.queue_message(phone_number, message, "invoice", pdf_path,
+                                                 dedupe_key=f"invoice:{transaction_id}")
+            if not success:
+                return False, result
+            return True, f"Invoice queued for WhatsApp to {result}"
         except Exception as e:
             return False, f"WhatsApp service error: {str(e)}"
     
     def send_invoice_async(self, phone_number, transaction_id, total_amount, items_list, pdf_path=None, callback=None):
-        """Send invoice via WhatsApp asynchronously in background thread"""
-        def send_in_background():
-            import time
-            retry_count = 0
-            max_retries = 2
-            
-            while retry_count <= max_retries:
-                try:
-                    success, message = self.send_invoice(phone_number, transaction_id, total_amount, items_list, pdf_path)
-                    if callback:
-                        callback(success, message)
-                    return
-                except Exception as e:
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        time.sleep(5)  # Wait 5 seconds before retry
-                        continue
-                    else:
-                        if callback:
-                            callback(False, f"WhatsApp send failed after {max_retries} retries: {str(e)}")
-        
-        # Start background thread
-        thread = threading.Thread(target=send_in_background, daemon=True)
-        thread.start()
-        
-        return True, "WhatsApp invoice is being sent in background..."
+        """Queue an invoice without waiting for delivery (kept for older callers)"""
+        success, message = self.send_invoice(phone_number, transaction_id, total_amount, items_list, pdf_path)
+        if callback:
+            callback(success, message)
+        return success, message
     
     def create_invoice_message(self, business_name, transaction_id, total_amount, items_list):
         """Create formatted invoice message"""
@@ -143,47 +105,29 @@ class WhatsAppService:
         return message
     
     def send_low_stock_alert(self, phone_number, product_name, current_stock):
-        """Send low stock alert"""
-        if not self.enabled:
-            return False, "WhatsApp service is disabled"
-        
+        """Queue a low stock alert"""
         try:
-            # Validate phone number
-            if not phone_number:
-                return False, "Phone number is required"
-            
-            formatted_phone = self.format_phone_number(phone_number)
-            
-            # Validate formatted number
-            if not formatted_phone or len(formatted_phone) < 10:
-                return False, f"Invalid phone number format: {phone_number}"
-            
             message = f"⚠️ *LOW STOCK ALERT*\n\n"
             message += f"Product: *{product_name}*\n"
             message += f"Current Stock: *{current_stock}*\n\n"
             message += f"Please reorder soon!\n"
             message += f"_BuildSmart OS Alert System_"
             
-            now = datetime.now()
-            send_time = now + timedelta(seconds=self.send_delay)
-            
-            # Validate time
-            if send_time <= now:
-                send_time = now + timedelta(seconds=20)
-            
-            try:
-                kit.sendwhatmsg(formatted_phone, message, send_time.hour, send_time.minute, 
-                              wait_time=15, tab_close=True, close_time=3)
-                return True, "Low stock alert sent"
-            except Exception as send_error:
-                error_msg = str(send_error)
-                if "web.whatsapp.com" in error_msg.lower():
-                    return False, "WhatsApp Web not accessible for alert"
-                else:
-                    return False, f"Alert send failed: {error_msg}"
-            
+            success, result = self.queue_message(phone_number, message, "alert")
+            return (True, "Low stock alert queued") if success else (False, result)
         except Exception as e:
             return False, f"Alert service error: {str(e)}"
+    
+    def start_dispatcher(self):
+        """Start delivering queued messages with the configured transport"""
+        if not self.enabled:
+            return False, "WhatsApp service is disabled"
+        try:
+            transport = create_transport(self.config)
+        except (ImportError, ValueError) as e:
+            return False, f"WhatsApp transport unavailable ({e}); messages stay queued"
+        self.outbox.start(transport, self.config.get("whatsapp", {}).get("rate_per_minute"))
+        return True, f"WhatsApp dispatcher running ({transport.name})"
 
 # Global instance
 _whatsapp_service = None